@@ -0,0 +1,78 @@
+"""Compare the whole-paragraph markdown cleaner with the run-by-run implementation
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_markdown --paragraphs 10000
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.legacy_markdown import clean_markdown_paragraph as legacy_clean
+from services.markdown_cleaner import clean_paragraph
+
+LEFTOVER_MARKERS = ("**", "~~", "`")
+
+
+def build_document(paragraphs: int) -> Document:
+    """A document shaped like LLM output: mostly prose, some markdown, markers split across runs"""
+    doc = Document()
+    for i in range(paragraphs):
+        kind = i % 10
+        if kind == 0:
+            doc.add_paragraph(f"## **Section {i}**")
+        elif kind == 1:
+            p = doc.add_paragraph("The ")
+            p.add_run("**")
+            p.add_run(f"key point {i}")
+            p.add_run("**")
+            p.add_run(" is split across runs.")
+        elif kind == 2:
+            doc.add_paragraph(f"Inline **bold**, *italic*, ~~gone~~ and `code` in line {i}.")
+        elif kind == 3:
+            doc.add_paragraph("---")
+        else:
+            p = doc.add_paragraph(f"Plain prose sentence number {i} without any markup at all, ")
+            p.add_run("continued in a second run.")
+    return doc
+
+
+def run_cleaner(clean, template: Document) -> dict:
+    doc = copy.deepcopy(template)
+    paragraphs = list(doc.paragraphs)
+    start = time.perf_counter()
+    for paragraph in paragraphs:
+        clean(paragraph)
+    elapsed = time.perf_counter() - start
+    leftovers = sum(
+        1 for paragraph in doc.paragraphs
+        if any(marker in paragraph.text for marker in LEFTOVER_MARKERS)
+    )
+    return {"seconds": round(elapsed, 4), "paragraphs_with_leftover_markers": leftovers}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    template = build_document(args.paragraphs)
+    results = {"paragraphs": args.paragraphs}
+    for name, clean in [("legacy", legacy_clean), ("compiled", clean_paragraph)]:
+        runs = [run_cleaner(clean, template) for _ in range(args.repeat)]
+        best = min(runs, key=lambda result: result["seconds"])
+        results[name] = best
+    results["speedup"] = round(results["legacy"]["seconds"] / max(results["compiled"]["seconds"], 1e-9), 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
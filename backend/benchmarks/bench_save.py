@@ -0,0 +1,96 @@
+"""Compare doc.save with the pass-through package writer on image-heavy documents
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_save --images 5 20 --image-size 2
+
+Each document is a generated bench_stages document of 1000 paragraphs with
+``images`` pictures of ``image-size`` MB of incompressible data added. The
+document is formatted with bench_stages' options before every save, and
+both writers must produce the same members with the same contents.
+"""
+import argparse
+import copy
+import io
+import json
+import random
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_stages import CACHE_DIR, OPTIONS, document_for_scale
+from services.document_processor import DocumentProcessor
+from services.package_writer import save_document
+
+
+def _png(rng: random.Random, size: int) -> bytes:
+    """A 1x1 PNG padded with ``size`` random bytes, which deflate cannot shrink"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+            + chunk(b"prVt", rng.randbytes(size)) + chunk(b"IDAT", zlib.compress(b"\x00\x00"))
+            + chunk(b"IEND", b""))
+
+
+def document_with_images(images: int, image_size: int) -> Path:
+    path = CACHE_DIR / f"images_{images}x{image_size}mb.docx"
+    if not path.exists():
+        rng = random.Random(images)
+        doc = Document(str(document_for_scale(1000)))
+        for _ in range(images):
+            doc.add_picture(io.BytesIO(_png(rng, image_size * 1024 * 1024)))
+        doc.save(str(path))
+    return path
+
+
+def _contents(path: Path) -> list:
+    with zipfile.ZipFile(path) as package:
+        return [(info.filename, package.read(info)) for info in package.infolist()]
+
+
+def benchmark(processor, images: int, image_size: int, repeat: int) -> dict:
+    source = document_with_images(images, image_size)
+    doc = Document(str(source))
+    processor.engine.apply(doc, processor.engine.compile(OPTIONS))
+    result = {"images": images, "image_mb": image_size, "bytes": source.stat().st_size}
+
+    writers = {
+        "doc_save": lambda target: copy.deepcopy(doc).save(str(target)),
+        "pass_through": lambda target: save_document(copy.deepcopy(doc), str(target), str(source)),
+    }
+    outputs = {}
+    for name, write in writers.items():
+        target = CACHE_DIR / f"save_{name}.docx"
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            write(target)
+            samples.append(time.perf_counter() - start)
+        outputs[name] = _contents(target)
+        result[name] = round(min(samples), 4)
+    result["identical"] = outputs["doc_save"] == outputs["pass_through"]
+    result["speedup"] = round(result["doc_save"] / max(result["pass_through"], 1e-9), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--image-size", type=int, default=2, help="MB per image")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(upload_dir=str(CACHE_DIR / "uploads"))
+    results = [benchmark(processor, images, args.image_size, args.repeat) for images in args.images]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Time every DocumentProcessor stage on synthetic documents and write the results as JSON
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_stages --scales 100 1000 10000 --output results.json
+    python -m benchmarks.bench_stages --compare results.json
+
+Documents are generated from a fixed seed and kept in benchmarks/.cache, so
+the same scale always means the same document. Every stage runs on a fresh
+copy of the loaded document; copying is not part of the measured time.
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import docx
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.shared import Pt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models.formatting_options import (
+    FormattingOptions,
+    TextFormattingOptions,
+    ParagraphFormattingOptions,
+    PageFormattingOptions,
+    DocumentStructureOptions,
+    CleanupOptions,
+    FontFamily,
+    TextAlignment,
+    LineSpacing,
+    PageSize,
+    PageNumberPosition,
+)
+from services.document_processor import DocumentProcessor
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+DEFAULT_SCALES = [100, 1000, 10000, 100000]
+GENERATOR_VERSION = 1
+SECTION_EVERY = 500
+
+WORDS = (
+    "the quarterly report shows revenue growth across every region while operating "
+    "costs stayed flat and the team shipped three major releases ahead of schedule"
+).split()
+
+OPTIONS = FormattingOptions(
+    text=TextFormattingOptions(
+        font_family=FontFamily.GEORGIA,
+        font_size=11,
+        font_color="#333333",
+        line_spacing=LineSpacing.ONE_POINT_FIVE,
+        text_alignment=TextAlignment.JUSTIFY,
+    ),
+    paragraph=ParagraphFormattingOptions(
+        spacing_before=0,
+        spacing_after=6,
+        remove_extra_spaces=True,
+        remove_blank_lines=True,
+        keep_lines_together=True,
+    ),
+    page=PageFormattingOptions(
+        page_size=PageSize.A4,
+        margin_top=1,
+        margin_bottom=1,
+        margin_left=1.25,
+        margin_right=1.25,
+        header_text="Quarterly report",
+        page_numbers=True,
+        page_number_position=PageNumberPosition.BOTTOM_CENTER,
+    ),
+    structure=DocumentStructureOptions(
+        normalize_headings=True,
+        create_toc=True,
+        heading_font_family=FontFamily.ARIAL,
+        h1_size=18,
+        h2_size=14,
+    ),
+    cleanup=CleanupOptions(
+        remove_inconsistent_fonts=True,
+        clean_copied_text=True,
+        fix_alignment_issues=True,
+        normalize_formatting=True,
+    ),
+)
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _add_content(doc, rng: random.Random, first: int, last: int):
+    for i in range(first, last):
+        kind = i % 10
+        if kind == 0:
+            doc.add_paragraph(f"## **Section {i // 10}**" if i % 20 else f"# Part {i // 20}")
+        elif kind in (1, 6):
+            # Heavily fragmented, as copied or generated text tends to be
+            p = doc.add_paragraph()
+            for j in range(rng.randint(8, 16)):
+                run = p.add_run(rng.choice(WORDS) + " ")
+                run.bold = j % 3 == 0
+                run.italic = j % 4 == 0
+                if j % 5 == 0:
+                    run.font.size = Pt(rng.choice([10, 11, 12]))
+        elif kind == 3:
+            doc.add_paragraph(f"Some **bold** and *italic*  text with   extra spaces, item {i}.")
+        elif kind == 8:
+            doc.add_paragraph("")
+        else:
+            doc.add_paragraph(_sentence(rng, rng.randint(12, 40)))
+
+        if i and i % 200 == 0:
+            table = doc.add_table(rows=4, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = _sentence(rng, 4)
+        if i and i % SECTION_EVERY == 0:
+            doc.add_section(WD_SECTION.NEW_PAGE)
+
+
+def generate_document(paragraphs: int, path: Path, seed: int = 0):
+    """Synthetic document with headings, markdown, fragmented runs, tables and sections
+
+    Roughly one paragraph in ten is a heading, one in five is split into
+    many small runs with mixed formatting, there is a table every 200
+    paragraphs and a new section every 500.
+    """
+    rng = random.Random(seed)
+    doc = Document()
+    body = doc.element.body
+    # python-docx looks for the final sectPr on every append, which is
+    # quadratic on a large body, so content is built in small scratch
+    # documents and moved over in chunks
+    for first in range(0, paragraphs, SECTION_EVERY):
+        scratch = Document()
+        _add_content(scratch, rng, first, min(first + SECTION_EVERY, paragraphs))
+        scratch_body = scratch.element.body
+        for element in list(scratch_body)[:-1]:
+            body.insert(len(body) - 1, element)
+    doc.save(path)
+
+
+def document_for_scale(paragraphs: int) -> Path:
+    CACHE_DIR.mkdir(exist_ok=True)
+    path = CACHE_DIR / f"synthetic_v{GENERATOR_VERSION}_{paragraphs}.docx"
+    if not path.exists():
+        generate_document(paragraphs, path)
+    return path
+
+
+def _clean_markdown(processor, doc):
+    processor._clean_markdown_formatting(doc)
+
+
+def _full_engine(processor, doc):
+    processor.engine.apply(doc, processor.engine.compile(OPTIONS))
+
+
+def _save(processor, doc):
+    doc.save(io.BytesIO())
+
+
+# Stages that work on an already loaded document, timed one at a time
+STAGES = {
+    "clean_markdown": _clean_markdown,
+    "text": lambda processor, doc: processor._apply_text_formatting(doc, OPTIONS.text),
+    "paragraph": lambda processor, doc: processor._apply_paragraph_formatting(doc, OPTIONS.paragraph),
+    "page": lambda processor, doc: processor._apply_page_formatting(doc, OPTIONS.page),
+    "structure": lambda processor, doc: processor._apply_structure_formatting(doc, OPTIONS.structure),
+    "cleanup": lambda processor, doc: processor._apply_cleanup(doc, OPTIONS.cleanup),
+    "engine": _full_engine,
+    "save": _save,
+}
+
+
+def _summary(samples) -> dict:
+    return {
+        "min": round(min(samples), 6),
+        "median": round(statistics.median(samples), 6),
+        "repeat": len(samples),
+    }
+
+
+def document_shape(doc) -> dict:
+    body = doc.element.body
+    return {
+        "paragraphs": len(body.xpath(".//w:p")),
+        "runs": len(body.xpath(".//w:r")),
+        "tables": len(body.xpath(".//w:tbl")),
+        "sections": len(doc.sections),
+    }
+
+
+def benchmark_scale(processor: DocumentProcessor, paragraphs: int, repeat: int, stages) -> dict:
+    path = document_for_scale(paragraphs)
+
+    load_samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        doc = Document(str(path))
+        load_samples.append(time.perf_counter() - start)
+
+    result = {
+        "scale": paragraphs,
+        "file_bytes": os.path.getsize(path),
+        **document_shape(doc),
+        "stages": {"load": _summary(load_samples)},
+    }
+    for name in stages:
+        samples = []
+        for _ in range(repeat):
+            working = copy.deepcopy(doc)
+            start = time.perf_counter()
+            STAGES[name](processor, working)
+            samples.append(time.perf_counter() - start)
+        result["stages"][name] = _summary(samples)
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: dict, current: dict):
+    """Print the median time of every stage relative to a baseline run"""
+    previous = {entry["scale"]: entry["stages"] for entry in baseline["results"]}
+    print(f"baseline {baseline.get('commit', 'unknown')[:12]} -> current {current.get('commit', 'unknown')[:12]}")
+    for entry in current["results"]:
+        stages = previous.get(entry["scale"])
+        if stages is None:
+            continue
+        for name, timing in entry["stages"].items():
+            if name not in stages:
+                continue
+            before = stages[name]["median"]
+            ratio = timing["median"] / before if before else float("inf")
+            print(f"{entry['scale']:>8} {name:<16} {before:>10.4f}s -> {timing['median']:>10.4f}s  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                        help="paragraph counts of the generated documents")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against an earlier JSON result")
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(upload_dir=str(CACHE_DIR / "uploads"))
+    results = {
+        "commit": _git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "python_docx": docx.__version__,
+        "repeat": args.repeat,
+        "results": [],
+    }
+    for paragraphs in args.scales:
+        results["results"].append(benchmark_scale(processor, paragraphs, args.repeat, args.stages))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare rPr/pPr templates with per-property python-docx setters
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_templates --scales 1000 10000
+
+Both paths format every body run, table cell run and body paragraph of
+the same generated document as bench_stages, and must produce identical XML.
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_stages import CACHE_DIR, OPTIONS, document_for_scale
+from services.document_processor import DocumentProcessor
+from services.story_traversal import body_paragraphs, paragraph_runs, story_paragraphs
+
+
+def _proxy_path(processor, doc):
+    text, paragraph = OPTIONS.text, OPTIONS.paragraph
+    cells, _ = story_paragraphs(doc)
+    for body_paragraph in body_paragraphs(doc):
+        for run in paragraph_runs(body_paragraph):
+            processor._format_text_run(run, text)
+        processor._format_text_paragraph(body_paragraph, text)
+        processor._format_paragraph(body_paragraph, paragraph)
+    for cell_paragraph in cells:
+        for run in paragraph_runs(cell_paragraph):
+            processor._format_table_run(run, text)
+
+
+def _template_path(processor, doc):
+    text, paragraph = OPTIONS.text, OPTIONS.paragraph
+    run_template = processor._text_run_template(text)
+    table_template = processor._text_run_template(text, table=True)
+    text_paragraph_template = processor._text_paragraph_template(text)
+    paragraph_template = processor._paragraph_template(
+        lambda body_paragraph: processor._format_paragraph(body_paragraph, paragraph)
+    )
+    cells, _ = story_paragraphs(doc)
+    for body_paragraph in body_paragraphs(doc):
+        for run in paragraph_runs(body_paragraph):
+            run_template.apply_to_run(run)
+        text_paragraph_template.apply_to_paragraph(body_paragraph)
+        paragraph_template.apply_to_paragraph(body_paragraph)
+    for cell_paragraph in cells:
+        for run in paragraph_runs(cell_paragraph):
+            table_template.apply_to_run(run)
+
+
+PATHS = {"proxy": _proxy_path, "template": _template_path}
+
+
+def benchmark_scale(processor, paragraphs: int, repeat: int) -> dict:
+    doc = Document(str(document_for_scale(paragraphs)))
+    result = {"scale": paragraphs, "runs": len(doc.element.body.xpath(".//w:r"))}
+    outputs = {}
+    for name, apply in PATHS.items():
+        samples = []
+        for _ in range(repeat):
+            working = copy.deepcopy(doc)
+            start = time.perf_counter()
+            apply(processor, working)
+            samples.append(time.perf_counter() - start)
+        outputs[name] = working.element.xml
+        result[name] = round(min(samples), 4)
+    result["identical"] = outputs["proxy"] == outputs["template"]
+    result["speedup"] = round(result["proxy"] / max(result["template"], 1e-9), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    processor = DocumentProcessor(upload_dir=str(CACHE_DIR / "uploads"))
+    results = [benchmark_scale(processor, paragraphs, args.repeat) for paragraphs in args.scales]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Run-by-run markdown cleaning as it was before services.markdown_cleaner, kept for benchmarks"""
+import re
+
+
+def clean_markdown_paragraph(paragraph) -> bool:
+    """Clean markdown from one paragraph, returning False if it was removed"""
+    text = paragraph.text
+
+    # Skip empty paragraphs
+    if not text.strip():
+        return True
+
+    # Detect markdown headings and convert them
+    # ### Heading 3
+    if text.strip().startswith('###'):
+        # Remove the ### prefix
+        cleaned_text = text.strip()[3:].strip()
+        # Remove ** wrapping if present
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*:?$', r'\1', cleaned_text)
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*', r'\1', cleaned_text)
+
+        # Clear existing runs and set new text
+        for run in paragraph.runs:
+            run.text = ''
+        if paragraph.runs:
+            paragraph.runs[0].text = cleaned_text
+        else:
+            paragraph.add_run(cleaned_text)
+
+        # Apply Heading 3 style
+        try:
+            paragraph.style = 'Heading 3'
+        except:
+            pass
+        return True
+
+    # ## Heading 2
+    elif text.strip().startswith('##'):
+        cleaned_text = text.strip()[2:].strip()
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*:?$', r'\1', cleaned_text)
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*', r'\1', cleaned_text)
+
+        for run in paragraph.runs:
+            run.text = ''
+        if paragraph.runs:
+            paragraph.runs[0].text = cleaned_text
+        else:
+            paragraph.add_run(cleaned_text)
+
+        try:
+            paragraph.style = 'Heading 2'
+        except:
+            pass
+        return True
+
+    # # Heading 1
+    elif text.strip().startswith('# '):
+        cleaned_text = text.strip()[1:].strip()
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*:?$', r'\1', cleaned_text)
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*', r'\1', cleaned_text)
+
+        for run in paragraph.runs:
+            run.text = ''
+        if paragraph.runs:
+            paragraph.runs[0].text = cleaned_text
+        else:
+            paragraph.add_run(cleaned_text)
+
+        try:
+            paragraph.style = 'Heading 1'
+        except:
+            pass
+        return True
+
+    # Clean markdown formatting from runs
+    for run in paragraph.runs:
+        if not run.text:
+            continue
+
+        original_text = run.text
+        cleaned_text = original_text
+
+        # Remove markdown bold markers (**text**)
+        # Handle full-line bold like **AXONITY NETWORKS**
+        cleaned_text = re.sub(r'^\*\*(.+?)\*\*$', r'\1', cleaned_text)
+        # Handle inline bold
+        cleaned_text = re.sub(r'\*\*(.+?)\*\*', r'\1', cleaned_text)
+
+        # Remove markdown italic markers (*text* or _text_)
+        cleaned_text = re.sub(r'\*(.+?)\*', r'\1', cleaned_text)
+        cleaned_text = re.sub(r'_(.+?)_', r'\1', cleaned_text)
+
+        # Remove markdown strikethrough (~~text~~)
+        cleaned_text = re.sub(r'~~(.+?)~~', r'\1', cleaned_text)
+
+        # Remove markdown code markers (`code`)
+        cleaned_text = re.sub(r'`(.+?)`', r'\1', cleaned_text)
+
+        # Remove horizontal rules (---, ___, ***)
+        if re.match(r'^[\-_*]{3,}$', cleaned_text.strip()):
+            cleaned_text = ''
+
+        # Apply cleaned text
+        if cleaned_text != original_text:
+            run.text = cleaned_text
+
+    # Remove paragraphs that are now empty or just horizontal rules
+    if paragraph.text.strip() in ['', '---', '___', '***']:
+        try:
+            p = paragraph._element
+            p.getparent().remove(p)
+            return False
+        except:
+            pass
+
+    return True
@@ -1,11 +1,25 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from routers import document_router
+from services import document_processor, worker_pool, job_manager, format_metrics, storage_janitor, format_sessions
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    storage_janitor.start()
+    yield
+    await storage_janitor.stop()
+    worker_pool.shutdown()
+
 
 app = FastAPI(
     title="Word Document Formatter API",
     description="API for formatting Word documents",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -28,7 +42,24 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "workers": worker_pool.stats(),
+        "jobs": job_manager.stats(),
+        "result_cache": document_processor.result_cache.stats(),
+        "document_cache": document_processor.document_cache.stats(),
+        "storage": storage_janitor.stats(),
+        "sessions": format_sessions.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Format timings, document sizes and storage eviction in the Prometheus text format"""
+    return PlainTextResponse(
+        format_metrics.render() + "\n".join(storage_janitor.render()) + "\n",
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 if __name__ == "__main__":
@@ -11,9 +11,18 @@ from .formatting_options import (
     CleanupOptions,
     FormattingOptions,
     FormatRequest,
+    BatchFormatRequest,
     UploadResponse,
     FormatResponse,
     PreviewResponse,
+    StatsResponse,
+    DocumentKind,
+    DocumentInfo,
+    DocumentListResponse,
+    JobStatus,
+    JobResponse,
+    SessionUpdateRequest,
+    SessionResponse,
 )
 
 __all__ = [
@@ -29,7 +38,16 @@ __all__ = [
     "CleanupOptions",
     "FormattingOptions",
     "FormatRequest",
+    "BatchFormatRequest",
     "UploadResponse",
     "FormatResponse",
     "PreviewResponse",
+    "StatsResponse",
+    "DocumentKind",
+    "DocumentInfo",
+    "DocumentListResponse",
+    "JobStatus",
+    "JobResponse",
+    "SessionUpdateRequest",
+    "SessionResponse",
 ]
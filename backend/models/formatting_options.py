@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime
 from enum import Enum
 
 
@@ -122,6 +123,9 @@ class TextFormattingOptions(BaseModel):
     character_spacing: Optional[float] = None  # in points
     line_spacing: Optional[LineSpacing] = None
     text_alignment: Optional[TextAlignment] = None
+    # Write font, size, strikethrough and highlight into the document defaults and styles
+    # instead of every run; the other options stay on the runs
+    apply_to_styles: Optional[bool] = None
 
 
 class ParagraphFormattingOptions(BaseModel):
@@ -214,11 +218,17 @@ class FormatRequest(BaseModel):
     options: FormattingOptions
 
 
+class BatchFormatRequest(BaseModel):
+    file_ids: List[str]
+    options: FormattingOptions
+
+
 class UploadResponse(BaseModel):
     file_id: str
     filename: str
     size: int
     message: str
+    content_hash: Optional[str] = None
 
 
 class FormatResponse(BaseModel):
@@ -232,3 +242,70 @@ class PreviewResponse(BaseModel):
     file_id: str
     content: str
     page_count: int
+
+
+class StatsResponse(BaseModel):
+    file_id: str
+    pages: int
+    pages_estimated: bool
+    words: int
+    characters: int
+    characters_with_spaces: int
+    paragraphs: int
+    tables: int
+    images: int
+    sections: int
+
+
+class DocumentKind(str, Enum):
+    UPLOAD = "upload"
+    FORMATTED = "formatted"
+
+
+class DocumentInfo(BaseModel):
+    file_id: str
+    kind: DocumentKind
+    filename: Optional[str] = None
+    size: int
+    content_hash: Optional[str] = None
+    parent_id: Optional[str] = None
+    created_at: datetime
+    accessed_at: datetime
+
+
+class DocumentListResponse(BaseModel):
+    total: int
+    documents: List[DocumentInfo]
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+    file_id: str
+    result_file_id: Optional[str] = None
+    formatted_filename: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class SessionUpdateRequest(BaseModel):
+    options: FormattingOptions
+
+
+class SessionResponse(BaseModel):
+    session_id: str
+    file_id: str
+    result_file_id: str
+    formatted_filename: str
+    rerun_stages: List[str]
+    reused_stages: List[str]
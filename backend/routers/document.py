@@ -1,19 +1,62 @@
 import os
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 
 from models import (
     FormatRequest,
+    BatchFormatRequest,
     UploadResponse,
     FormatResponse,
     PreviewResponse,
+    StatsResponse,
+    DocumentKind,
+    DocumentInfo,
+    DocumentListResponse,
+    JobResponse,
+    SessionUpdateRequest,
+    SessionResponse,
+)
+from services import (
+    document_processor,
+    FileTooLargeError,
+    worker_pool,
+    PoolSaturatedError,
+    format_document_cached,
+    document_preview_task,
+    document_stats_task,
+    job_manager,
+    JobNotFoundError,
+    JobFinishedError,
+    batch_formatter,
+    MAX_BATCH_SIZE,
+    server_timing,
+    strong_etag,
+    not_modified,
+    validator_headers,
+    StorageFullError,
+    format_sessions,
+    SessionNotFoundError,
 )
-from services import document_processor
 
 router = APIRouter(prefix="/api", tags=["document"])
 
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 ALLOWED_EXTENSIONS = {".docx"}
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+def raise_busy(error: PoolSaturatedError):
+    """Answer 503 with a Retry-After hint when the worker pool is full"""
+    raise HTTPException(
+        status_code=503,
+        detail="Server is busy formatting other documents, please retry shortly",
+        headers={"Retry-After": str(error.retry_after)},
+    )
 
 
 @router.post("/upload", response_model=UploadResponse)
@@ -28,45 +71,57 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}",
         )
 
-    # Read file content
-    content = await file.read()
-
-    # Validate file size
-    if len(content) > MAX_FILE_SIZE:
+    # Reject early when the client already told us the size
+    if file.size is not None and file.size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size is {MAX_FILE_SIZE // (1024 * 1024)}MB",
         )
 
-    # Save file
+    # Stream the file to disk, enforcing the size limit as it arrives
     try:
-        file_id = document_processor.save_uploaded_file(content, file.filename)
+        saved = await document_processor.save_upload_stream(
+            file, file.filename, MAX_FILE_SIZE
+        )
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except StorageFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
     return UploadResponse(
-        file_id=file_id,
+        file_id=saved["file_id"],
         filename=file.filename,
-        size=len(content),
+        size=saved["size"],
+        content_hash=saved["content_hash"],
         message="File uploaded successfully",
     )
 
 
 @router.post("/format", response_model=FormatResponse)
-async def format_document(request: FormatRequest):
+async def format_document(request: FormatRequest, response: Response):
     """Format a document with the specified options"""
 
+    report = {}
     try:
-        formatted_file_id = document_processor.format_document(
-            request.file_id, request.options
+        formatted_file_id = await format_document_cached(
+            request.file_id, request.options, worker_pool, report
         )
+    except PoolSaturatedError as e:
+        raise_busy(e)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Document not found")
+    except StorageFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to format document: {str(e)}"
         )
 
+    response.headers["Server-Timing"] = server_timing(
+        {**report["stages"], "total": report["total"]}
+    )
     return FormatResponse(
         file_id=formatted_file_id,
         original_filename=f"{request.file_id}.docx",
@@ -75,12 +130,149 @@ async def format_document(request: FormatRequest):
     )
 
 
+@router.post("/format/batch")
+async def format_documents_batch(request: BatchFormatRequest):
+    """Format many documents with one set of options and stream the results as a ZIP"""
+
+    # Keep the first occurrence of each id, the archive has one entry per document
+    file_ids = list(dict.fromkeys(request.file_ids))
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="No documents to format")
+    if len(file_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many documents. Maximum batch size is {MAX_BATCH_SIZE}",
+        )
+
+    try:
+        worker_pool.ensure_capacity()
+    except PoolSaturatedError as e:
+        raise_busy(e)
+
+    return StreamingResponse(
+        batch_formatter.stream_zip(file_ids, request.options),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="formatted_documents.zip"'},
+    )
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_format_job(request: FormatRequest):
+    """Start formatting a document in the background and return a job id"""
+
+    if not document_processor.is_upload(request.file_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        job = job_manager.submit(request.file_id, request.options)
+    except PoolSaturatedError as e:
+        raise_busy(e)
+
+    return job.to_response()
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_format_job(job_id: str):
+    """Get the status of a format job"""
+
+    try:
+        job = job_manager.get(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_response()
+
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_format_job(job_id: str):
+    """Cancel a queued or running format job"""
+
+    try:
+        job = job_manager.cancel(job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    except JobFinishedError:
+        raise HTTPException(status_code=409, detail="Job has already finished")
+
+    return job.to_response()
+
+
+def session_response(session, report: dict, response: Response) -> SessionResponse:
+    response.headers["Server-Timing"] = server_timing(
+        {**report["stages"], "total": report["total"]}
+    )
+    return SessionResponse(
+        session_id=session.session_id,
+        file_id=session.file_id,
+        result_file_id=report["result_file_id"],
+        formatted_filename=f"{report['result_file_id']}_formatted.docx",
+        rerun_stages=report["rerun"],
+        reused_stages=report["reused"],
+    )
+
+
+@router.post("/sessions", response_model=SessionResponse, status_code=201)
+async def create_format_session(request: FormatRequest, response: Response):
+    """Open a session that re-formats a document quickly as its options change"""
+
+    report = {}
+    try:
+        session = await format_sessions.open(request.file_id, request.options, report)
+    except PoolSaturatedError as e:
+        raise_busy(e)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Document not found")
+    except StorageFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to format document: {str(e)}"
+        )
+
+    return session_response(session, report, response)
+
+
+@router.put("/sessions/{session_id}", response_model=SessionResponse)
+async def update_format_session(session_id: str, request: SessionUpdateRequest, response: Response):
+    """Re-format a session's document, re-running only the stages whose options changed"""
+
+    report = {}
+    try:
+        session = await format_sessions.format(session_id, request.options, report)
+    except PoolSaturatedError as e:
+        raise_busy(e)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except StorageFullError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to format document: {str(e)}"
+        )
+
+    return session_response(session, report, response)
+
+
+@router.delete("/sessions/{session_id}")
+async def close_format_session(session_id: str):
+    """Close a session and free the memory it holds"""
+
+    try:
+        format_sessions.close(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    return {"message": "Session closed"}
+
+
 @router.get("/preview/{file_id}")
 async def preview_document(file_id: str):
     """Get a preview of the document"""
 
     try:
-        preview = document_processor.get_document_preview(file_id)
+        preview = await worker_pool.run(document_preview_task, file_id)
+    except PoolSaturatedError as e:
+        raise_busy(e)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Document not found")
     except Exception as e:
@@ -95,32 +287,108 @@ async def preview_document(file_id: str):
     )
 
 
-@router.get("/download/{file_id}")
-async def download_document(file_id: str):
-    """Download the formatted document"""
+@router.get("/document/{file_id}/stats", response_model=StatsResponse)
+async def document_stats(file_id: str):
+    """Get page, word, character, paragraph, table, image and section counts"""
 
-    # First try formatted version
-    formatted_path = os.path.join(
-        document_processor.upload_dir, f"{file_id}_formatted.docx"
-    )
+    # Counted before for the same content, answer without touching the worker pool
+    stats = document_processor.cached_document_stats(file_id)
+    if stats is None:
+        try:
+            stats = await worker_pool.run(document_stats_task, file_id)
+        except PoolSaturatedError as e:
+            raise_busy(e)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Document not found")
+        except Exception as e:
+            raise HTTPException(
+                status_code=500, detail=f"Failed to read document statistics: {str(e)}"
+            )
 
-    if os.path.exists(formatted_path):
-        return FileResponse(
-            formatted_path,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename=f"formatted_document.docx",
+    return StatsResponse(file_id=file_id, **stats)
+
+
+@router.get("/documents", response_model=DocumentListResponse)
+async def list_documents(
+    kind: Optional[DocumentKind] = None,
+    parent_id: Optional[str] = None,
+    content_hash: Optional[str] = None,
+    q: Optional[str] = Query(None, description="Part of the original filename"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """List uploads and formatted outputs, newest first"""
+
+    total, records = await run_in_threadpool(
+        document_processor.registry.search,
+        kind=kind.value if kind else None,
+        parent_id=parent_id,
+        content_hash=content_hash,
+        filename=q,
+        created_after=created_after.timestamp() if created_after else None,
+        created_before=created_before.timestamp() if created_before else None,
+        limit=limit,
+        offset=offset,
+    )
+    documents = [
+        DocumentInfo(
+            **{
+                **record.to_dict(),
+                "created_at": datetime.fromtimestamp(record.created_at, timezone.utc),
+                "accessed_at": datetime.fromtimestamp(record.accessed_at, timezone.utc),
+            }
         )
+        for record in records
+    ]
+    return DocumentListResponse(total=total, documents=documents)
+
+
+@router.api_route("/download/{file_id}", methods=["GET", "HEAD"])
+async def download_document(file_id: str, request: Request):
+    """Download the formatted document"""
 
-    # Try original file
-    original_path = document_processor.get_file_path(file_id)
-    if original_path and os.path.exists(original_path):
+    # Hashing a formatted output the first time it is downloaded reads the whole file
+    download = await run_in_threadpool(document_processor.get_download, file_id)
+    if download is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    headers = validator_headers(strong_etag(download["content_hash"]), download["mtime"])
+    if not_modified(request.headers, headers["ETag"], download["mtime"]):
+        return Response(status_code=304, headers=headers)
+
+    if download["path"] is not None:
+        # FileResponse answers Range and If-Range requests against these validators
         return FileResponse(
-            original_path,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename=f"document.docx",
+            download["path"],
+            media_type=DOCX_MEDIA_TYPE,
+            filename=download["filename"],
+            headers=headers,
+            stat_result=download["stat"],
         )
 
-    raise HTTPException(status_code=404, detail="Document not found")
+    # Content held by another backend is sent whole, without range support
+    headers.update({
+        "Content-Disposition": f'attachment; filename="{download["filename"]}"',
+        "Content-Length": str(download["size"]),
+        "Accept-Ranges": "none",
+    })
+    if request.method == "HEAD":
+        return Response(media_type=DOCX_MEDIA_TYPE, headers=headers)
+    stored = await run_in_threadpool(document_processor.storage.open, download["key"])
+
+    async def chunks():
+        try:
+            while True:
+                chunk = await run_in_threadpool(stored.read, DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            stored.close()
+
+    return StreamingResponse(chunks(), media_type=DOCX_MEDIA_TYPE, headers=headers)
 
 
 @router.delete("/document/{file_id}")
@@ -128,7 +396,7 @@ async def delete_document(file_id: str):
     """Delete a document"""
 
     try:
-        document_processor.delete_file(file_id)
+        await run_in_threadpool(document_processor.delete_file, file_id)
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to delete document: {str(e)}"
@@ -1,3 +1,68 @@
-from .document_processor import DocumentProcessor, document_processor
+from .metrics import StageTimer, format_metrics, server_timing
+from .http_caching import strong_etag, not_modified, validator_headers
+from .storage import (
+    Storage,
+    LocalStorage,
+    MemoryStorage,
+    S3Storage,
+    StorageFullError,
+    create_storage,
+)
+from .file_registry import FileRegistry, FileRecord
+from .document_processor import DocumentProcessor, FileTooLargeError, document_processor
+from .worker_pool import (
+    WorkerPool,
+    PoolSaturatedError,
+    worker_pool,
+    format_document_task,
+    document_preview_task,
+    document_stats_task,
+)
+from .result_cache import ResultCache, format_document_cached
+from .document_cache import DocumentCache
+from .batch_formatter import BatchFormatter, batch_formatter, MAX_BATCH_SIZE
+from .storage_janitor import StorageJanitor, storage_janitor
+from .job_manager import JobManager, JobNotFoundError, JobFinishedError, job_manager
+from .format_session import FormatSession, FormatSessionManager, SessionNotFoundError, format_sessions
 
-__all__ = ["DocumentProcessor", "document_processor"]
+__all__ = [
+    "StageTimer",
+    "format_metrics",
+    "server_timing",
+    "strong_etag",
+    "not_modified",
+    "validator_headers",
+    "Storage",
+    "LocalStorage",
+    "MemoryStorage",
+    "S3Storage",
+    "StorageFullError",
+    "create_storage",
+    "FileRegistry",
+    "FileRecord",
+    "DocumentProcessor",
+    "FileTooLargeError",
+    "document_processor",
+    "WorkerPool",
+    "PoolSaturatedError",
+    "worker_pool",
+    "format_document_task",
+    "document_preview_task",
+    "document_stats_task",
+    "ResultCache",
+    "format_document_cached",
+    "DocumentCache",
+    "BatchFormatter",
+    "batch_formatter",
+    "MAX_BATCH_SIZE",
+    "StorageJanitor",
+    "storage_janitor",
+    "JobManager",
+    "JobNotFoundError",
+    "JobFinishedError",
+    "job_manager",
+    "FormatSession",
+    "FormatSessionManager",
+    "SessionNotFoundError",
+    "format_sessions",
+]
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import zipfile
+from typing import AsyncIterator, List
+
+from models.formatting_options import FormattingOptions
+from services.document_processor import document_processor
+from services.result_cache import format_document_cached
+from services.storage import formatted_key
+from services.worker_pool import WorkerPool, worker_pool
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+ZIP_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+class ZipStreamBuffer:
+    """Write-only file object that hands what ZipFile writes to a generator"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BatchFormatter:
+    """Formats many documents with one options object and streams the outputs as a ZIP
+
+    Documents are formatted in parallel on the worker pool, at most one per
+    worker so a large batch does not fill the queue used by interactive
+    requests. Each output is copied into the archive as soon as it is ready,
+    and the archive is produced on the fly without a temporary file. The last
+    entry, ``manifest.json``, reports success or failure for every file.
+    """
+
+    def __init__(self, pool: WorkerPool = worker_pool):
+        self.pool = pool
+
+    async def stream_zip(self, file_ids: List[str], options: FormattingOptions) -> AsyncIterator[bytes]:
+        buffer = ZipStreamBuffer()
+        results = []
+        limit = asyncio.Semaphore(self.pool.workers)
+
+        async def format_one(file_id: str):
+            async with limit:
+                try:
+                    formatted_file_id = await format_document_cached(
+                        file_id, options, self.pool, wait=True
+                    )
+                    return file_id, formatted_file_id, None
+                except FileNotFoundError:
+                    return file_id, None, "Document not found"
+                except Exception as e:
+                    return file_id, None, f"Failed to format document: {str(e)}"
+
+        order = {file_id: index for index, file_id in enumerate(file_ids)}
+        tasks = [asyncio.create_task(format_one(file_id)) for file_id in file_ids]
+        try:
+            # docx files are already deflated, storing them keeps the event loop cheap
+            with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+                for next_done in asyncio.as_completed(tasks):
+                    file_id, formatted_file_id, error = await next_done
+                    entry = {"file_id": file_id, "status": "failed" if error else "done"}
+
+                    if formatted_file_id:
+                        filename = formatted_key(formatted_file_id)
+                        # Opening and reading may go to a remote backend, keep them off the event loop
+                        source = await asyncio.to_thread(document_processor.storage.open, filename)
+                        try:
+                            with archive.open(filename, "w") as target:
+                                while True:
+                                    chunk = await asyncio.to_thread(source.read, ZIP_CHUNK_SIZE)
+                                    if not chunk:
+                                        break
+                                    target.write(chunk)
+                                    data = buffer.drain()
+                                    if data:
+                                        yield data
+                        finally:
+                            source.close()
+                        entry.update(formatted_file_id=formatted_file_id, filename=filename)
+                    else:
+                        entry["error"] = error
+
+                    results.append(entry)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+                manifest = {
+                    "succeeded": sum(1 for entry in results if entry["status"] == "done"),
+                    "failed": sum(1 for entry in results if entry["status"] == "failed"),
+                    "files": sorted(results, key=lambda entry: order[entry["file_id"]]),
+                }
+                archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+            yield buffer.drain()
+        finally:
+            # Stop formatting if the client went away
+            for task in tasks:
+                task.cancel()
+
+
+# Singleton instance
+batch_formatter = BatchFormatter()
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import time
+import uuid
+from typing import BinaryIO, List, Optional, Tuple
+
+from services.file_registry import UPLOAD, FileRecord, FileRegistry
+from services.storage import Storage
+
+# Seconds between two looks at a blob that is being deleted
+INTENT_POLL_SECONDS = 0.05
+# Intents older than this were left by a process that died, they are ignored
+STALE_INTENT_SECONDS = 600
+
+
+def read_legacy_index(index_path: str) -> List[Tuple[str, str, str, int, float]]:
+    """(file_id, content_hash, extension, size, created_at) of every alias in a blob index of earlier versions
+
+    Aliases used to be kept in their own ``index.sqlite3`` next to the blobs;
+    they are imported into the registry once and the old index is no longer
+    written.
+    """
+    if not os.path.exists(index_path):
+        return []
+    db = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, timeout=30)
+    try:
+        return db.execute(
+            "SELECT a.file_id, b.content_hash, b.extension, b.size, a.created_at FROM aliases a"
+            " JOIN blobs b ON b.content_hash = a.content_hash"
+        ).fetchall()
+    finally:
+        db.close()
+
+
+class BlobStore:
+    """Content-addressed storage for uploaded documents
+
+    Every distinct document is stored once, named after its SHA-256 hash.
+    A file_id is a lightweight alias that points at a blob, and a blob is
+    only removed when its last alias is released. Uploading the same
+    template again costs a hash and a registry insert instead of another
+    stored copy.
+
+    Aliases are the upload records of the file registry, whose path is the
+    blob's key, so there is no second index to keep in step: adding and
+    releasing an alias are single registry transactions. The blobs
+    themselves go to ``storage`` under ``prefix`` + their name.
+
+    Storage calls run outside the registry transactions, so a slow upload
+    to the storage backend does not hold up other registry writers. A blob
+    being stored or deleted has an intent row in the registry until the
+    storage call is done: adding content waits for a delete of its key, and
+    the last alias released while the same content is being stored again
+    leaves the blob in place.
+    """
+
+    def __init__(self, registry: FileRegistry, storage: Storage, prefix: str = ""):
+        self.registry = registry
+        self.storage = storage
+        self.prefix = prefix
+        with registry.transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS blob_intents ("
+                " intent_id TEXT PRIMARY KEY,"
+                " key TEXT NOT NULL,"
+                " action TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS blob_intents_key ON blob_intents (key)")
+
+    def blob_key(self, content_hash: str, extension: str) -> str:
+        return f"{self.prefix}{content_hash}{extension}"
+
+    def _is_alias(self, record: FileRecord) -> bool:
+        return (
+            record.kind == UPLOAD
+            and record.content_hash is not None
+            and record.path.startswith(f"{self.prefix}{record.content_hash}")
+        )
+
+    def _stored_key(self, content_hash: str) -> Optional[str]:
+        """Key of the blob with this content, if any alias refers to it"""
+        for (path,) in self.registry.select(
+            "SELECT DISTINCT path FROM files WHERE kind = ? AND content_hash = ?", (UPLOAD, content_hash)
+        ):
+            if path.startswith(f"{self.prefix}{content_hash}"):
+                return path
+        return None
+
+    def _intents(self, db: sqlite3.Connection, key: str) -> set:
+        """Actions in progress on ``key``"""
+        rows = db.execute(
+            "SELECT action FROM blob_intents WHERE key = ? AND created_at > ?",
+            (key, time.time() - STALE_INTENT_SECONDS),
+        ).fetchall()
+        return {action for (action,) in rows}
+
+    def _begin(self, db: sqlite3.Connection, key: str, action: str) -> str:
+        intent_id = str(uuid.uuid4())
+        db.execute(
+            "INSERT INTO blob_intents (intent_id, key, action, created_at) VALUES (?, ?, ?, ?)",
+            (intent_id, key, action, time.time()),
+        )
+        return intent_id
+
+    def _end(self, db: sqlite3.Connection, intent_id: str):
+        db.execute("DELETE FROM blob_intents WHERE intent_id = ?", (intent_id,))
+
+    def _claim_orphan(self, db: sqlite3.Connection, key: str) -> Optional[str]:
+        """Start deleting ``key`` if no alias refers to it and nothing else is in progress on it"""
+        aliased = db.execute(
+            "SELECT 1 FROM files WHERE kind = ? AND path = ? LIMIT 1", (UPLOAD, key)
+        ).fetchone()
+        if aliased or self._intents(db, key):
+            return None
+        return self._begin(db, key, "delete")
+
+    def _delete(self, key: str, intent_id: str):
+        try:
+            self.storage.delete(key)
+        finally:
+            with self.registry.transaction() as db:
+                self._end(db, intent_id)
+
+    def has_blob(self, content_hash: str) -> bool:
+        return self._stored_key(content_hash) is not None
+
+    def add(self, content_hash: str, extension: str, size: int, staged: Optional[BinaryIO] = None,
+            file_id: Optional[str] = None, filename: Optional[str] = None) -> str:
+        """Create a new alias for a blob and return its file_id
+
+        ``staged``, a file from ``storage.stage()``, holds the content when the
+        blob may not be stored yet; it is committed for a new blob and
+        discarded for a known one.
+        """
+        file_id = file_id or str(uuid.uuid4())
+        intent_id = None
+        while True:
+            with self.registry.transaction() as db:
+                key = self._stored_key(content_hash)
+                if key is not None:
+                    self.registry.register(file_id, UPLOAD, key, size, filename=filename, content_hash=content_hash)
+                    break
+                if staged is None:
+                    raise FileNotFoundError(f"Blob not found: {content_hash}")
+                key = self.blob_key(content_hash, extension)
+                # The last alias of this content was just released, wait until its blob is gone
+                if "delete" not in self._intents(db, key):
+                    intent_id = self._begin(db, key, "add")
+                    break
+            time.sleep(INTENT_POLL_SECONDS)
+
+        if intent_id is None:
+            # The content was already stored, the staged copy is not needed
+            if staged is not None:
+                self.storage.abort(staged)
+            return file_id
+
+        orphan = None
+        try:
+            self.storage.commit(staged, key)
+            with self.registry.transaction() as db:
+                self._end(db, intent_id)
+                stored = self._stored_key(content_hash) or key
+                self.registry.register(file_id, UPLOAD, stored, size, filename=filename, content_hash=content_hash)
+                # Another upload stored the same content first, under another name: ours is a duplicate
+                if stored != key:
+                    orphan = self._claim_orphan(db, key)
+        except BaseException:
+            with self.registry.transaction() as db:
+                self._end(db, intent_id)
+                orphan = self._claim_orphan(db, key)
+            if orphan is not None:
+                self._delete(key, orphan)
+            raise
+        if orphan is not None:
+            self._delete(key, orphan)
+        return file_id
+
+    def resolve(self, file_id: str) -> Optional[str]:
+        """Storage key of the blob behind a file_id, or None for unknown ids"""
+        record = self.registry.get(file_id)
+        return record.path if record is not None and self._is_alias(record) else None
+
+    def content_hash(self, file_id: str) -> Optional[str]:
+        record = self.registry.get(file_id)
+        return record.content_hash if record is not None and self._is_alias(record) else None
+
+    def release(self, file_id: str) -> bool:
+        """Drop an alias, deleting the blob when no alias refers to it any more
+
+        Returns False, changing nothing, when ``file_id`` is not an alias.
+        """
+        with self.registry.transaction() as db:
+            record = self.registry.get(file_id)
+            if record is None or not self._is_alias(record):
+                return False
+            self.registry.remove(file_id)
+            intent_id = self._claim_orphan(db, record.path)
+
+        if intent_id is not None:
+            self._delete(record.path, intent_id)
+        return True
+
+    def stats(self) -> dict:
+        rows = [
+            (path, size) for path, content_hash, size in self.registry.select(
+                "SELECT path, content_hash, size FROM files WHERE kind = ? AND content_hash IS NOT NULL",
+                (UPLOAD,),
+            )
+            if path.startswith(f"{self.prefix}{content_hash}")
+        ]
+        blobs = dict(rows)
+        logical_bytes = sum(size for _, size in rows)
+        stored_bytes = sum(blobs.values())
+        return {
+            "blobs": len(blobs),
+            "aliases": len(rows),
+            "stored_bytes": stored_bytes,
+            "deduplicated_bytes": logical_bytes - stored_bytes,
+        }
@@ -0,0 +1,126 @@
+import copy
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from services.lazy_package import open_document
+
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))  # 256MB
+# Leave images and other binary parts in the zip until the document is saved
+DOCUMENT_LAZY_MEDIA = os.getenv("DOCUMENT_LAZY_MEDIA", "true").lower() not in ("0", "false", "no")
+
+# A parsed lxml tree takes several times the size of its XML text
+XML_TREE_OVERHEAD = 4
+
+
+def estimate_document_size(path: str, lazy_media: bool = False) -> int:
+    """Rough in-memory size of a parsed package, from its uncompressed members"""
+    size = 0
+    with zipfile.ZipFile(path) as package:
+        for member in package.infolist():
+            if member.filename.endswith((".xml", ".rels")):
+                size += member.file_size * XML_TREE_OVERHEAD
+            elif not lazy_media:
+                size += member.file_size
+    return size
+
+
+def copy_document(doc):
+    """A deep copy of a parsed document that can be modified independently
+
+    lxml elements copy their own subtree and ignore deepcopy's memo, so the
+    ``_Body`` proxy a Document caches once its paragraphs were read would
+    be copied into a second, detached body tree. The copy leaves it out and
+    builds its own on first use.
+    """
+    memo = {}
+    body = doc.__dict__.get("_Document__body")
+    if body is not None:
+        memo[id(body)] = None
+    return copy.deepcopy(doc, memo)
+
+
+class DocumentCache:
+    """Memory-bounded LRU cache of parsed documents keyed on path and mtime
+
+    ``Document(path)`` unzips the package and parses every XML part, and a
+    typical session opens the same file for preview and formatting several
+    times. The parsed Document is kept here and callers that modify it get
+    a deep copy, so the cached tree is never mutated. A file rewritten in
+    place has a new mtime and is parsed again.
+
+    With ``lazy_media`` binary parts stay in the zip (see
+    lazy_package.open_document), so an entry costs its XML, not its images.
+    """
+
+    def __init__(self, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES, lazy_media: bool = DOCUMENT_LAZY_MEDIA):
+        self.max_bytes = max_bytes
+        self.lazy_media = lazy_media
+        self.entries: "OrderedDict[str, Tuple[Tuple[int, int], object, int]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def open(self, path: str, writable: bool = True):
+        """Return the parsed document at ``path``
+
+        With ``writable`` the caller gets its own copy to modify; read-only
+        callers share the cached instance and must not change it.
+        """
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                doc = entry[1]
+            else:
+                doc = None
+                self.misses += 1
+
+        if doc is None:
+            doc = open_document(path, self.lazy_media)
+            self._store(path, stamp, doc)
+
+        return copy_document(doc) if writable else doc
+
+    def _store(self, path: str, stamp: Tuple[int, int], doc):
+        size = estimate_document_size(path, self.lazy_media)
+        with self._lock:
+            stale = self.entries.pop(path, None)
+            if stale is not None:
+                self.total_bytes -= stale[2]
+            if size > self.max_bytes:
+                return
+            self.entries[path] = (stamp, doc, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def discard(self, path: str):
+        """Forget a file that was deleted"""
+        with self._lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,119 @@
+import posixpath
+import zipfile
+from typing import BinaryIO, Union
+
+from lxml import etree
+
+# Non-empty paragraphs shown in a preview
+PREVIEW_PARAGRAPHS = 50
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+OFFICE_DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+PACKAGE_RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+EXTENDED_PROPERTIES_NS = "http://schemas.openxmlformats.org/officeDocument/2006/extended-properties"
+
+
+def _w(tag: str) -> str:
+    return f"{{{W_NS}}}{tag}"
+
+
+BODY = _w("body")
+P = _w("p")
+R = _w("r")
+T = _w("t")
+HYPERLINK = _w("hyperlink")
+PPR = _w("pPr")
+SECT_PR = _w("sectPr")
+BR = _w("br")
+BR_TYPE = _w("type")
+
+# Text equivalents of run content, as python-docx's Run.text renders them
+RUN_CONTENT_TEXT = {
+    _w("tab"): "\t",
+    _w("ptab"): "\t",
+    _w("cr"): "\n",
+    _w("noBreakHyphen"): "-",
+}
+
+
+def _run_text(r) -> str:
+    parts = []
+    for child in r:
+        if child.tag == T:
+            parts.append(child.text or "")
+        elif child.tag == BR:
+            # Only line breaks have a text equivalent, page and column breaks do not
+            if child.get(BR_TYPE, "textWrapping") == "textWrapping":
+                parts.append("\n")
+        else:
+            parts.append(RUN_CONTENT_TEXT.get(child.tag, ""))
+    return "".join(parts)
+
+
+def paragraph_text(p) -> str:
+    """Text of a w:p element, matching python-docx's Paragraph.text"""
+    parts = []
+    for child in p:
+        if child.tag == R:
+            parts.append(_run_text(child))
+        elif child.tag == HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == R)
+    return "".join(parts)
+
+
+def main_document_part(package: zipfile.ZipFile) -> str:
+    """Zip member name of the main document part, usually word/document.xml"""
+    try:
+        rels = etree.fromstring(package.read("_rels/.rels"))
+    except KeyError:
+        return "word/document.xml"
+    for rel in rels.iter(f"{{{PACKAGE_RELS_NS}}}Relationship"):
+        if rel.get("Type") == OFFICE_DOCUMENT_REL:
+            return posixpath.normpath(rel.get("Target").lstrip("/"))
+    return "word/document.xml"
+
+
+def read_preview(path: Union[str, BinaryIO], max_paragraphs: int = PREVIEW_PARAGRAPHS) -> dict:
+    """Stream the body of a .docx and keep the first ``max_paragraphs`` non-empty paragraphs
+
+    Only ``word/document.xml`` is read, element by element, and each
+    top-level body element is dropped once it has been looked at, so memory
+    follows the preview size rather than the document size. Past the preview
+    only body paragraphs and section properties are looked at, to keep the
+    paragraph and section counts exact.
+    """
+    content = []
+    paragraph_count = 0
+    section_breaks = 0
+    final_section = 0
+
+    with zipfile.ZipFile(path) as package:
+        with package.open(main_document_part(package)) as stream:
+            for _, element in etree.iterparse(stream, events=("end",), tag=(P, SECT_PR), huge_tree=True):
+                parent = element.getparent()
+                if parent is None or parent.tag != BODY:
+                    continue
+
+                if element.tag == P:
+                    paragraph_count += 1
+                    ppr = element.find(PPR)
+                    if ppr is not None and ppr.find(SECT_PR) is not None:
+                        section_breaks += 1
+                    if len(content) < max_paragraphs:
+                        text = paragraph_text(element)
+                        if text.strip():
+                            content.append(text)
+                else:
+                    final_section = 1
+
+                # Free the finished element and everything before it
+                element.clear()
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    return {
+        "content": "\n\n".join(content),
+        # Every paragraph-level sectPr ends a section, the body-level one ends the last
+        "page_count": section_breaks + final_section,
+        "paragraph_count": paragraph_count,
+    }
@@ -1,14 +1,38 @@
+import asyncio
+import functools
+import hashlib
 import os
 import re
 import uuid
-from typing import Optional
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional, Union
+
+import aiofiles.threadpool
 from docx import Document
 from docx.shared import Pt, Inches, RGBColor, Twips
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
 from docx.enum.section import WD_ORIENT
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
-
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+
+from services.blob_store import BlobStore, read_legacy_index
+from services.document_cache import DocumentCache
+from services.document_preview import read_preview
+from services.document_stats import StatsCache, read_stats
+from services.file_registry import FILE_REGISTRY_PATH, FORMATTED, UPLOAD, FileRecord, FileRegistry
+from services.formatting_engine import FormattingEngine
+from services.lazy_package import open_document
+from services.markdown_cleaner import clean_paragraph
+from services.metrics import StageTimer
+from services.package_writer import save_document
+from services.property_templates import PARAGRAPH_PROPERTIES, RUN_PROPERTIES, PropertyTemplate
+from services.result_cache import ResultCache
+from services.storage import LocalStorage, Storage, create_storage, formatted_key
+from services.style_index import StyleIndex
+from services.story_traversal import all_paragraphs, body_paragraphs, paragraph_runs, story_paragraphs
 from models.formatting_options import (
     FormattingOptions,
     TextAlignment,
@@ -22,39 +46,332 @@ from models.formatting_options import (
     BorderStyle,
 )
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+# Storage key prefix of the upload blobs
+BLOB_PREFIX = "blobs/"
+
+# rFonts slots the text formatting sets, each with a matching *Theme attribute
+FONT_SLOTS = ('ascii', 'hAnsi', 'eastAsia')
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload grows past the allowed size"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File too large. Maximum size is {max_size // (1024 * 1024)}MB")
+        self.max_size = max_size
+
 
 class DocumentProcessor:
-    def __init__(self, upload_dir: str = "uploads"):
+    def __init__(self, upload_dir: str = "uploads", storage: Optional[Storage] = None):
         self.upload_dir = upload_dir
+        self.engine = FormattingEngine(self)
+        # Without an explicit backend, STORAGE_BACKEND picks one per upload_dir
+        self._fixed_storage = storage
+        self._storage: Optional[Storage] = None
+        self._storage_root: Optional[str] = None
+        self._blob_store: Optional[BlobStore] = None
+        self._result_cache: Optional[ResultCache] = None
+        self._stats_cache: Optional[StatsCache] = None
+        self._registry: Optional[FileRegistry] = None
+        self.document_cache = DocumentCache()
         os.makedirs(upload_dir, exist_ok=True)
 
+    @property
+    def storage(self) -> Storage:
+        """Backend holding the uploads and formatted outputs; metadata stays in upload_dir"""
+        if self._fixed_storage is not None:
+            return self._fixed_storage
+        if self._storage is None or self._storage_root != self.upload_dir:
+            self._storage = create_storage(self.upload_dir)
+            self._storage_root = self.upload_dir
+        return self._storage
+
+    @property
+    def blob_store(self) -> BlobStore:
+        """Content-addressed store for uploads in the current upload_dir"""
+        registry, storage = self.registry, self.storage
+        if (self._blob_store is None or self._blob_store.registry is not registry
+                or self._blob_store.storage is not storage):
+            self._blob_store = BlobStore(registry, storage, prefix=BLOB_PREFIX)
+        return self._blob_store
+
+    @property
+    def result_cache(self) -> ResultCache:
+        """Cache of formatted outputs in the current upload_dir"""
+        root = os.path.join(self.upload_dir, "cache")
+        if self._result_cache is None or self._result_cache.root != root:
+            self._result_cache = ResultCache(root)
+        return self._result_cache
+
+    @property
+    def stats_cache(self) -> StatsCache:
+        """Document statistics by content hash in the current upload_dir"""
+        root = os.path.join(self.upload_dir, "stats")
+        if self._stats_cache is None or self._stats_cache.root != root:
+            self._stats_cache = StatsCache(root)
+        return self._stats_cache
+
+    @property
+    def registry(self) -> FileRegistry:
+        """Index of the uploads and formatted outputs in the current upload_dir"""
+        if self._registry is None or self._registry.root != self.upload_dir:
+            registry = FileRegistry(self.upload_dir, FILE_REGISTRY_PATH or None)
+            if self.storage.persistent:
+                registry.import_existing(self._existing_files())
+            else:
+                # What the registry knows from an earlier process is gone with its memory
+                registry.clear()
+            self._registry = registry
+        return self._registry
+
+    def _existing_files(self) -> Iterator[dict]:
+        """Files stored before the registry, found in the old blob index and upload_dir"""
+        legacy_index = os.path.join(self.upload_dir, "blobs", "index.sqlite3")
+        for file_id, content_hash, extension, size, created_at in read_legacy_index(legacy_index):
+            yield {"file_id": file_id, "kind": UPLOAD, "path": f"{BLOB_PREFIX}{content_hash}{extension}",
+                   "size": size, "content_hash": content_hash, "created_at": created_at}
+        # Older files only ever were plain files in upload_dir
+        if not isinstance(self.storage, LocalStorage) or self.storage.root != self.upload_dir:
+            return
+        with os.scandir(self.upload_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith("_formatted.docx"):
+                    file_id, kind = entry.name[:-len("_formatted.docx")], FORMATTED
+                elif entry.name.endswith((".docx", ".doc")):
+                    # Uploads from before they were content-addressed
+                    file_id, kind = os.path.splitext(entry.name)[0], UPLOAD
+                else:
+                    continue
+                yield {"file_id": file_id, "kind": kind, "path": entry.path, "size": stat.st_size,
+                       "created_at": stat.st_mtime}
+
+    def register_formatted(self, formatted_file_id: str, parent_id: str) -> FileRecord:
+        """Record a formatted output stored for the upload ``parent_id``"""
+        key = formatted_key(formatted_file_id)
+        size = self.storage.size(key)
+        if size is None:
+            raise FileNotFoundError(f"File not found: {formatted_file_id}")
+        parent = self.registry.get(parent_id)
+        filename = parent.filename if parent is not None else None
+        return self.registry.register(
+            formatted_file_id, FORMATTED, key, size, filename=filename, parent_id=parent_id,
+        )
+
     def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
         """Save uploaded file and return file_id"""
-        file_id = str(uuid.uuid4())
+        content_hash = hashlib.sha256(file_content).hexdigest()
         file_extension = os.path.splitext(filename)[1]
-        file_path = os.path.join(self.upload_dir, f"{file_id}{file_extension}")
 
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        file_id = None
+        # Known content only needs a new alias
+        if self.blob_store.has_blob(content_hash):
+            try:
+                file_id = self.blob_store.add(
+                    content_hash, file_extension, len(file_content), filename=filename
+                )
+            except FileNotFoundError:
+                # Released by another request in the meantime, store it again
+                pass
+
+        if file_id is None:
+            staged = self.storage.stage()
+            try:
+                staged.write(file_content)
+                file_id = self.blob_store.add(
+                    content_hash, file_extension, len(file_content), staged, filename=filename
+                )
+            except BaseException:
+                self.storage.abort(staged)
+                raise
 
         return file_id
 
+    async def save_upload_stream(self, upload, filename: str, max_size: int) -> dict:
+        """Stream an upload to storage in fixed-size chunks, hashing it on the way
+
+        The size limit is enforced while reading, so peak memory stays at one
+        chunk however large the upload is. Content that is already stored is
+        deduplicated. Returns the file_id, size and SHA-256 content hash.
+        """
+        file_extension = os.path.splitext(filename)[1]
+        staged = self.storage.stage()
+        loop = asyncio.get_running_loop()
+        # A local stage is a real file, aiofiles keeps its writes off the event loop
+        writer = aiofiles.threadpool.wrap(staged) if isinstance(self.storage, LocalStorage) else None
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                digest.update(chunk)
+                if writer is not None:
+                    await writer.write(chunk)
+                else:
+                    # Other backends stage in a spooled temporary file, which aiofiles cannot wrap
+                    await loop.run_in_executor(None, staged.write, chunk)
+            content_hash = digest.hexdigest()
+            file_id = await loop.run_in_executor(
+                None, functools.partial(
+                    self.blob_store.add, content_hash, file_extension, size, staged, filename=filename
+                )
+            )
+        except BaseException:
+            self.storage.abort(staged)
+            raise
+
+        return {"file_id": file_id, "size": size, "content_hash": content_hash}
+
+    def is_upload(self, file_id: str) -> bool:
+        record = self.registry.get(file_id)
+        return record is not None and record.kind == UPLOAD
+
     def get_file_path(self, file_id: str) -> Optional[str]:
-        """Get the full path for a file_id"""
-        for ext in [".docx", ".doc"]:
-            path = os.path.join(self.upload_dir, f"{file_id}{ext}")
-            if os.path.exists(path):
-                return path
-        return None
+        """Get the full path of an uploaded file_id, None unless the backend keeps plain files"""
+        record = self.registry.get(file_id)
+        if record is None or record.kind != UPLOAD:
+            return None
+        return self.storage.local_path(record.path)
+
+    @contextmanager
+    def _open_content(self, record: FileRecord) -> Iterator[Union[str, BinaryIO]]:
+        """A registered file as a path where the backend keeps plain files, else as an open file"""
+        path = self.storage.local_path(record.path)
+        if path is not None:
+            yield path
+            return
+        with self.storage.open(record.path) as f:
+            yield f
+
+    def _find(self, file_id: str) -> FileRecord:
+        record = self.registry.get(file_id)
+        if record is None:
+            raise FileNotFoundError(f"File not found: {file_id}")
+        return record
+
+    def file_digest(self, key: str) -> str:
+        """SHA-256 of stored content, read in chunks"""
+        sha256 = hashlib.sha256()
+        with self.storage.open(key) as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def get_download(self, file_id: str) -> Optional[dict]:
+        """What /api/download serves for a file_id
+
+        Returns the storage key, the local path and stat result where the
+        backend keeps plain files (None otherwise), size, modification time,
+        download filename and content hash, or None for unknown ids.
+        Formatted outputs are hashed on their first download and the hash is
+        kept in the registry.
+        """
+        record = self.registry.get(file_id)
+        if record is None:
+            return None
+        path = self.storage.local_path(record.path)
+        if path is not None:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            size, mtime = stat.st_size, stat.st_mtime
+        else:
+            # Stored content never changes, its registration time is its modification time
+            stat, size, mtime = None, record.size, record.created_at
+
+        content_hash = record.content_hash
+        if content_hash is None:
+            try:
+                content_hash = self.file_digest(record.path)
+            except FileNotFoundError:
+                return None
+            self.registry.set_content_hash(file_id, content_hash)
+        self.registry.touch(file_id)
+        filename = "formatted_document.docx" if record.kind == FORMATTED else "document.docx"
+        return {
+            "key": record.path, "path": path, "stat": stat, "size": size, "mtime": mtime,
+            "filename": filename, "content_hash": content_hash,
+        }
 
-    def format_document(self, file_id: str, options: FormattingOptions) -> str:
-        """Apply formatting options to a document and return new file_id"""
-        source_path = self.get_file_path(file_id)
-        if not source_path:
+    def format_document(self, file_id: str, options: FormattingOptions,
+                        report: Optional[dict] = None) -> str:
+        """Apply formatting options to a document and return new file_id
+
+        When ``report`` is given it is filled with the seconds spent in each
+        stage and the size, paragraph count and run count of the source.
+        """
+        record = self.registry.get(file_id)
+        if record is None or record.kind != UPLOAD:
             raise FileNotFoundError(f"File not found: {file_id}")
+        with self._open_content(record) as source:
+            formatted_file_id = self._format_source(source, record, options, report)
+        self.register_formatted(formatted_file_id, file_id)
+        self.registry.touch(file_id)
+        return formatted_file_id
+
+    def _format_source(self, source: Union[str, BinaryIO], record: FileRecord, options: FormattingOptions,
+                       report: Optional[dict]) -> str:
+        timer = StageTimer()
+
+        with timer.span("load"):
+            doc = self.load_document(source)
+
+        if report is not None:
+            body = doc.element.body
+            report["document"] = {
+                "bytes": record.size,
+                "paragraphs": len(body.xpath(".//w:p")),
+                "runs": len(body.xpath(".//w:r")),
+            }
 
-        doc = Document(source_path)
+        # All enabled stages are applied in a single traversal of the body
+        plan = self.engine.compile(options)
+        self.engine.apply(doc, plan)
+        for stage, seconds in plan.timings.items():
+            timer.add(stage, seconds)
 
+        with timer.span("save"):
+            formatted_file_id = self.save_formatted(doc, source)
+
+        if report is not None:
+            report["stages"] = timer.stages
+        return formatted_file_id
+
+    def load_document(self, source: Union[str, BinaryIO]) -> Document:
+        """A private parse of an upload that formatting may modify"""
+        if isinstance(source, str):
+            # A copy of the cached parse
+            return self.document_cache.open(source)
+        return open_document(source)
+
+    def save_formatted(self, doc: Document, source: Union[str, BinaryIO]) -> str:
+        """Store a formatted document made from ``source`` and return its new file_id
+
+        The caller registers it with register_formatted.
+        """
+        formatted_file_id = str(uuid.uuid4())
+        staged = self.storage.stage()
+        try:
+            # Members formatting left alone, such as images, are copied without recompressing
+            save_document(doc, staged, source)
+            self.storage.commit(staged, formatted_key(formatted_file_id))
+        except BaseException:
+            self.storage.abort(staged)
+            raise
+        return formatted_file_id
+
+    def _apply_formatting_multipass(self, doc: Document, options: FormattingOptions):
+        """Apply every stage with its own pass over the document (reference for the engine)"""
         # IMPORTANT: Clean markdown formatting FIRST before any other processing
         self._clean_markdown_formatting(doc)
 
@@ -62,6 +379,11 @@ class DocumentProcessor:
         if options.text:
             self._apply_text_formatting(doc, options.text)
 
+        # Merge runs once they have their final text formatting, so every
+        # later stage has fewer runs to visit
+        if options.cleanup and options.cleanup.normalize_formatting:
+            self._coalesce_document_runs(doc)
+
         if options.paragraph:
             self._apply_paragraph_formatting(doc, options.paragraph)
 
@@ -74,208 +396,281 @@ class DocumentProcessor:
         if options.cleanup:
             self._apply_cleanup(doc, options.cleanup)
 
-        # Save formatted document
-        formatted_file_id = str(uuid.uuid4())
-        formatted_path = os.path.join(self.upload_dir, f"{formatted_file_id}_formatted.docx")
-        doc.save(formatted_path)
-
-        return formatted_file_id
-
     def _clean_markdown_formatting(self, doc: Document):
-        """Clean markdown-style formatting characters from the document"""
-        for paragraph in doc.paragraphs:
-            text = paragraph.text
-
-            # Skip empty paragraphs
-            if not text.strip():
-                continue
-
-            # Detect markdown headings and convert them
-            # ### Heading 3
-            if text.strip().startswith('###'):
-                # Remove the ### prefix
-                cleaned_text = text.strip()[3:].strip()
-                # Remove ** wrapping if present
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*:?$', r'\1', cleaned_text)
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*', r'\1', cleaned_text)
-
-                # Clear existing runs and set new text
-                for run in paragraph.runs:
-                    run.text = ''
-                if paragraph.runs:
-                    paragraph.runs[0].text = cleaned_text
-                else:
-                    paragraph.add_run(cleaned_text)
+        """Clean markdown-style formatting characters from every story of the document"""
+        for paragraph in all_paragraphs(doc):
+            self._clean_markdown_paragraph(paragraph)
 
-                # Apply Heading 3 style
-                try:
-                    paragraph.style = 'Heading 3'
-                except:
-                    pass
-                continue
-
-            # ## Heading 2
-            elif text.strip().startswith('##'):
-                cleaned_text = text.strip()[2:].strip()
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*:?$', r'\1', cleaned_text)
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*', r'\1', cleaned_text)
-
-                for run in paragraph.runs:
-                    run.text = ''
-                if paragraph.runs:
-                    paragraph.runs[0].text = cleaned_text
-                else:
-                    paragraph.add_run(cleaned_text)
-
-                try:
-                    paragraph.style = 'Heading 2'
-                except:
-                    pass
-                continue
-
-            # # Heading 1
-            elif text.strip().startswith('# '):
-                cleaned_text = text.strip()[1:].strip()
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*:?$', r'\1', cleaned_text)
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*', r'\1', cleaned_text)
-
-                for run in paragraph.runs:
-                    run.text = ''
-                if paragraph.runs:
-                    paragraph.runs[0].text = cleaned_text
-                else:
-                    paragraph.add_run(cleaned_text)
+    def _clean_markdown_paragraph(self, paragraph) -> bool:
+        """Clean markdown from one paragraph, returning False if it was removed"""
+        return clean_paragraph(paragraph)
 
-                try:
-                    paragraph.style = 'Heading 1'
-                except:
-                    pass
-                continue
-
-            # Clean markdown formatting from runs
-            for run in paragraph.runs:
-                if not run.text:
-                    continue
-
-                original_text = run.text
-                cleaned_text = original_text
-
-                # Remove markdown bold markers (**text**)
-                # Handle full-line bold like **AXONITY NETWORKS**
-                cleaned_text = re.sub(r'^\*\*(.+?)\*\*$', r'\1', cleaned_text)
-                # Handle inline bold
-                cleaned_text = re.sub(r'\*\*(.+?)\*\*', r'\1', cleaned_text)
-
-                # Remove markdown italic markers (*text* or _text_)
-                cleaned_text = re.sub(r'\*(.+?)\*', r'\1', cleaned_text)
-                cleaned_text = re.sub(r'_(.+?)_', r'\1', cleaned_text)
-
-                # Remove markdown strikethrough (~~text~~)
-                cleaned_text = re.sub(r'~~(.+?)~~', r'\1', cleaned_text)
-
-                # Remove markdown code markers (`code`)
-                cleaned_text = re.sub(r'`(.+?)`', r'\1', cleaned_text)
+    def _apply_text_formatting(self, doc: Document, options):
+        """Apply text formatting to all paragraphs
+
+        Body paragraphs get the full formatting. Runs in table cells get the
+        table subset and runs in headers, footers, notes and text boxes get
+        the run formatting, without the paragraph-level spacing and alignment.
+        """
+        cells, others = story_paragraphs(doc)
+        if options.apply_to_styles:
+            self._apply_text_styles(doc, options)
+            conflicts = self._run_property_conflicts(self._text_style_template(options, table=True))
+            run_template = self._text_style_run_template(options)
+            paragraph_template = self._text_paragraph_template(options)
+            for paragraph in body_paragraphs(doc):
+                for run in paragraph_runs(paragraph):
+                    self._strip_run_properties(run, conflicts)
+                    run_template.apply_to_run(run)
+                paragraph_template.apply_to_paragraph(paragraph)
+            for paragraph in cells:
+                for run in paragraph_runs(paragraph):
+                    self._strip_run_properties(run, conflicts)
+            for paragraph in others:
+                for run in paragraph_runs(paragraph):
+                    self._strip_run_properties(run, conflicts)
+                    run_template.apply_to_run(run)
+            return
+
+        run_template = self._text_run_template(options)
+        table_template = self._text_run_template(options, table=True)
+        paragraph_template = self._text_paragraph_template(options)
+        for paragraph in body_paragraphs(doc):
+            for run in paragraph_runs(paragraph):
+                run_template.apply_to_run(run)
+            paragraph_template.apply_to_paragraph(paragraph)
 
-                # Remove horizontal rules (---, ___, ***)
-                if re.match(r'^[\-_*]{3,}$', cleaned_text.strip()):
-                    cleaned_text = ''
+        # Also apply to tables
+        for paragraph in cells:
+            for run in paragraph_runs(paragraph):
+                table_template.apply_to_run(run)
 
-                # Apply cleaned text
-                if cleaned_text != original_text:
-                    run.text = cleaned_text
+        for paragraph in others:
+            for run in paragraph_runs(paragraph):
+                run_template.apply_to_run(run)
 
-            # Remove paragraphs that are now empty or just horizontal rules
-            if paragraph.text.strip() in ['', '---', '___', '***']:
-                try:
-                    p = paragraph._element
-                    p.getparent().remove(p)
-                except:
-                    pass
+    def _format_text_run(self, run, options):
+        """Apply text formatting options to a single run"""
+        try:
+            if options.font_family:
+                run.font.name = options.font_family.value
+                # Set font for East Asian characters safely
+                r = run._element
+                rPr = r.rPr
+                if rPr is not None:
+                    rFonts = rPr.rFonts
+                    if rFonts is not None:
+                        rFonts.set(qn('w:eastAsia'), options.font_family.value)
 
-    def _apply_text_formatting(self, doc: Document, options):
-        """Apply text formatting to all paragraphs"""
-        for paragraph in doc.paragraphs:
-            for run in paragraph.runs:
-                try:
-                    if options.font_family:
-                        run.font.name = options.font_family.value
-                        # Set font for East Asian characters safely
-                        r = run._element
-                        rPr = r.rPr
-                        if rPr is not None:
-                            rFonts = rPr.rFonts
-                            if rFonts is not None:
-                                rFonts.set(qn('w:eastAsia'), options.font_family.value)
+            if options.font_size:
+                run.font.size = Pt(options.font_size)
 
-                    if options.font_size:
-                        run.font.size = Pt(options.font_size)
+            if options.font_color:
+                color = self._parse_color(options.font_color)
+                if color:
+                    run.font.color.rgb = color
 
-                    if options.font_color:
-                        color = self._parse_color(options.font_color)
-                        if color:
-                            run.font.color.rgb = color
+            if options.bold is not None:
+                run.font.bold = options.bold
 
-                    if options.bold is not None:
-                        run.font.bold = options.bold
+            if options.italic is not None:
+                run.font.italic = options.italic
 
-                    if options.italic is not None:
-                        run.font.italic = options.italic
+            if options.underline is not None:
+                run.font.underline = options.underline
 
-                    if options.underline is not None:
-                        run.font.underline = options.underline
+            # New text formatting options
+            if options.strikethrough is not None:
+                run.font.strike = options.strikethrough
 
-                    # New text formatting options
-                    if options.strikethrough is not None:
-                        run.font.strike = options.strikethrough
+            if options.double_strikethrough is not None:
+                run.font.double_strike = options.double_strikethrough
 
-                    if options.double_strikethrough is not None:
-                        run.font.double_strike = options.double_strikethrough
+            if options.superscript is not None:
+                run.font.superscript = options.superscript
 
-                    if options.superscript is not None:
-                        run.font.superscript = options.superscript
+            if options.subscript is not None:
+                run.font.subscript = options.subscript
 
-                    if options.subscript is not None:
-                        run.font.subscript = options.subscript
+            if options.all_caps is not None:
+                run.font.all_caps = options.all_caps
 
-                    if options.all_caps is not None:
-                        run.font.all_caps = options.all_caps
+            if options.small_caps is not None:
+                run.font.small_caps = options.small_caps
 
-                    if options.small_caps is not None:
-                        run.font.small_caps = options.small_caps
+            if options.highlight_color and options.highlight_color != HighlightColor.NONE:
+                run.font.highlight_color = self._get_highlight_color(options.highlight_color)
 
-                    if options.highlight_color and options.highlight_color != HighlightColor.NONE:
-                        run.font.highlight_color = self._get_highlight_color(options.highlight_color)
+            if options.character_spacing is not None:
+                # Character spacing in twips (1/20 of a point)
+                run.font.spacing = Pt(options.character_spacing)
 
-                    if options.character_spacing is not None:
-                        # Character spacing in twips (1/20 of a point)
-                        run.font.spacing = Pt(options.character_spacing)
+        except Exception:
+            pass
 
-                except Exception:
-                    continue
+    def _format_text_paragraph(self, paragraph, options):
+        """Apply the paragraph-level parts of the text formatting options"""
+        if options.line_spacing:
+            self._set_line_spacing(paragraph, options.line_spacing)
 
-            if options.line_spacing:
-                self._set_line_spacing(paragraph, options.line_spacing)
+        if options.text_alignment:
+            self._set_alignment(paragraph, options.text_alignment)
 
-            if options.text_alignment:
-                self._set_alignment(paragraph, options.text_alignment)
+    def _format_table_run(self, run, options):
+        """Apply the subset of text formatting used for table cell runs"""
+        try:
+            if options.font_family:
+                run.font.name = options.font_family.value
+            if options.font_size:
+                run.font.size = Pt(options.font_size)
+            if options.strikethrough is not None:
+                run.font.strike = options.strikethrough
+            if options.highlight_color and options.highlight_color != HighlightColor.NONE:
+                run.font.highlight_color = self._get_highlight_color(options.highlight_color)
+        except Exception:
+            pass
 
-        # Also apply to tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        for run in paragraph.runs:
-                            try:
-                                if options.font_family:
-                                    run.font.name = options.font_family.value
-                                if options.font_size:
-                                    run.font.size = Pt(options.font_size)
-                                if options.strikethrough is not None:
-                                    run.font.strike = options.strikethrough
-                                if options.highlight_color and options.highlight_color != HighlightColor.NONE:
-                                    run.font.highlight_color = self._get_highlight_color(options.highlight_color)
-                            except Exception:
-                                continue
+    def _text_style_template(self, options, table: bool = False):
+        """The rPr the per-run text formatting would write, built on a scratch run"""
+        r = OxmlElement('w:r')
+        format_run = self._format_table_run if table else self._format_text_run
+        format_run(Run(r, None), options)
+        return r.rPr
+
+    def _run_template(self, format_run, removals=()) -> PropertyTemplate:
+        """Record what ``format_run`` writes on a scratch run as a reusable rPr template"""
+        r = OxmlElement('w:r')
+        format_run(Run(r, None))
+        return PropertyTemplate(r.rPr, RUN_PROPERTIES, removals)
+
+    def _paragraph_template(self, format_paragraph) -> PropertyTemplate:
+        """Record what ``format_paragraph`` writes on a scratch paragraph as a reusable pPr template"""
+        p = OxmlElement('w:p')
+        format_paragraph(Paragraph(p, None))
+        return PropertyTemplate(p.pPr, PARAGRAPH_PROPERTIES)
+
+    def _text_run_template(self, options, table: bool = False) -> PropertyTemplate:
+        """rPr template equivalent to _format_text_run, or _format_table_run for table cells"""
+        if table:
+            return self._run_template(lambda run: self._format_table_run(run, options))
+        return self._run_template(lambda run: self._format_text_run(run, options), self._text_run_removals(options))
+
+    def _text_run_removals(self, options) -> list:
+        """Clearing superscript or subscript only removes that exact vertical alignment"""
+        removals = []
+        if options.superscript is False:
+            removals.append(('w:vertAlign', 'superscript'))
+        if options.subscript is False:
+            removals.append(('w:vertAlign', 'subscript'))
+        return removals
+
+    def _text_style_run_template(self, options) -> PropertyTemplate:
+        """rPr template of what style mode still writes on body and story runs
+
+        The styles only take the table-cell subset of the options, because
+        table cells inherit them; the rest stays direct formatting, exactly
+        as per-run mode writes it.
+        """
+        r = OxmlElement('w:r')
+        self._format_text_run(Run(r, None), options)
+        self._strip_properties(r.rPr, self._run_property_conflicts(self._text_style_template(options, table=True)))
+        return PropertyTemplate(r.rPr, RUN_PROPERTIES, self._text_run_removals(options))
+
+    def _text_paragraph_template(self, options) -> PropertyTemplate:
+        """pPr template equivalent to _format_text_paragraph"""
+        return self._paragraph_template(lambda paragraph: self._format_text_paragraph(paragraph, options))
+
+    def _run_property_conflicts(self, template) -> dict:
+        """Run properties a template sets: element tags, plus rFonts attributes by name"""
+        conflicts = {}
+        if template is None:
+            return conflicts
+        for child in template:
+            if child.tag == qn('w:rFonts'):
+                attributes = set()
+                for name in FONT_SLOTS:
+                    if child.get(qn(f'w:{name}')) is not None:
+                        attributes.update((qn(f'w:{name}'), qn(f'w:{name}Theme')))
+                conflicts[child.tag] = attributes
+            else:
+                conflicts[child.tag] = None
+        return conflicts
+
+    def _strip_run_properties(self, run, conflicts: dict):
+        """Remove direct run formatting that the styles now provide"""
+        self._strip_properties(run._r.rPr, conflicts)
+
+    def _strip_properties(self, rPr, conflicts: dict):
+        if rPr is None or not conflicts:
+            return
+        for child in list(rPr):
+            if child.tag not in conflicts:
+                continue
+            attributes = conflicts[child.tag]
+            if attributes is None:
+                rPr.remove(child)
+                continue
+            for attribute in attributes:
+                child.attrib.pop(attribute, None)
+            if not child.attrib:
+                rPr.remove(child)
+        if len(rPr) == 0 and rPr.getparent() is not None and rPr.getparent().tag == qn('w:r'):
+            rPr.getparent().remove(rPr)
+
+    def _merge_run_properties(self, rPr, options, table: bool = False):
+        """Write text options into a style or default rPr, keeping schema order"""
+        parent = rPr.getparent()
+        index = parent.index(rPr)
+        # python-docx only edits rPr through a run, so lend it a scratch one
+        r = OxmlElement('w:r')
+        r.append(rPr)
+        format_run = self._format_table_run if table else self._format_text_run
+        format_run(Run(r, None), options)
+        parent.insert(index, rPr)
+
+        # An explicit font only wins once the theme font for that slot is gone
+        rFonts = rPr.rFonts
+        if rFonts is not None:
+            for name in FONT_SLOTS:
+                if rFonts.get(qn(f'w:{name}')) is not None:
+                    rFonts.attrib.pop(qn(f'w:{name}Theme'), None)
+
+    def _apply_text_styles(self, doc: Document, options):
+        """Apply text formatting through docDefaults and styles instead of every run
+
+        Only the subset that per-run formatting also applies to table cells
+        (font, size, strikethrough, highlight) goes into the document default
+        run properties and the table styles: cells inherit both, so anything
+        more would change how tables look. Paragraph and character styles
+        lose the properties that would override it. The caller strips the
+        conflicting direct run formatting and writes the other options on
+        body and story runs.
+        """
+        styles = doc.styles.element
+        doc_defaults = styles.find(qn('w:docDefaults'))
+        if doc_defaults is None:
+            doc_defaults = OxmlElement('w:docDefaults')
+            styles.insert(0, doc_defaults)
+        rPr_default = doc_defaults.find(qn('w:rPrDefault'))
+        if rPr_default is None:
+            rPr_default = OxmlElement('w:rPrDefault')
+            doc_defaults.insert(0, rPr_default)
+        rPr = rPr_default.find(qn('w:rPr'))
+        if rPr is None:
+            rPr = OxmlElement('w:rPr')
+            rPr_default.append(rPr)
+        self._merge_run_properties(rPr, options, table=True)
+
+        conflicts = self._run_property_conflicts(self._text_style_template(options, table=True))
+        for style in styles.style_lst:
+            style_type = style.get(qn('w:type'))
+            if style_type == 'table':
+                for conditional_rPr in style.findall(f"{qn('w:tblStylePr')}/{qn('w:rPr')}"):
+                    self._strip_properties(conditional_rPr, conflicts)
+                if conflicts:
+                    self._merge_run_properties(style.get_or_add_rPr(), options, table=True)
+            elif style_type in ('paragraph', 'character'):
+                self._strip_properties(style.rPr, conflicts)
 
     def _get_highlight_color(self, color: HighlightColor):
         """Convert HighlightColor enum to WD_COLOR_INDEX"""
@@ -301,56 +696,61 @@ class DocumentProcessor:
 
     def _apply_paragraph_formatting(self, doc: Document, options):
         """Apply paragraph formatting"""
-        for paragraph in doc.paragraphs:
-            pf = paragraph.paragraph_format
+        template = self._paragraph_template(lambda paragraph: self._format_paragraph(paragraph, options))
+        for paragraph in body_paragraphs(doc):
+            template.apply_to_paragraph(paragraph)
 
-            # Apply spacing (uses defaults if not changed by user)
-            if options.spacing_before is not None:
-                pf.space_before = Pt(options.spacing_before)
+        if options.remove_extra_spaces:
+            self._remove_extra_spaces(doc)
+
+        if options.remove_blank_lines:
+            self._remove_blank_lines(doc)
 
-            if options.spacing_after is not None:
-                pf.space_after = Pt(options.spacing_after)
+    def _format_paragraph(self, paragraph, options):
+        """Apply paragraph formatting options to a single paragraph"""
+        pf = paragraph.paragraph_format
 
-            # Apply indentation (uses defaults if not changed by user)
-            if options.indent_left is not None:
-                pf.left_indent = Inches(options.indent_left)
+        # Apply spacing (uses defaults if not changed by user)
+        if options.spacing_before is not None:
+            pf.space_before = Pt(options.spacing_before)
 
-            if options.indent_right is not None:
-                pf.right_indent = Inches(options.indent_right)
+        if options.spacing_after is not None:
+            pf.space_after = Pt(options.spacing_after)
 
-            if options.first_line_indent is not None:
-                pf.first_line_indent = Inches(options.first_line_indent)
+        # Apply indentation (uses defaults if not changed by user)
+        if options.indent_left is not None:
+            pf.left_indent = Inches(options.indent_left)
 
-            # Hanging indent (negative first line indent)
-            if options.hanging_indent is not None and options.hanging_indent > 0:
-                pf.first_line_indent = Inches(-options.hanging_indent)
+        if options.indent_right is not None:
+            pf.right_indent = Inches(options.indent_right)
 
-            # Page break options
-            if options.keep_lines_together is not None:
-                pf.keep_together = options.keep_lines_together
+        if options.first_line_indent is not None:
+            pf.first_line_indent = Inches(options.first_line_indent)
 
-            if options.keep_with_next is not None:
-                pf.keep_with_next = options.keep_with_next
+        # Hanging indent (negative first line indent)
+        if options.hanging_indent is not None and options.hanging_indent > 0:
+            pf.first_line_indent = Inches(-options.hanging_indent)
 
-            if options.page_break_before is not None:
-                pf.page_break_before = options.page_break_before
+        # Page break options
+        if options.keep_lines_together is not None:
+            pf.keep_together = options.keep_lines_together
 
-            if options.widow_control is not None:
-                pf.widow_control = options.widow_control
+        if options.keep_with_next is not None:
+            pf.keep_with_next = options.keep_with_next
 
-            # Apply paragraph background/shading
-            if options.background_color:
-                self._apply_paragraph_shading(paragraph, options.background_color)
+        if options.page_break_before is not None:
+            pf.page_break_before = options.page_break_before
 
-            # Apply paragraph borders
-            if options.border_style and options.border_style != BorderStyle.NONE:
-                self._apply_paragraph_border(paragraph, options)
+        if options.widow_control is not None:
+            pf.widow_control = options.widow_control
 
-        if options.remove_extra_spaces:
-            self._remove_extra_spaces(doc)
+        # Apply paragraph background/shading
+        if options.background_color:
+            self._apply_paragraph_shading(paragraph, options.background_color)
 
-        if options.remove_blank_lines:
-            self._remove_blank_lines(doc)
+        # Apply paragraph borders
+        if options.border_style and options.border_style != BorderStyle.NONE:
+            self._apply_paragraph_border(paragraph, options)
 
     def _apply_paragraph_shading(self, paragraph, color_str: str):
         """Apply background shading to a paragraph"""
@@ -507,6 +907,11 @@ class DocumentProcessor:
 
     def _apply_structure_formatting(self, doc: Document, options):
         """Apply document structure formatting"""
+        if self._wants_heading_normalization(options):
+            self._normalize_headings(doc, options)
+
+    def _wants_heading_normalization(self, options) -> bool:
+        """Whether the structure options ask for heading normalization"""
         # Apply heading formatting if normalize_headings is checked OR if any heading options are set
         has_heading_options = (
             options.h1_size or options.h1_color or options.h1_bold is not None or
@@ -515,27 +920,90 @@ class DocumentProcessor:
             options.heading_font_family
         )
 
-        if options.normalize_headings or has_heading_options:
-            self._normalize_headings(doc, options)
+        return bool(options.normalize_headings or has_heading_options)
 
     def _apply_cleanup(self, doc: Document, options):
         """Apply cleanup and standardization"""
         if options.remove_inconsistent_fonts and options.normalize_formatting:
-            default_font = "Calibri"
-            for paragraph in doc.paragraphs:
-                for run in paragraph.runs:
-                    try:
-                        run.font.name = default_font
-                    except Exception:
-                        continue
+            template = self._run_template(self._reset_run_font)
+            for paragraph in all_paragraphs(doc):
+                for run in paragraph_runs(paragraph):
+                    template.apply_to_run(run)
 
         if options.clean_copied_text:
             self._remove_extra_spaces(doc)
 
         if options.fix_alignment_issues:
-            for paragraph in doc.paragraphs:
-                if paragraph.paragraph_format.alignment is None:
-                    paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
+            for paragraph in body_paragraphs(doc):
+                self._fix_alignment(paragraph)
+
+    def _coalesce_document_runs(self, doc: Document):
+        """Merge adjacent runs with identical formatting in every paragraph"""
+        for paragraph in all_paragraphs(doc):
+            self._coalesce_runs(paragraph)
+
+    def _coalesce_runs(self, paragraph):
+        """Merge adjacent text-only runs of a paragraph whose rPr is identical"""
+        p = paragraph._p
+        self._coalesce_run_container(p)
+        for hyperlink in p.iterchildren(qn('w:hyperlink')):
+            self._coalesce_run_container(hyperlink)
+
+    def _coalesce_run_container(self, container):
+        r_tag = qn('w:r')
+        target = None
+        target_key = None
+        for child in list(container):
+            key = self._run_merge_key(child) if child.tag == r_tag else None
+            if key is None:
+                # Anything else between runs (bookmarks, fields, proofErr) ends the group
+                target = None
+                continue
+            if target is not None and key == target_key:
+                self._append_run_text(target, child)
+                container.remove(child)
+            else:
+                target = child
+                target_key = key
+
+    def _run_merge_key(self, r) -> Optional[bytes]:
+        """Serialized rPr of a run holding only text, None for runs that cannot be merged"""
+        rPr = None
+        has_text = False
+        for child in r:
+            if child.tag == qn('w:rPr'):
+                rPr = child
+            elif child.tag == qn('w:t'):
+                has_text = True
+            else:
+                return None
+        if not has_text:
+            return None
+        return etree.tostring(rPr) if rPr is not None else b""
+
+    def _append_run_text(self, target, source):
+        """Move the text of ``source`` to the end of ``target``'s single w:t"""
+        texts = target.findall(qn('w:t'))
+        first = texts[0]
+        parts = [t.text or "" for t in texts]
+        parts.extend(t.text or "" for t in source.findall(qn('w:t')))
+        for extra in texts[1:]:
+            target.remove(extra)
+        first.text = "".join(parts)
+        if first.text and (first.text[0].isspace() or first.text[-1].isspace()):
+            first.set(qn('xml:space'), 'preserve')
+
+    def _reset_run_font(self, run, default_font: str = "Calibri"):
+        """Replace a run's font with the default cleanup font"""
+        try:
+            run.font.name = default_font
+        except Exception:
+            pass
+
+    def _fix_alignment(self, paragraph):
+        """Give a paragraph without explicit alignment a left alignment"""
+        if paragraph.paragraph_format.alignment is None:
+            paragraph.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.LEFT
 
     def _parse_color(self, color_str: str) -> Optional[RGBColor]:
         """Parse color string to RGBColor"""
@@ -577,20 +1045,27 @@ class DocumentProcessor:
 
     def _remove_extra_spaces(self, doc: Document):
         """Remove extra spaces from text"""
-        for paragraph in doc.paragraphs:
-            for run in paragraph.runs:
-                try:
-                    run.text = re.sub(r' +', ' ', run.text)
-                    run.text = run.text.strip()
-                except Exception:
-                    continue
+        for paragraph in all_paragraphs(doc):
+            for run in paragraph_runs(paragraph):
+                self._remove_extra_spaces_run(run)
+
+    def _remove_extra_spaces_run(self, run):
+        """Collapse repeated spaces in a run and strip its ends"""
+        try:
+            text = run.text
+            cleaned = re.sub(r' +', ' ', text).strip()
+            # Setting the text replaces all run content, fields and drawings included
+            if cleaned != text:
+                run.text = cleaned
+        except Exception:
+            pass
 
     def _remove_blank_lines(self, doc: Document):
         """Remove consecutive blank paragraphs"""
         paragraphs_to_remove = []
         prev_blank = False
 
-        for i, paragraph in enumerate(doc.paragraphs):
+        for i, paragraph in enumerate(body_paragraphs(doc)):
             is_blank = not paragraph.text.strip()
             if is_blank and prev_blank:
                 paragraphs_to_remove.append(paragraph)
@@ -605,6 +1080,24 @@ class DocumentProcessor:
 
     def _normalize_headings(self, doc: Document, options):
         """Normalize heading styles"""
+        heading_config, style_mappings = self._heading_settings(options)
+        index = StyleIndex.for_document(doc, style_mappings)
+
+        # Headings found on the way are handed to the TOC step
+        paragraphs = body_paragraphs(doc)
+        headings = []
+        for paragraph in paragraphs:
+            self._normalize_heading(paragraph, options, heading_config, index)
+            if self._is_toc_heading(paragraph, index):
+                headings.append(paragraph)
+
+        # Create Table of Contents if requested
+        if options.create_toc:
+            first_text = paragraphs[0].text.strip() if paragraphs else None
+            self._insert_table_of_contents(doc, first_text, headings)
+
+    def _heading_settings(self, options):
+        """Build the per-level heading configuration and recognised style names"""
         heading_config = {
             'Heading 1': {
                 'size': options.h1_size or 24,
@@ -623,6 +1116,11 @@ class DocumentProcessor:
             },
         }
 
+        for config in heading_config.values():
+            config['template'] = self._run_template(
+                lambda run, config=config: self._format_heading_run(run, options, config)
+            )
+
         # Add alternative heading style names
         style_mappings = {
             'Heading 1': ['Heading 1', 'heading 1', 'Title', 'Heading1', 'Titre 1', 'Título 1'],
@@ -630,95 +1128,106 @@ class DocumentProcessor:
             'Heading 3': ['Heading 3', 'heading 3', 'Heading3', 'Titre 3', 'Título 3'],
         }
 
-        for paragraph in doc.paragraphs:
-            try:
-                if not paragraph.style:
-                    continue
+        return heading_config, style_mappings
 
-                # Find which heading level this style matches
-                matched_heading = None
-                for heading_name, style_names in style_mappings.items():
-                    if paragraph.style.name in style_names:
-                        matched_heading = heading_name
-                        break
-
-                # If no style match, try to detect heading by formatting
-                if not matched_heading and paragraph.runs:
-                    # Check if paragraph looks like a heading (short, bold, larger font)
-                    first_run = paragraph.runs[0] if paragraph.runs else None
-                    if first_run and first_run.font:
-                        is_bold = first_run.font.bold
-                        font_size = first_run.font.size.pt if first_run.font.size else 12
-                        text_length = len(paragraph.text.strip())
-
-                        # Detect as heading if bold and short text
-                        if is_bold and text_length < 100:
-                            if font_size >= 16:
-                                matched_heading = 'Heading 1'
-                                # Apply heading style to paragraph
-                                paragraph.style = 'Heading 1'
-                            elif font_size >= 14:
-                                matched_heading = 'Heading 2'
-                                paragraph.style = 'Heading 2'
-                            elif font_size >= 12:
-                                matched_heading = 'Heading 3'
-                                paragraph.style = 'Heading 3'
-
-                # Apply heading configuration
-                if matched_heading and matched_heading in heading_config:
-                    config = heading_config[matched_heading]
-
-                    # Ensure paragraph has at least one run
-                    if not paragraph.runs:
-                        paragraph.add_run(paragraph.text)
-
-                    # Apply formatting to all runs in the heading
-                    for run in paragraph.runs:
-                        # Always apply size
-                        run.font.size = Pt(config['size'])
-
-                        # Apply font family if specified
-                        if options.heading_font_family:
-                            run.font.name = options.heading_font_family.value
-
-                        # Apply bold setting
-                        run.font.bold = config['bold']
-
-                        # Apply color if specified
-                        if config['color']:
-                            color = self._parse_color(config['color'])
-                            if color:
-                                run.font.color.rgb = color
-            except Exception as e:
-                # Log but continue processing other paragraphs
-                continue
+    def _normalize_heading(self, paragraph, options, heading_config, index: StyleIndex):
+        """Detect whether a paragraph is a heading and apply the heading configuration"""
+        try:
+            style = index.style(paragraph._p)
+            if style is None:
+                return
 
-        # Create Table of Contents if requested
-        if options.create_toc:
-            self._create_table_of_contents(doc)
+            # Heading level of this style, from its name, aliases or outline level
+            matched_heading = f'Heading {style.level}' if style.level else None
+
+            # If no style match, try to detect heading by formatting
+            runs = paragraph_runs(paragraph)
+            if not matched_heading and runs:
+                # Check if paragraph looks like a heading (short, bold, larger font)
+                level = self._detected_heading_level(paragraph, runs[0])
+                if level:
+                    matched_heading = f'Heading {level}'
+                    # Apply heading style to paragraph
+                    style_id = index.heading_style_ids.get(level)
+                    if style_id is None:
+                        return
+                    paragraph._p.style = None if style_id == index.default_id else style_id
+
+            # Apply heading configuration
+            if matched_heading and matched_heading in heading_config:
+                config = heading_config[matched_heading]
+
+                # Ensure paragraph has at least one run
+                if not runs:
+                    paragraph.add_run(paragraph.text)
+                    runs = paragraph_runs(paragraph)
+
+                # Apply formatting to all runs in the heading
+                for run in runs:
+                    config['template'].apply_to_run(run)
+        except Exception as e:
+            # Log but continue processing other paragraphs
+            pass
 
-    def _create_table_of_contents(self, doc: Document):
-        """Create a table of contents at the beginning of the document"""
+    def _detected_heading_level(self, paragraph, first_run) -> Optional[int]:
+        """Heading level of a short paragraph whose first run is bold and large, None otherwise"""
+        rPr = first_run._r.rPr
+        if rPr is None or rPr.b is None or not rPr.b.val:
+            return None
+        if len(paragraph.text.strip()) >= 100:
+            return None
+
+        font_size = rPr.sz_val.pt if rPr.sz_val is not None else 12
+        if font_size >= 16:
+            return 1
+        if font_size >= 14:
+            return 2
+        if font_size >= 12:
+            return 3
+        return None
+
+    def _format_heading_run(self, run, options, config):
+        """Apply one heading level's configuration to a run"""
+        # Always apply size
+        run.font.size = Pt(config['size'])
+
+        # Apply font family if specified
+        if options.heading_font_family:
+            run.font.name = options.heading_font_family.value
+
+        # Apply bold setting
+        run.font.bold = config['bold']
+
+        # Apply color if specified
+        if config['color']:
+            color = self._parse_color(config['color'])
+            if color:
+                run.font.color.rgb = color
+
+    def _is_toc_heading(self, paragraph, index: StyleIndex) -> bool:
+        """Whether the paragraph's style is a heading style, by name or outline level"""
+        style = index.style(paragraph._p)
+        return bool(style and style.toc_heading)
+
+    def _insert_table_of_contents(self, doc: Document, first_text: Optional[str], headings: list) -> list:
+        """Insert the TOC title, field and page break, returning the paragraphs it created
+
+        ``headings`` are the heading paragraphs the structure stage found.
+        """
+        created = []
         try:
             # Check if TOC already exists - if the first paragraph is "Table of Contents", skip
-            if doc.paragraphs and doc.paragraphs[0].text.strip() == "Table of Contents":
+            if first_text == "Table of Contents":
                 # TOC already exists, just update the field
-                return
+                return created
 
-            # Count headings to determine if TOC is needed
-            heading_count = 0
-            for paragraph in doc.paragraphs:
-                if paragraph.style and 'heading' in paragraph.style.name.lower():
-                    heading_count += 1
-                    if heading_count >= 2:  # Only create TOC if we have at least 2 headings
-                        break
-
-            if heading_count < 2:
+            if len(headings) < 2:
                 # Not enough headings to warrant a TOC
-                return
+                return created
 
             # Create TOC paragraph
             toc_paragraph = doc.add_paragraph()
+            created.append(toc_paragraph)
             doc._element.body.insert(0, toc_paragraph._element)
 
             # Clear any default text and set title
@@ -729,10 +1238,11 @@ class DocumentProcessor:
             toc_paragraph.style = 'Heading 1'
 
             # Add spacing after TOC title
-            doc.add_paragraph()
+            created.append(doc.add_paragraph())
 
             # Add TOC field
             toc_field_paragraph = doc.add_paragraph()
+            created.append(toc_field_paragraph)
             doc._element.body.insert(2, toc_field_paragraph._element)
 
             run = toc_field_paragraph.add_run()
@@ -755,11 +1265,13 @@ class DocumentProcessor:
             run._r.append(fldChar3)
 
             # Add a page break after TOC
-            doc.add_page_break()
+            created.append(doc.add_page_break())
         except Exception as e:
             # If TOC creation fails, just continue
             pass
 
+        return created
+
     def _add_page_numbers(self, section, position: Optional[PageNumberPosition]):
         """Add page numbers to document"""
         if position is None:
@@ -802,36 +1314,50 @@ class DocumentProcessor:
 
     def get_document_preview(self, file_id: str) -> dict:
         """Get a text preview of the document"""
-        file_path = self.get_file_path(file_id)
-        if not file_path:
-            formatted_path = os.path.join(self.upload_dir, f"{file_id}_formatted.docx")
-            if os.path.exists(formatted_path):
-                file_path = formatted_path
-            else:
-                raise FileNotFoundError(f"File not found: {file_id}")
-
-        doc = Document(file_path)
+        with self._open_content(self._find(file_id)) as source:
+            return read_preview(source)
+
+    def cached_document_stats(self, file_id: str) -> Optional[dict]:
+        """Statistics of a file whose content was counted before, without opening it"""
+        record = self.registry.get(file_id)
+        if record is None or record.content_hash is None:
+            return None
+        return self.stats_cache.get(record.content_hash)
+
+    def get_document_stats(self, file_id: str) -> dict:
+        """Page, word, character, paragraph, table, image and section counts of a document"""
+        record = self.registry.get(file_id)
+        if record is None:
+            raise FileNotFoundError(f"File not found: {file_id}")
 
-        content = []
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                content.append(paragraph.text)
+        content_hash = record.content_hash
+        if content_hash:
+            stats = self.stats_cache.get(content_hash)
+            if stats is not None:
+                return stats
 
-        return {
-            "content": "\n\n".join(content[:50]),
-            "page_count": len(doc.sections),
-            "paragraph_count": len(doc.paragraphs),
-        }
+        with self._open_content(record) as source:
+            stats = read_stats(source)
+        if content_hash:
+            self.stats_cache.put(content_hash, stats)
+        return stats
 
     def delete_file(self, file_id: str):
         """Delete a file by its ID"""
-        file_path = self.get_file_path(file_id)
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
+        record = self.registry.get(file_id)
+        if record is None:
+            return
 
-        formatted_path = os.path.join(self.upload_dir, f"{file_id}_formatted.docx")
-        if os.path.exists(formatted_path):
-            os.remove(formatted_path)
+        # Drop the alias; the blob goes away with its last reference
+        if not self.blob_store.release(file_id):
+            if self.registry.remove(file_id) is None:
+                return
+            self.storage.delete(record.path)
+        file_path = self.storage.local_path(record.path)
+        if file_path and not os.path.exists(file_path):
+            self.document_cache.discard(file_path)
+        if record.kind == UPLOAD and record.content_hash and not self.blob_store.has_blob(record.content_hash):
+            self.stats_cache.discard(record.content_hash)
 
 
 # Singleton instance
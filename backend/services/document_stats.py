@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional, Union
+
+from lxml import etree
+
+from services.document_preview import (
+    BODY,
+    BR,
+    BR_TYPE,
+    EXTENDED_PROPERTIES_NS,
+    P,
+    SECT_PR,
+    _w,
+    main_document_part,
+    paragraph_text,
+)
+
+# Bump when a change to read_stats changes what it reports
+STATS_VERSION = "1"
+
+# Entries kept in memory, the least recently used are read from disk again
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "4096"))
+
+TBL = _w("tbl")
+VAL = _w("val")
+SECTION_TYPE = _w("type")
+SECT_PR_CHANGE = _w("sectPrChange")
+PAGE_BREAK_BEFORE = _w("pageBreakBefore")
+# Pictures in DrawingML and in legacy VML
+BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+IMAGEDATA = "{urn:schemas-microsoft-com:vml}imagedata"
+
+STREAMED_TAGS = (P, TBL, BLIP, IMAGEDATA, SECT_PR, BR, PAGE_BREAK_BEFORE)
+FALSE_VALUES = ("0", "false", "off")
+
+
+def _extended_properties(package: zipfile.ZipFile) -> Dict[str, int]:
+    """Integer statistics Word recorded in docProps/app.xml"""
+    try:
+        properties = etree.fromstring(package.read("docProps/app.xml"))
+    except (KeyError, etree.XMLSyntaxError):
+        return {}
+    values = {}
+    for name in ("Pages", "Words", "Characters", "CharactersWithSpaces", "Paragraphs"):
+        value = properties.findtext(f"{{{EXTENDED_PROPERTIES_NS}}}{name}")
+        try:
+            values[name] = int(value)
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def read_stats(path: Union[str, BinaryIO]) -> dict:
+    """Count the pages, words, characters, paragraphs, tables, images and sections of a .docx
+
+    ``word/document.xml`` is streamed and each top-level body element is
+    dropped once counted, as in read_preview. Everything except pages is
+    counted from the body, paragraphs in tables and text boxes included,
+    because ``docProps/app.xml`` is only refreshed by Word and keeps the
+    template's values in files written by other tools. Pages need a layout,
+    so they come from app.xml, raised to the page and section breaks found
+    in the body; without app.xml they are estimated from those breaks alone.
+    """
+    words = characters = characters_with_spaces = 0
+    paragraphs = tables = images = sections = 0
+    # Pages forced by breaks, a lower bound on the laid out page count
+    breaks = 0
+
+    with zipfile.ZipFile(path) as package:
+        declared = _extended_properties(package)
+        with package.open(main_document_part(package)) as stream:
+            for _, element in etree.iterparse(stream, events=("end",), tag=STREAMED_TAGS, huge_tree=True):
+                tag = element.tag
+                if tag == P:
+                    paragraphs += 1
+                    text = paragraph_text(element)
+                    words += len(text.split())
+                    characters_with_spaces += len(text)
+                    characters += len("".join(text.split()))
+                elif tag == TBL:
+                    tables += 1
+                elif tag == BLIP or tag == IMAGEDATA:
+                    images += 1
+                elif tag == BR:
+                    if element.get(BR_TYPE) == "page":
+                        breaks += 1
+                elif tag == PAGE_BREAK_BEFORE:
+                    if element.get(VAL) not in FALSE_VALUES and element.getparent().getparent().tag == P:
+                        breaks += 1
+                elif tag == SECT_PR:
+                    if element.getparent().tag == SECT_PR_CHANGE:
+                        continue
+                    # A section's type says how it starts, the first one always starts the document
+                    section_type = element.find(SECTION_TYPE)
+                    if sections and (section_type is None or section_type.get(VAL) != "continuous"):
+                        breaks += 1
+                    sections += 1
+
+                parent = element.getparent()
+                if parent is not None and parent.tag == BODY:
+                    # Free the finished element and everything before it
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del parent[0]
+
+    estimated = "Pages" not in declared
+    return {
+        "pages": max(declared.get("Pages", 0), breaks + 1),
+        "pages_estimated": estimated,
+        "words": words,
+        "characters": characters,
+        "characters_with_spaces": characters_with_spaces,
+        "paragraphs": paragraphs,
+        "tables": tables,
+        "images": images,
+        "sections": max(sections, 1),
+    }
+
+
+class StatsCache:
+    """Document statistics keyed on content hash
+
+    Each entry is a small JSON file in ``<upload_dir>/stats``, shared by the
+    API process and the workers, and the ``max_entries`` most recently used
+    are kept in memory. Content is immutable for a given hash, so entries
+    never go stale; they are only rewritten when STATS_VERSION changes.
+    """
+
+    def __init__(self, root: str, max_entries: int = STATS_CACHE_MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.root, f"{content_hash}.json")
+
+    def _remember(self, content_hash: str, stats: dict):
+        with self._lock:
+            self.entries[content_hash] = stats
+            self.entries.move_to_end(content_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get(self, content_hash: str) -> Optional[dict]:
+        with self._lock:
+            stats = self.entries.get(content_hash)
+            if stats is not None:
+                self.entries.move_to_end(content_hash)
+                return stats
+        try:
+            with open(self._path(content_hash)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("version") != STATS_VERSION:
+            return None
+        self._remember(content_hash, entry["stats"])
+        return entry["stats"]
+
+    def put(self, content_hash: str, stats: dict):
+        self._remember(content_hash, stats)
+        # Write beside the entry and rename, so readers never see a partial file
+        temp_path = os.path.join(self.root, f"{uuid.uuid4()}.part")
+        with open(temp_path, "w") as f:
+            json.dump({"version": STATS_VERSION, "stats": stats}, f)
+        os.replace(temp_path, self._path(content_hash))
+
+    def discard(self, content_hash: str):
+        with self._lock:
+            self.entries.pop(content_hash, None)
+        try:
+            os.remove(self._path(content_hash))
+        except FileNotFoundError:
+            pass
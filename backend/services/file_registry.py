@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+UPLOAD = "upload"
+FORMATTED = "formatted"
+
+# Where the registry database lives, by default registry.sqlite3 in the upload directory
+FILE_REGISTRY_PATH = os.getenv("FILE_REGISTRY_PATH", "")
+# SQLite journal mode; WAL needs shared memory, use DELETE when the registry is on a network filesystem
+FILE_REGISTRY_JOURNAL_MODE = os.getenv("FILE_REGISTRY_JOURNAL_MODE", "WAL").upper()
+JOURNAL_MODES = ("WAL", "DELETE", "TRUNCATE", "PERSIST")
+
+COLUMNS = ("file_id", "kind", "path", "filename", "size", "content_hash", "parent_id", "created_at", "accessed_at")
+
+
+class FileRecord:
+    """One registered file: an upload or a formatted output"""
+
+    __slots__ = COLUMNS
+
+    def __init__(self, file_id: str, kind: str, path: str, filename: Optional[str], size: int,
+                 content_hash: Optional[str], parent_id: Optional[str], created_at: float, accessed_at: float):
+        self.file_id = file_id
+        self.kind = kind
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.content_hash = content_hash
+        self.parent_id = parent_id
+        self.created_at = created_at
+        self.accessed_at = accessed_at
+
+    def to_dict(self) -> dict:
+        return {column: getattr(self, column) for column in COLUMNS}
+
+
+class FileRegistry:
+    """Index of every file_id in the upload directory
+
+    Maps a file_id to its kind, path, size, content hash, parent (the upload
+    a formatted output was made from) and timestamps, so finding a file is
+    one indexed query instead of probing the upload directory, and files can
+    be listed and filtered without scanning it. Paths are storage keys,
+    relative to the upload directory for the local backend.
+
+    It is a small SQLite database that the API process and the workers
+    share, by default in ``root``. Each thread keeps one connection open and
+    sets the journal mode once, when it connects. The blob
+    store keeps its aliases here as well, an upload's record is its alias.
+    Files stored before the registry existed are imported once, see
+    ``import_existing``.
+    """
+
+    def __init__(self, root: str, index_path: Optional[str] = None,
+                 journal_mode: str = FILE_REGISTRY_JOURNAL_MODE):
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal mode: {journal_mode}")
+        self.root = root
+        self.index_path = index_path or os.path.join(root, "registry.sqlite3")
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        with self.transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " file_id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " filename TEXT,"
+                " size INTEGER NOT NULL,"
+                " content_hash TEXT,"
+                " parent_id TEXT,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS files_kind_created ON files (kind, created_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS files_parent ON files (parent_id)")
+            db.execute("CREATE INDEX IF NOT EXISTS files_content_hash ON files (content_hash)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection, opened on first use"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            db.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction on this thread's connection
+
+        Nested calls join the transaction already open, so the blob store
+        can change blobs and records together.
+        """
+        db = self._connection()
+        if db.in_transaction:
+            yield db
+            return
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def select(self, sql: str, params: tuple = ()) -> list:
+        """Rows of a read query on this thread's connection"""
+        return self._connection().execute(sql, params).fetchall()
+
+    def register(self, file_id: str, kind: str, path: str, size: int, filename: Optional[str] = None,
+                 content_hash: Optional[str] = None, parent_id: Optional[str] = None,
+                 created_at: Optional[float] = None) -> FileRecord:
+        """Add or replace a file_id; ``path`` is a storage key or an absolute path under root"""
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.root)
+        now = time.time()
+        record = FileRecord(file_id, kind, path, filename, size, content_hash, parent_id,
+                            created_at if created_at is not None else now, now)
+        with self.transaction() as db:
+            db.execute(
+                f"INSERT OR REPLACE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                tuple(getattr(record, column) for column in COLUMNS),
+            )
+        return record
+
+    def get(self, file_id: str) -> Optional[FileRecord]:
+        rows = self.select(f"SELECT {', '.join(COLUMNS)} FROM files WHERE file_id = ?", (file_id,))
+        return FileRecord(*rows[0]) if rows else None
+
+    def touch(self, file_id: str):
+        """Record a use of the file, for least recently used eviction"""
+        with self.transaction() as db:
+            db.execute("UPDATE files SET accessed_at = ? WHERE file_id = ?", (time.time(), file_id))
+
+    def set_content_hash(self, file_id: str, content_hash: str):
+        with self.transaction() as db:
+            db.execute("UPDATE files SET content_hash = ? WHERE file_id = ?", (content_hash, file_id))
+
+    def remove(self, file_id: str) -> Optional[FileRecord]:
+        """Forget a file_id, returning its record"""
+        with self.transaction() as db:
+            row = db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+        return FileRecord(*row)
+
+    def clear(self) -> int:
+        """Forget every file, returning how many there were"""
+        with self.transaction() as db:
+            return db.execute("DELETE FROM files").rowcount
+
+    def search(self, kind: Optional[str] = None, parent_id: Optional[str] = None,
+               content_hash: Optional[str] = None, filename: Optional[str] = None,
+               created_after: Optional[float] = None, created_before: Optional[float] = None,
+               limit: int = 100, offset: int = 0) -> Tuple[int, List[FileRecord]]:
+        """Files matching every given filter, newest first, with the total number of matches
+
+        ``filename`` matches case-insensitively anywhere in the name.
+        """
+        conditions, params = [], []
+        for column, value in (("kind", kind), ("parent_id", parent_id), ("content_hash", content_hash)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if filename:
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            escaped = filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if created_after is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_after)
+        if created_before is not None:
+            conditions.append("created_at < ?")
+            params.append(created_before)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        total = self.select(f"SELECT COUNT(*) FROM files{where}", tuple(params))[0][0]
+        rows = self.select(
+            f"SELECT {', '.join(COLUMNS)} FROM files{where} ORDER BY created_at DESC, file_id LIMIT ? OFFSET ?",
+            tuple(params) + (limit, offset),
+        )
+        return total, [FileRecord(*row) for row in rows]
+
+    def least_recently_used(self, accessed_before: Optional[float] = None,
+                            batch_size: int = 500) -> Iterator[FileRecord]:
+        """Every file in order of last use, oldest first, optionally only those unused since a time
+
+        Reads in batches, so files can be removed while iterating.
+        """
+        condition = " AND accessed_at < ?" if accessed_before is not None else ""
+        extra = (accessed_before,) if accessed_before is not None else ()
+        last = (float("-inf"), "")
+        while True:
+            rows = self.select(
+                f"SELECT {', '.join(COLUMNS)} FROM files"
+                f" WHERE (accessed_at > ? OR (accessed_at = ? AND file_id > ?)){condition}"
+                " ORDER BY accessed_at, file_id LIMIT ?",
+                (last[0], last[0], last[1]) + extra + (batch_size,),
+            )
+            for row in rows:
+                yield FileRecord(*row)
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1][COLUMNS.index("accessed_at")], rows[-1][0])
+
+    def usage(self) -> Tuple[int, int]:
+        """Number of files and the bytes they take on disk
+
+        Uploads stored in the same place, such as aliases of one blob, count once.
+        """
+        files, size = self.select(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files WHERE kind != ?", (UPLOAD,)
+        )[0]
+        uploads = self.select("SELECT COUNT(*) FROM files WHERE kind = ?", (UPLOAD,))[0][0]
+        blob_size = self.select(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM files"
+            " WHERE kind = ? GROUP BY path)", (UPLOAD,)
+        )[0][0]
+        return files + uploads, size + blob_size
+
+    def import_existing(self, records: Iterable[dict]) -> int:
+        """Register files stored before the registry existed, once per registry
+
+        Later calls do nothing, so lookups never fall back to probing the
+        upload directory. Returns the number of files imported.
+        """
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key = 'imported'").fetchone():
+                return 0
+            imported = 0
+            for record in records:
+                path = record["path"]
+                if os.path.isabs(path):
+                    path = os.path.relpath(path, self.root)
+                created_at = record.get("created_at") or time.time()
+                cursor = db.execute(
+                    f"INSERT OR IGNORE INTO files ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    (record["file_id"], record["kind"], path, record.get("filename"), record["size"],
+                     record.get("content_hash"), record.get("parent_id"), created_at, created_at),
+                )
+                imported += cursor.rowcount
+            db.execute("INSERT INTO meta (key, value) VALUES ('imported', ?)", (str(time.time()),))
+        return imported
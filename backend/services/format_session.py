@@ -0,0 +1,303 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from models.formatting_options import FormattingOptions
+from services.document_cache import copy_document, estimate_document_size
+from services.document_processor import DocumentProcessor, document_processor
+from services.file_registry import UPLOAD
+from services.metrics import StageTimer, format_metrics
+from services.result_cache import canonical_options
+from services.storage import formatted_key
+from services.storage_janitor import StorageJanitor, storage_janitor
+from services.worker_pool import WorkerPool, worker_pool
+
+# Sessions idle for this many seconds are closed
+FORMAT_SESSION_TTL = int(os.getenv("FORMAT_SESSION_TTL", "900"))
+# Open sessions per process; the least recently used one is closed to make room
+FORMAT_SESSION_MAX = int(os.getenv("FORMAT_SESSION_MAX", "16"))
+# Estimated memory the open sessions may hold, least recently used ones are closed beyond it
+FORMAT_SESSION_MAX_BYTES = int(os.getenv("FORMAT_SESSION_MAX_BYTES", str(512 * 1024 * 1024)))  # 512MB
+
+
+def _section(name: str) -> Callable[[FormattingOptions], Optional[str]]:
+    def key(options: FormattingOptions) -> Optional[str]:
+        values = canonical_options(options).get(name)
+        return json.dumps(values, sort_keys=True) if values else None
+    return key
+
+
+def _coalesce_key(options: FormattingOptions) -> Optional[str]:
+    return "on" if options.cleanup and options.cleanup.normalize_formatting else None
+
+
+# The stages of DocumentProcessor._apply_formatting_multipass in order: the
+# options each one depends on (None when it has nothing to do) and how to run it
+STAGES: List[Tuple[str, Callable, Callable]] = [
+    ("clean_markdown", lambda options: "on",
+     lambda processor, doc, options: processor._clean_markdown_formatting(doc)),
+    ("text", _section("text"),
+     lambda processor, doc, options: processor._apply_text_formatting(doc, options.text)),
+    ("coalesce", _coalesce_key,
+     lambda processor, doc, options: processor._coalesce_document_runs(doc)),
+    ("paragraph", _section("paragraph"),
+     lambda processor, doc, options: processor._apply_paragraph_formatting(doc, options.paragraph)),
+    ("page", _section("page"),
+     lambda processor, doc, options: processor._apply_page_formatting(doc, options.page)),
+    ("structure", _section("structure"),
+     lambda processor, doc, options: processor._apply_structure_formatting(doc, options.structure)),
+    ("cleanup", _section("cleanup"),
+     lambda processor, doc, options: processor._apply_cleanup(doc, options.cleanup)),
+]
+
+
+class SessionNotFoundError(KeyError):
+    """Raised for an unknown or expired session id"""
+
+
+class FormatSession:
+    """One upload being formatted over and over with changing options
+
+    The parsed source and a copy of the document after every stage are kept,
+    so when options change only the stages from the first one whose options
+    differ are run again, on a copy of the checkpoint before it. The stages
+    run one after another as in _apply_formatting_multipass, whose output
+    the single-traversal engine matches, so a session produces the same
+    document as POST /api/format.
+    """
+
+    def __init__(self, processor: DocumentProcessor, file_id: str):
+        record = processor.registry.get(file_id)
+        if record is None or record.kind != UPLOAD:
+            raise FileNotFoundError(f"File not found: {file_id}")
+        self.session_id = str(uuid.uuid4())
+        self.processor = processor
+        self.file_id = file_id
+        self.result_file_id: Optional[str] = None
+        self.last_used = time.monotonic()
+        self.closed = False
+        self._lock = threading.Lock()
+
+        # The source stays open for the lifetime of the session, outputs copy members from it
+        path = processor.storage.local_path(record.path)
+        self.source = path if path is not None else processor.storage.open(record.path)
+        # What one parsed copy costs: its XML, media stay in the package or are shared by copies
+        self.document_bytes = estimate_document_size(self.source, lazy_media=True)
+        if path is None:
+            self.source.seek(0)
+        self.source_size = record.size
+        self.base = None
+        self.document: Optional[dict] = None
+        # (stage key, document after the stage) for the stages run so far
+        self.checkpoints: List[Tuple[Optional[str], object]] = []
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory held by the parsed source and the checkpoints"""
+        held = {id(doc) for _, doc in self.checkpoints if doc is not None}
+        if self.base is not None:
+            held.add(id(self.base))
+        return self.document_bytes * len(held)
+
+    def format(self, options: FormattingOptions, report: dict) -> str:
+        """Format with ``options``, re-running only the stages whose options changed
+
+        ``report`` gets the seconds spent per stage, the names of the stages
+        that were run and reused and the size of the source. Returns the
+        file_id of the output.
+        """
+        with self._lock:
+            try:
+                if self.closed:
+                    raise SessionNotFoundError(self.session_id)
+                return self._format(options, report)
+            finally:
+                # Closed while formatting, the memory is freed now that the format is done
+                if self.closed:
+                    self._release()
+
+    def _format(self, options: FormattingOptions, report: dict) -> str:
+        timer = StageTimer()
+        if self.base is None:
+            with timer.span("load"):
+                self.base = self.processor.load_document(self.source)
+            body = self.base.element.body
+            self.document = {
+                "bytes": self.source_size,
+                "paragraphs": len(body.xpath(".//w:p")),
+                "runs": len(body.xpath(".//w:r")),
+            }
+        report["document"] = self.document
+
+        keys = [key(options) for _, key, _ in STAGES]
+        start = 0
+        while start < len(self.checkpoints) and self.checkpoints[start][0] == keys[start]:
+            start += 1
+        report["reused"] = [name for name, _, _ in STAGES[:start]]
+        report["rerun"] = []
+        if start == len(STAGES) and self.result_file_id is not None:
+            report["stages"] = timer.stages
+            return self.result_file_id
+
+        # The session only changes once the new output is saved, a failed attempt leaves it as it was
+        checkpoints = self.checkpoints[:start]
+        with timer.span("checkpoint"):
+            doc = copy_document(checkpoints[-1][1] if checkpoints else self.base)
+        last = len(STAGES) - 1
+        for index in range(start, len(STAGES)):
+            name, _, apply = STAGES[index]
+            if keys[index] is None:
+                # Nothing ran, the previous state is this stage's state as well
+                snapshot = checkpoints[-1][1] if checkpoints else self.base
+            else:
+                with timer.span(name):
+                    apply(self.processor, doc, options)
+                report["rerun"].append(name)
+                # After the last stage there is nothing left to resume from
+                snapshot = None
+                if index < last:
+                    with timer.span("checkpoint"):
+                        snapshot = copy_document(doc)
+            checkpoints.append((keys[index], snapshot))
+
+        with timer.span("save"):
+            formatted_file_id = self.processor.save_formatted(doc, self.source)
+        try:
+            self.processor.register_formatted(formatted_file_id, self.file_id)
+        except BaseException:
+            self.processor.storage.delete(formatted_key(formatted_file_id))
+            raise
+        self.processor.registry.touch(self.file_id)
+
+        self.checkpoints = checkpoints
+        self.result_file_id = formatted_file_id
+        report["stages"] = timer.stages
+        return formatted_file_id
+
+    def close(self):
+        """Free the session's memory, or have the format running on it do so when it finishes"""
+        self.closed = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._release()
+            finally:
+                self._lock.release()
+
+    def _release(self):
+        self.checkpoints = []
+        self.base = None
+        if not isinstance(self.source, str):
+            self.source.close()
+
+
+class FormatSessionManager:
+    """Open format sessions of this process
+
+    Sessions hold parsed documents in memory, so they live in the API
+    process and work on its threads, taking a slot of the worker pool like
+    any format request; with several replicas, requests of one session must
+    reach the same one. Idle sessions are closed after ``ttl`` seconds, at
+    most ``max_sessions`` are kept, and the least recently used ones are
+    closed while all of them hold more than ``max_bytes``, though never the
+    one just used. The source of an open session is pinned against the
+    storage janitor.
+    """
+
+    def __init__(self, processor: DocumentProcessor = document_processor,
+                 janitor: StorageJanitor = storage_janitor, pool: WorkerPool = worker_pool,
+                 ttl: int = FORMAT_SESSION_TTL, max_sessions: int = FORMAT_SESSION_MAX,
+                 max_bytes: int = FORMAT_SESSION_MAX_BYTES):
+        self.processor = processor
+        self.janitor = janitor
+        self.pool = pool
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self.max_bytes = max_bytes
+        self.sessions: "OrderedDict[str, FormatSession]" = OrderedDict()
+        self.created = 0
+        self.stages_run = 0
+        self.stages_reused = 0
+
+    async def open(self, file_id: str, options: FormattingOptions, report: dict) -> FormatSession:
+        """Start a session for an upload and format it a first time"""
+        self._prune()
+        session = await self.pool.run(FormatSession, self.processor, file_id, in_process=True)
+        self.janitor.pin(file_id)
+        self.sessions[session.session_id] = session
+        self.created += 1
+        while len(self.sessions) > self.max_sessions:
+            self._close(next(iter(self.sessions)))
+        try:
+            await self.format(session.session_id, options, report)
+        except BaseException:
+            if session.session_id in self.sessions:
+                self._close(session.session_id)
+            raise
+        return session
+
+    def get(self, session_id: str) -> FormatSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise SessionNotFoundError(session_id)
+        return session
+
+    async def format(self, session_id: str, options: FormattingOptions, report: dict) -> FormatSession:
+        """Format a session's upload with new options, the new output's file_id goes to ``report``"""
+        self._prune()
+        session = self.get(session_id)
+        self.sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        started = time.perf_counter()
+        # Also pinned while formatting, a session closed meanwhile still finishes its format
+        with self.janitor.in_use(session.file_id):
+            report["result_file_id"] = await self.pool.run(session.format, options, report, in_process=True)
+        report["total"] = time.perf_counter() - started
+        format_metrics.observe(report, "session")
+        self.stages_run += len(report["rerun"])
+        self.stages_reused += len(report["reused"])
+        self._shrink(session)
+        return session
+
+    def close(self, session_id: str):
+        self.get(session_id)
+        self._close(session_id)
+
+    def _close(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        self.janitor.unpin(session.file_id)
+        session.close()
+
+    def _shrink(self, current: FormatSession):
+        """Close least recently used sessions while the open ones hold more than max_bytes"""
+        held = sum(session.memory_bytes for session in self.sessions.values())
+        for session_id, session in list(self.sessions.items()):
+            if held <= self.max_bytes:
+                break
+            if session is not current:
+                held -= session.memory_bytes
+                self._close(session_id)
+
+    def _prune(self):
+        """Close sessions idle for longer than the TTL"""
+        cutoff = time.monotonic() - self.ttl
+        for session_id in [key for key, session in self.sessions.items() if session.last_used < cutoff]:
+            self._close(session_id)
+
+    def stats(self) -> dict:
+        self._prune()
+        return {
+            "open": len(self.sessions),
+            "bytes": sum(session.memory_bytes for session in self.sessions.values()),
+            "max_bytes": self.max_bytes,
+            "created": self.created,
+            "stages_run": self.stages_run,
+            "stages_reused": self.stages_reused,
+        }
+
+
+# Singleton instance
+format_sessions = FormatSessionManager()
@@ -0,0 +1,237 @@
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from docx import Document
+
+from models.formatting_options import FormattingOptions
+from services.story_traversal import body_paragraphs, paragraph_runs, story_paragraphs
+from services.style_index import StyleIndex
+
+
+class RunStep:
+    """A group of consecutive run-level operations applied in one loop over the runs"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.ops: List[Callable] = []
+
+    def __call__(self, paragraph) -> bool:
+        for run in paragraph_runs(paragraph):
+            for op in self.ops:
+                op(run)
+        return True
+
+
+class FormattingPlan:
+    """Ordered per-paragraph and per-run operations compiled from FormattingOptions"""
+
+    def __init__(self, options: FormattingOptions):
+        self.options = options
+        # (stage, step) pairs for body paragraphs; a step returning False removed the paragraph
+        self.steps: List[Tuple[str, Callable]] = []
+        # Steps that still apply to paragraphs created by the TOC (the cleanup stage)
+        self.post_toc_steps: List[Tuple[str, Callable]] = []
+        # (stage, op) pairs applied to the whole document before the traversal
+        self.document_ops: List[Tuple[str, Callable]] = []
+        # Steps for table cell paragraphs in every story, and for the paragraphs
+        # of headers, footers, notes and text boxes
+        self.cell_steps: List[Tuple[str, Callable]] = []
+        self.story_steps: List[Tuple[str, Callable]] = []
+        # Steps for both of those once the page stage has run (the cleanup stage)
+        self.post_page_steps: List[Tuple[str, Callable]] = []
+        self.create_toc = False
+
+        # Seconds spent per stage while the plan was applied
+        self.timings: Dict[str, float] = {}
+
+        # Traversal state
+        self.prev_blank = False
+        self.first_text: Optional[str] = None
+        self.seen_first = False
+        self.style_index: Optional[StyleIndex] = None
+        self.headings: list = []
+
+    def add_paragraph_op(self, stage: str, op: Callable, steps: Optional[list] = None):
+        (self.steps if steps is None else steps).append((stage, op))
+
+    def add_run_op(self, stage: str, op: Callable, steps: Optional[list] = None):
+        steps = self.steps if steps is None else steps
+        if not steps or not isinstance(steps[-1][1], RunStep) or steps[-1][0] != stage:
+            steps.append((stage, RunStep(stage)))
+        steps[-1][1].ops.append(op)
+
+    def index_styles(self, doc: Document, style_mappings):
+        self.style_index = StyleIndex.for_document(doc, style_mappings)
+
+    def add_time(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+
+class FormattingEngine:
+    """Applies every enabled formatting stage in a single traversal of the body
+
+    The result is identical to running the DocumentProcessor stages one after
+    another, because each operation only depends on the paragraph or run it is
+    given, and the two document-wide steps (blank line removal and the table of
+    contents) carry the state they need through the traversal. Table cells and
+    the other stories are visited once before the page stage and, for the
+    cleanup stage, once after it, since the page stage rewrites headers and
+    footers.
+    """
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def compile(self, options: FormattingOptions) -> FormattingPlan:
+        """Compile the enabled option sections into an ordered plan"""
+        processor = self.processor
+        plan = FormattingPlan(options)
+
+        # IMPORTANT: markdown cleaning always runs first
+        for steps in (plan.steps, plan.cell_steps, plan.story_steps):
+            plan.add_paragraph_op("clean_markdown", processor._clean_markdown_paragraph, steps)
+
+        if options.text and options.text.apply_to_styles:
+            text = options.text
+            conflicts = processor._run_property_conflicts(processor._text_style_template(text, table=True))
+            run_template = processor._text_style_run_template(text)
+            plan.document_ops.append(("text", lambda doc: processor._apply_text_styles(doc, text)))
+            plan.add_run_op("text", lambda run: processor._strip_run_properties(run, conflicts))
+            plan.add_run_op("text", run_template.apply_to_run)
+            plan.add_paragraph_op("text", processor._text_paragraph_template(text).apply_to_paragraph)
+            plan.add_run_op(
+                "text", lambda run: processor._strip_run_properties(run, conflicts), plan.cell_steps
+            )
+            plan.add_run_op(
+                "text", lambda run: processor._strip_run_properties(run, conflicts), plan.story_steps
+            )
+            plan.add_run_op("text", run_template.apply_to_run, plan.story_steps)
+        elif options.text:
+            # rPr and pPr templates are built once and merged into every element
+            run_template = processor._text_run_template(options.text)
+            table_template = processor._text_run_template(options.text, table=True)
+            plan.add_run_op("text", run_template.apply_to_run)
+            plan.add_paragraph_op("text", processor._text_paragraph_template(options.text).apply_to_paragraph)
+            plan.add_run_op("text", table_template.apply_to_run, plan.cell_steps)
+            plan.add_run_op("text", run_template.apply_to_run, plan.story_steps)
+
+        if options.cleanup and options.cleanup.normalize_formatting:
+            # Runs are merged once they have their final text formatting
+            for steps in (plan.steps, plan.cell_steps, plan.story_steps):
+                plan.add_paragraph_op("cleanup", processor._coalesce_runs, steps)
+
+        if options.paragraph:
+            paragraph_options = options.paragraph
+            paragraph_template = processor._paragraph_template(
+                lambda paragraph: processor._format_paragraph(paragraph, paragraph_options)
+            )
+            plan.add_paragraph_op("paragraph", paragraph_template.apply_to_paragraph)
+            if paragraph_options.remove_extra_spaces:
+                for steps in (plan.steps, plan.cell_steps, plan.story_steps):
+                    plan.add_run_op("paragraph", processor._remove_extra_spaces_run, steps)
+            if paragraph_options.remove_blank_lines:
+                plan.add_paragraph_op(
+                    "paragraph", lambda paragraph: self._remove_blank_line(plan, paragraph)
+                )
+
+        if options.structure and processor._wants_heading_normalization(options.structure):
+            structure = options.structure
+            heading_config, style_mappings = processor._heading_settings(structure)
+            plan.document_ops.append(("structure", lambda doc: plan.index_styles(doc, style_mappings)))
+            plan.add_paragraph_op(
+                "structure",
+                lambda paragraph: processor._normalize_heading(
+                    paragraph, structure, heading_config, plan.style_index
+                )
+            )
+            if structure.create_toc:
+                plan.create_toc = True
+                plan.add_paragraph_op("structure", lambda paragraph: self._record_toc_facts(plan, paragraph))
+
+        if options.cleanup:
+            cleanup = options.cleanup
+            reset_font = processor._run_template(processor._reset_run_font)
+            for steps in (plan.steps, plan.post_toc_steps, plan.post_page_steps):
+                if cleanup.remove_inconsistent_fonts and cleanup.normalize_formatting:
+                    plan.add_run_op("cleanup", reset_font.apply_to_run, steps)
+                if cleanup.clean_copied_text:
+                    plan.add_run_op("cleanup", processor._remove_extra_spaces_run, steps)
+                # Alignment is only fixed in the body
+                if cleanup.fix_alignment_issues and steps is not plan.post_page_steps:
+                    plan.add_paragraph_op("cleanup", processor._fix_alignment, steps)
+
+        return plan
+
+    def apply(self, doc: Document, plan: FormattingPlan):
+        """Apply a compiled plan to the document in one pass over the body
+
+        Time spent in each stage is accumulated in ``plan.timings``.
+        """
+        for stage, op in plan.document_ops:
+            start = time.perf_counter()
+            op(doc)
+            plan.add_time(stage, time.perf_counter() - start)
+
+        # The list is a snapshot, steps may remove the paragraph they are given
+        for paragraph in body_paragraphs(doc):
+            self._apply_steps(paragraph, plan.steps, plan)
+
+        if plan.cell_steps or plan.story_steps:
+            self._apply_to_stories(doc, plan.cell_steps, plan.story_steps, plan)
+
+        if plan.options.page:
+            start = time.perf_counter()
+            self.processor._apply_page_formatting(doc, plan.options.page)
+            plan.add_time("page", time.perf_counter() - start)
+
+        if plan.create_toc:
+            start = time.perf_counter()
+            created = self.processor._insert_table_of_contents(doc, plan.first_text, plan.headings)
+            plan.add_time("structure", time.perf_counter() - start)
+            for paragraph in created:
+                self._apply_steps(paragraph, plan.post_toc_steps, plan)
+
+        if plan.post_page_steps:
+            self._apply_to_stories(doc, plan.post_page_steps, plan.post_page_steps, plan)
+
+    def _apply_steps(self, paragraph, steps: list, plan: FormattingPlan):
+        timings = plan.timings
+        for stage, step in steps:
+            start = time.perf_counter()
+            kept = step(paragraph)
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+            if kept is False:
+                return
+
+    def _apply_to_stories(self, doc: Document, cell_steps: list, story_steps: list, plan: FormattingPlan):
+        """Apply steps to every paragraph outside the top level of the body"""
+        cells, others = story_paragraphs(doc)
+        for paragraph in cells:
+            self._apply_steps(paragraph, cell_steps, plan)
+        for paragraph in others:
+            self._apply_steps(paragraph, story_steps, plan)
+
+    def _remove_blank_line(self, plan: FormattingPlan, paragraph) -> bool:
+        """Remove a blank paragraph that follows another blank paragraph"""
+        is_blank = not paragraph.text.strip()
+        remove = is_blank and plan.prev_blank
+        plan.prev_blank = is_blank
+
+        if remove:
+            try:
+                p = paragraph._element
+                p.getparent().remove(p)
+                return False
+            except Exception:
+                pass
+        return True
+
+    def _record_toc_facts(self, plan: FormattingPlan, paragraph) -> bool:
+        """Record what the TOC step needs once a paragraph has its final style"""
+        if not plan.seen_first:
+            plan.seen_first = True
+            plan.first_text = paragraph.text.strip()
+
+        if self.processor._is_toc_heading(paragraph, plan.style_index):
+            plan.headings.append(paragraph)
+        return True
@@ -0,0 +1,54 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping
+
+# Cache-Control of downloads; a file_id always names the same content
+DOWNLOAD_CACHE_CONTROL = os.getenv("DOWNLOAD_CACHE_CONTROL", "private, max-age=86400")
+
+
+def strong_etag(content_hash: str) -> str:
+    return f'"{content_hash}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    """The quoted tag without a weak prefix, for the weak comparison of If-None-Match"""
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header value names ``etag``"""
+    if if_none_match.strip() == "*":
+        return True
+    target = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == target for candidate in if_none_match.split(","))
+
+
+def not_modified(headers: Mapping[str, str], etag: str, mtime: float) -> bool:
+    """Whether a conditional GET can be answered with 304 Not Modified
+
+    If-None-Match takes precedence; If-Modified-Since is only looked at
+    when the request has no If-None-Match, as RFC 9110 asks.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have whole seconds
+    return int(mtime) <= since
+
+
+def validator_headers(etag: str, mtime: float) -> dict:
+    """ETag, Last-Modified and Cache-Control sent with a download and its 304"""
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+    }
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from models.formatting_options import FormattingOptions, JobStatus, JobResponse
+from services.document_processor import document_processor
+from services.result_cache import format_document_cached
+from services.worker_pool import WorkerPool, worker_pool
+
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+
+FINISHED_STATUSES = {JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED}
+
+
+class JobNotFoundError(KeyError):
+    """Raised for an unknown or expired job id"""
+
+
+class JobFinishedError(Exception):
+    """Raised when cancelling a job that has already finished"""
+
+
+class Job:
+    """A format request running in the background"""
+
+    def __init__(self, file_id: str, options: FormattingOptions):
+        self.job_id = str(uuid.uuid4())
+        self.file_id = file_id
+        self.options = options
+        self.status = JobStatus.QUEUED
+        self.result_file_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._finished_monotonic: Optional[float] = None
+
+    def finish(self, status: JobStatus, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now(timezone.utc)
+        self._finished_monotonic = time.monotonic()
+
+    def to_response(self) -> JobResponse:
+        return JobResponse(
+            job_id=self.job_id,
+            status=self.status,
+            file_id=self.file_id,
+            result_file_id=self.result_file_id,
+            formatted_filename=(
+                f"{self.result_file_id}_formatted.docx" if self.result_file_id else None
+            ),
+            error=self.error,
+            created_at=self.created_at,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+        )
+
+
+class JobManager:
+    """Runs DocumentProcessor.format_document as pollable, cancellable background jobs
+
+    Jobs share the worker pool with synchronous requests. A queued job is
+    cancelled by leaving the queue; a running job cannot be interrupted
+    inside python-docx, so it is marked cancelled immediately and its output
+    is deleted as soon as the worker returns.
+    """
+
+    def __init__(self, pool: WorkerPool = worker_pool, ttl: int = JOB_TTL):
+        self.pool = pool
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+
+    def submit(self, file_id: str, options: FormattingOptions) -> Job:
+        """Queue a format job, raising PoolSaturatedError if the pool has no room"""
+        self._prune()
+        self.pool.ensure_capacity()
+
+        job = Job(file_id, options)
+        self.jobs[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(job_id)
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """Cancel a queued or running job"""
+        job = self.get(job_id)
+        if job.status in FINISHED_STATUSES:
+            raise JobFinishedError(job_id)
+
+        if job.status == JobStatus.QUEUED and job.task is not None:
+            job.task.cancel()
+        job.finish(JobStatus.CANCELLED)
+        return job
+
+    async def _run(self, job: Job):
+        def mark_running():
+            if job.status == JobStatus.QUEUED:
+                job.status = JobStatus.RUNNING
+                job.started_at = datetime.now(timezone.utc)
+
+        try:
+            result_file_id = await format_document_cached(
+                job.file_id, job.options, self.pool, wait=True, on_start=mark_running
+            )
+        except asyncio.CancelledError:
+            return
+        except FileNotFoundError:
+            if job.status != JobStatus.CANCELLED:
+                job.finish(JobStatus.FAILED, "Document not found")
+            return
+        except Exception as e:
+            if job.status != JobStatus.CANCELLED:
+                job.finish(JobStatus.FAILED, f"Failed to format document: {str(e)}")
+            return
+
+        if job.status == JobStatus.CANCELLED:
+            # Cancelled while running, the output is no longer wanted
+            await asyncio.to_thread(document_processor.delete_file, result_file_id)
+            return
+
+        job.result_file_id = result_file_id
+        job.finish(JobStatus.DONE)
+
+    def _prune(self):
+        """Forget finished jobs older than the TTL"""
+        cutoff = time.monotonic() - self.ttl
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job._finished_monotonic is not None and job._finished_monotonic < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def stats(self) -> dict:
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self.jobs.values():
+            counts[job.status.value] += 1
+        return counts
+
+
+# Singleton instance
+job_manager = JobManager()
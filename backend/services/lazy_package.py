@@ -0,0 +1,132 @@
+import zipfile
+from typing import BinaryIO, Union
+
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.package import Unmarshaller
+from docx.opc.packuri import PACKAGE_URI
+from docx.opc.part import PartFactory, XmlPart
+from docx.opc.phys_pkg import _ZipPkgReader
+from docx.opc.pkgreader import PackageReader, _ContentTypeMap
+from docx.package import Package
+
+# Parts python-docx loads as opaque blobs that hold a story worth formatting
+STORY_CONTENT_TYPES = frozenset((CT.WML_FOOTNOTES, CT.WML_ENDNOTES))
+
+
+class SourceChangedError(RuntimeError):
+    """Raised when a lazily loaded member no longer matches its source package"""
+
+
+class LazyBlob:
+    """A package member left in the source zip until its bytes are needed
+
+    Stands in for the bytes python-docx keeps as the blob of binary parts.
+    The package writer copies it straight from the source, so formatting a
+    document never reads its images into memory. Deep copies share it,
+    the member it refers to does not change.
+    """
+
+    __slots__ = ("path", "info")
+
+    def __init__(self, path: str, info: zipfile.ZipInfo):
+        self.path = path
+        self.info = info
+
+    def __len__(self):
+        return self.info.file_size
+
+    def __bool__(self):
+        return True
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def read(self) -> bytes:
+        with zipfile.ZipFile(self.path) as package:
+            try:
+                info = package.getinfo(self.info.filename)
+            except KeyError:
+                info = None
+            if info is None or (info.CRC, info.file_size) != (self.info.CRC, self.info.file_size):
+                raise SourceChangedError(f"{self.info.filename} changed in {self.path}")
+            return package.read(info)
+
+
+def is_lazy_content_type(content_type: str) -> bool:
+    """Binary parts, which python-docx never parses, can stay in the zip"""
+    return not (content_type.endswith("+xml") or content_type.endswith("/xml"))
+
+
+class _LazyZipPkgReader(_ZipPkgReader):
+    """python-docx's zip reader, handing out LazyBlob for binary parts"""
+
+    def __new__(cls, path: str):
+        # PhysPkgReader.__new__ picks the reader class from its argument
+        return object.__new__(cls)
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.path = path
+        self.content_types = None
+
+    def blob_for(self, pack_uri):
+        if self.content_types is not None:
+            try:
+                content_type = self.content_types[pack_uri]
+            except KeyError:
+                content_type = None
+            if content_type is not None and is_lazy_content_type(content_type):
+                return LazyBlob(self.path, self._zipf.getinfo(pack_uri.membername))
+        return super().blob_for(pack_uri)
+
+
+def story_part_factory(partname, content_type, reltype, blob, package):
+    """python-docx's PartFactory, except footnotes and endnotes load as XML parts
+
+    Their paragraphs can then be formatted like any other and are saved
+    back. Only documents opened with ``open_document`` get them, python-docx
+    itself is left unchanged.
+    """
+    if content_type in STORY_CONTENT_TYPES and content_type not in PartFactory.part_type_for:
+        return XmlPart.load(partname, content_type, blob, package)
+    return PartFactory(partname, content_type, reltype, blob, package)
+
+
+def open_document(source: Union[str, BinaryIO], lazy_media: bool = True):
+    """``Document(source)`` for the formatter: footnotes and endnotes are parsed, images stay in the zip
+
+    With ``lazy_media`` and a path, only the XML parts are read and parsed,
+    so memory follows the XML size of the package rather than its total
+    size. Binary parts get a LazyBlob as their blob; save through
+    services.package_writer.save_document, or call load_blobs first for
+    anything that needs the bytes. Streams are read whole.
+    """
+    if isinstance(source, str) and lazy_media:
+        # The steps of PackageReader.from_file with a lazy zip reader
+        phys_reader = _LazyZipPkgReader(source)
+        try:
+            content_types = _ContentTypeMap.from_xml(phys_reader.content_types_xml)
+            phys_reader.content_types = content_types
+            pkg_srels = PackageReader._srels_for(phys_reader, PACKAGE_URI)
+            sparts = PackageReader._load_serialized_parts(phys_reader, pkg_srels, content_types)
+        finally:
+            phys_reader.close()
+        pkg_reader = PackageReader(content_types, pkg_srels, sparts)
+    else:
+        pkg_reader = PackageReader.from_file(source)
+
+    # The steps of Package.open with the story part factory
+    package = Package()
+    Unmarshaller.unmarshal(pkg_reader, package, story_part_factory)
+    document_part = package.main_document_part
+    if document_part.content_type != CT.WML_DOCUMENT_MAIN:
+        raise ValueError(f"file '{source}' is not a Word file, content type is '{document_part.content_type}'")
+    return document_part.document
+
+
+def load_blobs(doc):
+    """Read every LazyBlob of a document, so python-docx can use it as usual"""
+    for part in doc.part.package.iter_parts():
+        blob = getattr(part, "_blob", None)
+        if isinstance(blob, LazyBlob):
+            part._blob = blob.read()
@@ -0,0 +1,221 @@
+import re
+import weakref
+from typing import List, Optional, Tuple
+
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml.ns import qn
+
+from services.story_traversal import PARAGRAPH_RUNS
+
+BODY_TAG = qn('w:body')
+P_TAG = qn('w:p')
+PPR_TAG = qn('w:pPr')
+T_TAG = qn('w:t')
+BR_TAG = qn('w:br')
+BR_TYPE = qn('w:type')
+XML_SPACE = qn('xml:space')
+
+# Text equivalents of non-text run content, as python-docx's Run.text renders them
+RUN_CONTENT_TEXT = {
+    qn('w:tab'): "\t",
+    qn('w:ptab'): "\t",
+    qn('w:cr'): "\n",
+    qn('w:noBreakHyphen'): "-",
+}
+
+# Inline passes in the order the per-run implementation applied them, each
+# guarded by the marker character it needs so most paragraphs skip them all
+INLINE_PASSES = [
+    ("*", re.compile(r'^\*\*(.+?)\*\*$')),
+    ("*", re.compile(r'\*\*(.+?)\*\*')),
+    ("*", re.compile(r'\*(.+?)\*')),
+    ("_", re.compile(r'_(.+?)_')),
+    ("~", re.compile(r'~~(.+?)~~')),
+    ("`", re.compile(r'`(.+?)`')),
+]
+MARKER_CHARS = frozenset("*_~`")
+
+# Bold wrapping removed from heading text
+HEADING_PASSES = [
+    re.compile(r'^\*\*(.+?)\*\*:?$'),
+    re.compile(r'^\*\*(.+?)\*\*'),
+]
+HEADING_PREFIXES = [("###", 3), ("##", 2), ("# ", 1)]
+
+HORIZONTAL_RULE = re.compile(r'^[\-_*]{3,}$')
+REMOVED_TEXTS = {'', '---', '___', '***'}
+
+
+class Segment:
+    """A piece of paragraph text and the element it came from"""
+
+    __slots__ = ("element", "start", "end", "is_text")
+
+    def __init__(self, element, start: int, end: int, is_text: bool):
+        self.element = element
+        self.start = start
+        self.end = end
+        self.is_text = is_text
+
+
+def _content_text(child) -> Optional[str]:
+    """Text equivalent of one run child, None for children without text"""
+    if child.tag == T_TAG:
+        return child.text or ""
+    if child.tag == BR_TAG:
+        return "\n" if child.get(BR_TYPE, "textWrapping") == "textWrapping" else None
+    return RUN_CONTENT_TEXT.get(child.tag)
+
+
+def paragraph_segments(p) -> Tuple[str, List[Segment]]:
+    """Paragraph text, as Paragraph.text builds it, with the element behind each character"""
+    segments = []
+    parts = []
+    position = 0
+    for r in PARAGRAPH_RUNS(p):
+        for child in r:
+            text = _content_text(child)
+            if not text:
+                continue
+            segments.append(Segment(child, position, position + len(text), child.tag == T_TAG))
+            parts.append(text)
+            position += len(text)
+    return "".join(parts), segments
+
+
+def _strip_markers(pattern, text: str, index: List[int]) -> Tuple[str, List[int]]:
+    """Keep only group 1 of every match, carrying the original positions along"""
+    pieces = []
+    kept = []
+    last = 0
+    for match in pattern.finditer(text):
+        pieces.append(text[last:match.start()])
+        kept.extend(index[last:match.start()])
+        pieces.append(match.group(1))
+        kept.extend(index[match.start(1):match.end(1)])
+        last = match.end()
+    if last == 0 and not pieces:
+        return text, index
+    pieces.append(text[last:])
+    kept.extend(index[last:])
+    return "".join(pieces), kept
+
+
+def _apply_deletions(segments: List[Segment], length: int, kept: List[int]):
+    """Remove every character not in ``kept`` from the elements that hold it
+
+    Segments without a removed character are not touched at all, so runs the
+    cleaning did not change keep their exact XML.
+    """
+    deleted = bytearray(b"\x01") * length
+    for position in kept:
+        deleted[position] = 0
+
+    for segment in segments:
+        if not any(deleted[segment.start:segment.end]):
+            continue
+        element = segment.element
+        if not segment.is_text:
+            element.getparent().remove(element)
+            continue
+        text = element.text or ""
+        new_text = "".join(
+            char for offset, char in enumerate(text) if not deleted[segment.start + offset]
+        )
+        element.text = new_text
+        if new_text and (new_text[0].isspace() or new_text[-1].isspace()):
+            element.set(XML_SPACE, "preserve")
+
+
+# Heading style ids per document part, looking a style up by name scans every style
+_heading_style_ids = weakref.WeakKeyDictionary()
+
+
+def _heading_style_id(paragraph, level: int) -> Optional[str]:
+    """Style id of 'Heading <level>' in the paragraph's document, None if it has none"""
+    part = paragraph.part
+    style_ids = _heading_style_ids.setdefault(part, {})
+    if level not in style_ids:
+        try:
+            style_ids[level] = part.get_style_id(f'Heading {level}', WD_STYLE_TYPE.PARAGRAPH)
+        except:
+            style_ids[level] = None
+    return style_ids[level]
+
+
+def heading_level(stripped: str) -> Tuple[int, int]:
+    """Heading level of a markdown heading line and the length of its prefix, (0, 0) if none"""
+    for prefix, level in HEADING_PREFIXES:
+        if stripped.startswith(prefix):
+            return level, len(prefix)
+    return 0, 0
+
+
+def _remove_paragraph(p) -> bool:
+    """Remove a paragraph, returning False, or empty it when its container needs it
+
+    Table cells, text boxes, headers, footers and notes must end with a
+    paragraph, so the last one there keeps its properties and loses its content.
+    """
+    parent = p.getparent()
+    if parent.tag != BODY_TAG and not any(sibling.tag == P_TAG for sibling in p.itersiblings()):
+        for child in list(p):
+            if child.tag != PPR_TAG:
+                p.remove(child)
+        return True
+    parent.remove(p)
+    return False
+
+
+def clean_paragraph(paragraph) -> bool:
+    """Clean markdown from one paragraph, returning False if it was removed
+
+    Markers are found on the text of the whole paragraph, so ``**bold**``
+    is cleaned even when its markers and text sit in different runs. Only
+    the marker characters are deleted from the runs that hold them.
+    """
+    p = paragraph._p
+    text, segments = paragraph_segments(p)
+    stripped = text.strip()
+
+    # Skip empty paragraphs
+    if not stripped:
+        return True
+
+    if HORIZONTAL_RULE.match(stripped):
+        return _remove_paragraph(p)
+
+    # Markdown headings become Word headings
+    level, prefix_length = heading_level(stripped)
+    if level:
+        start = len(text) - len(text.lstrip()) + prefix_length
+        end = len(text.rstrip())
+        body = text[start:end]
+        body_start = start + len(body) - len(body.lstrip())
+        body_end = start + len(body.rstrip())
+        current, index = text[body_start:body_end], list(range(body_start, body_end))
+        for pattern in HEADING_PASSES:
+            current, index = _strip_markers(pattern, current, index)
+        _apply_deletions(segments, len(text), index)
+
+        style_id = _heading_style_id(paragraph, level)
+        if style_id is not None:
+            p.style = style_id
+        return True
+
+    if MARKER_CHARS.isdisjoint(text):
+        return True
+
+    current, index = text, list(range(len(text)))
+    for marker, pattern in INLINE_PASSES:
+        if marker in current:
+            current, index = _strip_markers(pattern, current, index)
+
+    if len(index) != len(text):
+        _apply_deletions(segments, len(text), index)
+
+    # Remove paragraphs that are now empty
+    if current.strip() in REMOVED_TEXTS:
+        return _remove_paragraph(p)
+
+    return True
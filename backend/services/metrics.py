@@ -0,0 +1,137 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Histogram buckets per unit
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+BYTES_BUCKETS = [16 * 1024 * 4 ** i for i in range(8)]  # 16KB .. 256MB
+COUNT_BUCKETS = [10, 100, 1000, 10000, 100000, 1000000]
+
+
+class StageTimer:
+    """Accumulates wall time per named stage of one operation"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+def server_timing(stages: Dict[str, float]) -> str:
+    """Format stage durations as a Server-Timing header value"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items())
+
+
+def prometheus_number(value: float) -> str:
+    """A sample or bucket bound written exactly, without the rounding of %g"""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Histogram:
+    """A Prometheus histogram, optionally split by a single label"""
+
+    def __init__(self, name: str, help_text: str, buckets: List[float], label: Optional[str] = None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        # label value -> (bucket counts, sum, count)
+        self.series: Dict[str, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, label_value: str = ""):
+        counts, total, count = self.series.get(label_value) or ([0] * len(self.buckets), 0.0, 0)
+        index = bisect_left(self.buckets, value)
+        if index < len(counts):
+            counts[index] += 1
+        self.series[label_value] = (counts, total + value, count + 1)
+
+    def _labels(self, label_value: str, extra: str = "") -> str:
+        labels = []
+        if self.label:
+            labels.append(f'{self.label}="{label_value}"')
+        if extra:
+            labels.append(extra)
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{prometheus_number(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(label_value, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{self._labels(label_value, le)} {count}")
+            lines.append(f"{self.name}_sum{self._labels(label_value)} {prometheus_number(total)}")
+            lines.append(f"{self.name}_count{self._labels(label_value)} {count}")
+        return lines
+
+
+class FormatMetrics:
+    """Aggregated timings and document sizes of every format request
+
+    Rendered in the Prometheus text exposition format for ``GET /metrics``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            "docformatter_format_stage_seconds", "Time spent in each formatting stage",
+            SECONDS_BUCKETS, label="stage",
+        )
+        self.request_seconds = Histogram(
+            "docformatter_format_seconds", "Total time to format a document, queueing included",
+            SECONDS_BUCKETS, label="cache",
+        )
+        self.document_bytes = Histogram(
+            "docformatter_document_bytes", "Size of formatted source documents", BYTES_BUCKETS,
+        )
+        self.document_paragraphs = Histogram(
+            "docformatter_document_paragraphs", "Paragraphs in formatted source documents", COUNT_BUCKETS,
+        )
+        self.document_runs = Histogram(
+            "docformatter_document_runs", "Runs in formatted source documents", COUNT_BUCKETS,
+        )
+
+    def observe(self, report: dict, cache: str):
+        """Record the report of one format request"""
+        with self._lock:
+            for stage, seconds in report.get("stages", {}).items():
+                self.stage_seconds.observe(seconds, stage)
+            if "total" in report:
+                self.request_seconds.observe(report["total"], cache)
+            document = report.get("document")
+            if document:
+                self.document_bytes.observe(document["bytes"])
+                self.document_paragraphs.observe(document["paragraphs"])
+                self.document_runs.observe(document["runs"])
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+            for histogram in (
+                self.stage_seconds,
+                self.request_seconds,
+                self.document_bytes,
+                self.document_paragraphs,
+                self.document_runs,
+            ):
+                lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+# Singleton instance
+format_metrics = FormatMetrics()
@@ -0,0 +1,214 @@
+import os
+import struct
+import time
+import zipfile
+import zlib
+from typing import BinaryIO, Dict, Union
+
+from docx.opc.pkgwriter import PackageWriter
+
+from services.lazy_package import LazyBlob, load_blobs
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054B50
+
+ZIP_VERSION = 20
+ENCRYPTED_FLAG = 0x1
+UTF8_FLAG = 0x800
+# Only these flags describe the member itself, a data descriptor is not copied
+COPIED_FLAGS = 0x006
+# Sizes and counts that need zip64, which this writer does not produce
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MEMBER_LIMIT = 0xFFFF
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class Zip64RequiredError(ValueError):
+    """Raised when a package is too large for a zip without zip64 extensions"""
+
+
+class _Member:
+    __slots__ = ("name", "flags", "method", "dos_time", "dos_date", "crc", "compress_size", "file_size",
+                 "external_attr", "offset")
+
+    def __init__(self, name: bytes, flags: int, method: int, date_time, crc: int, compress_size: int,
+                 file_size: int, external_attr: int):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        year, month, day, hour, minute, second = date_time
+        self.dos_time = hour << 11 | minute << 5 | second // 2
+        self.dos_date = (year - 1980) << 9 | month << 5 | day
+        self.crc = crc
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.external_attr = external_attr
+        self.offset = 0
+
+
+class PassThroughZipWriter:
+    """Writes an OPC package, copying members that did not change from the source zip
+
+    It takes python-docx's place as the physical package writer. A member
+    whose serialised bytes match the source's (same size and CRC-32) is
+    copied as it is stored in the source, compressed data included, so
+    images and other parts formatting never touches are neither inflated
+    nor deflated again. Only the members that changed are compressed.
+    Binary parts of a document opened with lazy_package.open_document are
+    copied without ever being read.
+
+    ``target`` and ``source`` are paths or binary files; files are left open.
+    """
+
+    def __init__(self, target: Union[str, BinaryIO], source: Union[str, BinaryIO],
+                 compresslevel: int = zlib.Z_DEFAULT_COMPRESSION):
+        self.compresslevel = compresslevel
+        if isinstance(source, str):
+            self.source_path = os.path.realpath(source)
+            self.source = open(source, "rb")
+        else:
+            self.source_path = None
+            self.source = source
+        self._owns_source = isinstance(source, str)
+        self.source_members: Dict[str, zipfile.ZipInfo] = {
+            info.filename: info for info in zipfile.ZipFile(self.source).infolist()
+        }
+        self.output = open(target, "wb") if isinstance(target, str) else target
+        self._owns_output = isinstance(target, str)
+        self.members = []
+        self.copied = 0
+        self.written = 0
+        self.date_time = time.localtime(time.time())[:6]
+
+    def write(self, pack_uri, blob: bytes):
+        """Add ``blob`` under the member name of ``pack_uri``"""
+        name = pack_uri.membername
+        source = self.source_members.get(name)
+        if isinstance(blob, LazyBlob):
+            if (source is not None and self.source_path is not None
+                    and os.path.realpath(blob.path) == self.source_path
+                    and (source.CRC, source.file_size) == (blob.info.CRC, blob.info.file_size)):
+                self._copy(source)
+                return
+            blob = blob.read()
+        crc = zlib.crc32(blob)
+        if (source is not None and source.file_size == len(blob) and source.CRC == crc
+                and source.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+                and not source.flag_bits & ENCRYPTED_FLAG):
+            self._copy(source)
+        else:
+            self._deflate(name, blob, crc)
+
+    def _start(self, member: _Member):
+        if len(self.members) >= ZIP32_MEMBER_LIMIT or max(member.compress_size, member.file_size) >= ZIP32_LIMIT:
+            raise Zip64RequiredError("Package needs zip64")
+        member.offset = self.output.tell()
+        if member.offset >= ZIP32_LIMIT:
+            raise Zip64RequiredError("Package needs zip64")
+        self.output.write(LOCAL_HEADER.pack(
+            LOCAL_HEADER_SIGNATURE, ZIP_VERSION, member.flags, member.method, member.dos_time, member.dos_date,
+            member.crc, member.compress_size, member.file_size, len(member.name), 0,
+        ))
+        self.output.write(member.name)
+        self.members.append(member)
+
+    def _copy(self, source: zipfile.ZipInfo):
+        name = source.filename.encode("utf-8")
+        member = _Member(
+            name, source.flag_bits & COPIED_FLAGS | (UTF8_FLAG if not name.isascii() else 0),
+            source.compress_type, source.date_time, source.CRC, source.compress_size, source.file_size,
+            source.external_attr,
+        )
+        # Skip the source's local header, its extra field may differ from the central one
+        self.source.seek(source.header_offset)
+        header = self.source.read(LOCAL_HEADER.size)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        self.source.seek(source.header_offset + LOCAL_HEADER.size + name_length + extra_length)
+
+        self._start(member)
+        remaining = source.compress_size
+        while remaining:
+            chunk = self.source.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated member in source package: {source.filename}")
+            self.output.write(chunk)
+            remaining -= len(chunk)
+        self.copied += 1
+
+    def _deflate(self, membername: str, blob: bytes, crc: int):
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        data = compressor.compress(blob) + compressor.flush()
+        name = membername.encode("utf-8")
+        member = _Member(
+            name, UTF8_FLAG if not name.isascii() else 0, zipfile.ZIP_DEFLATED, self.date_time, crc,
+            len(data), len(blob), 0o600 << 16,
+        )
+        self._start(member)
+        self.output.write(data)
+        self.written += 1
+
+    def close(self):
+        directory_offset = self.output.tell()
+        for member in self.members:
+            self.output.write(CENTRAL_HEADER.pack(
+                CENTRAL_HEADER_SIGNATURE, ZIP_VERSION, ZIP_VERSION, member.flags, member.method,
+                member.dos_time, member.dos_date, member.crc, member.compress_size, member.file_size,
+                len(member.name), 0, 0, 0, 0, member.external_attr, member.offset,
+            ))
+            self.output.write(member.name)
+        directory_size = self.output.tell() - directory_offset
+        if directory_offset >= ZIP32_LIMIT:
+            raise Zip64RequiredError("Package needs zip64")
+        self.output.write(END_OF_CENTRAL_DIRECTORY.pack(
+            END_OF_CENTRAL_DIRECTORY_SIGNATURE, 0, 0, len(self.members), len(self.members),
+            directory_size, directory_offset, 0,
+        ))
+        self.release()
+
+    def release(self):
+        if self._owns_output:
+            self.output.close()
+        if self._owns_source:
+            self.source.close()
+
+
+def save_document(doc, target: Union[str, BinaryIO], source: Union[str, BinaryIO, None] = None) -> int:
+    """Save ``doc`` to ``target`` like ``doc.save``, copying unchanged members from ``source``
+
+    The members and their order are those python-docx writes. Packages
+    that need zip64, and saves without a source, go through ``doc.save``.
+    Returns the number of members copied from the source.
+    """
+    if source is None:
+        load_blobs(doc)
+        doc.save(target)
+        return 0
+
+    package = doc.part.package
+    parts = list(package.parts)
+    for part in parts:
+        part.before_marshal()
+
+    writer = PassThroughZipWriter(target, source)
+    try:
+        # The steps of PackageWriter.write, with this writer as the physical package
+        PackageWriter._write_content_types_stream(writer, parts)
+        PackageWriter._write_pkg_rels(writer, package.rels)
+        PackageWriter._write_parts(writer, parts)
+        writer.close()
+    except Zip64RequiredError:
+        writer.release()
+        if not isinstance(target, str):
+            target.seek(0)
+            target.truncate()
+        load_blobs(doc)
+        doc.save(target)
+        return 0
+    except BaseException:
+        writer.release()
+        raise
+    return writer.copied
@@ -0,0 +1,133 @@
+import copy
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from docx.oxml.ns import qn
+
+# Child order of w:rPr and w:pPr, as python-docx inserts them
+RUN_PROPERTY_SEQUENCE = (
+    'w:rStyle', 'w:rFonts', 'w:b', 'w:bCs', 'w:i', 'w:iCs', 'w:caps', 'w:smallCaps', 'w:strike',
+    'w:dstrike', 'w:outline', 'w:shadow', 'w:emboss', 'w:imprint', 'w:noProof', 'w:snapToGrid',
+    'w:vanish', 'w:webHidden', 'w:color', 'w:spacing', 'w:w', 'w:kern', 'w:position', 'w:sz',
+    'w:szCs', 'w:highlight', 'w:u', 'w:effect', 'w:bdr', 'w:shd', 'w:fitText', 'w:vertAlign',
+    'w:rtl', 'w:cs', 'w:em', 'w:lang', 'w:eastAsianLayout', 'w:specVanish', 'w:oMath',
+)
+PARAGRAPH_PROPERTY_SEQUENCE = (
+    'w:pStyle', 'w:keepNext', 'w:keepLines', 'w:pageBreakBefore', 'w:framePr', 'w:widowControl',
+    'w:numPr', 'w:suppressLineNumbers', 'w:pBdr', 'w:shd', 'w:tabs', 'w:suppressAutoHyphens',
+    'w:kinsoku', 'w:wordWrap', 'w:overflowPunct', 'w:topLinePunct', 'w:autoSpaceDE',
+    'w:autoSpaceDN', 'w:bidi', 'w:adjustRightInd', 'w:snapToGrid', 'w:spacing', 'w:ind',
+    'w:contextualSpacing', 'w:mirrorIndents', 'w:suppressOverlap', 'w:jc', 'w:textDirection',
+    'w:textAlignment', 'w:textboxTightWrap', 'w:outlineLvl', 'w:divId', 'w:cnfStyle', 'w:rPr',
+    'w:sectPr', 'w:pPrChange',
+)
+
+
+class PropertyLayout:
+    """Child order and merge rules of a properties element
+
+    Most python-docx setters replace the child they write, so a template
+    child replaces the existing one. Children listed in ``merged`` are
+    edited attribute by attribute instead (fonts, spacing, indentation), and
+    ``exclusive`` names attributes that replace each other, such as a first
+    line indent and a hanging indent.
+    """
+
+    def __init__(self, tag: str, sequence: Sequence[str], merged: Iterable[str] = (),
+                 exclusive: Optional[Dict[str, Tuple[str, ...]]] = None):
+        self.tag = qn(tag)
+        self.order = {qn(child): index for index, child in enumerate(sequence)}
+        self.merged = frozenset(qn(child) for child in merged)
+        self.exclusive = {
+            qn(child): frozenset(qn(attribute) for attribute in attributes)
+            for child, attributes in (exclusive or {}).items()
+        }
+
+    def successors(self, tag: str) -> frozenset:
+        """Tags that must come after ``tag``"""
+        position = self.order.get(tag, len(self.order))
+        return frozenset(child for child, index in self.order.items() if index > position)
+
+
+RUN_PROPERTIES = PropertyLayout('w:rPr', RUN_PROPERTY_SEQUENCE, merged=('w:rFonts',))
+PARAGRAPH_PROPERTIES = PropertyLayout(
+    'w:pPr', PARAGRAPH_PROPERTY_SEQUENCE,
+    merged=('w:spacing', 'w:ind'),
+    exclusive={'w:ind': ('w:firstLine', 'w:hanging')},
+)
+
+
+class PropertyTemplate:
+    """A target rPr or pPr built once and merged into many runs or paragraphs
+
+    The template is whatever the python-docx setters wrote on a scratch
+    element, so applying it gives the same XML as running those setters on
+    every element, without creating a proxy or searching the children per
+    property. ``removals`` lists (tag, w:val) pairs removed after the merge,
+    for setters that only clear a value when it is already there.
+    """
+
+    def __init__(self, template, layout: PropertyLayout, removals: Iterable[Tuple[str, str]] = ()):
+        self.layout = layout
+        self.removals = [(qn(tag), value) for tag, value in removals]
+        self.template = None
+        self.children = []
+        if template is not None:
+            # Keep the template itself in schema order, it is copied whole onto bare elements
+            children = sorted(template, key=lambda child: layout.order.get(child.tag, len(layout.order)))
+            for child in children:
+                template.append(child)
+            self.template = template
+            for child in children:
+                # Exclusive attributes only go when the template sets one of them
+                exclusive = layout.exclusive.get(child.tag, frozenset())
+                if exclusive.isdisjoint(child.attrib):
+                    exclusive = frozenset()
+                self.children.append((child.tag, child, layout.successors(child.tag), exclusive))
+
+    def apply(self, parent):
+        """Merge the template into the properties of a w:r or w:p"""
+        properties = parent.find(self.layout.tag)
+        if self.template is not None:
+            if properties is None:
+                # The properties element always comes first
+                parent.insert(0, copy.deepcopy(self.template))
+                return
+            self.merge(properties)
+        if properties is not None and self.removals:
+            self._remove(properties)
+
+    def apply_to_run(self, run):
+        self.apply(run._r)
+
+    def apply_to_paragraph(self, paragraph):
+        self.apply(paragraph._p)
+
+    def merge(self, properties):
+        existing = {}
+        for child in properties:
+            existing.setdefault(child.tag, child)
+
+        merged = self.layout.merged
+        for tag, element, successors, exclusive in self.children:
+            current = existing.get(tag)
+            if current is not None:
+                if tag in merged:
+                    for attribute in exclusive:
+                        current.attrib.pop(attribute, None)
+                    current.attrib.update(element.attrib)
+                else:
+                    properties.replace(current, copy.deepcopy(element))
+                continue
+            new = copy.deepcopy(element)
+            for child in properties:
+                if child.tag in successors:
+                    child.addprevious(new)
+                    break
+            else:
+                properties.append(new)
+
+    def _remove(self, properties):
+        for tag, value in self.removals:
+            child = properties.find(tag)
+            if child is not None and child.get(qn('w:val')) == value:
+                properties.remove(child)
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from models.formatting_options import FormattingOptions
+from services.metrics import format_metrics
+from services.storage import Storage, formatted_key, link_or_copy
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1GB
+
+# Bump when a change to the formatting code changes its output
+CACHE_VERSION = "7"
+
+
+def canonical_options(options: FormattingOptions) -> dict:
+    """Options reduced to the values that affect the output
+
+    Unset fields are dropped and so are sections left empty, because a
+    section whose fields are all unset formats nothing. Defaults are kept,
+    so spelling out a default value hashes the same as leaving it out.
+    """
+    data = options.model_dump(mode="json", exclude_none=True)
+    return {section: values for section, values in data.items() if values}
+
+
+class ResultCache:
+    """Disk cache of formatted outputs keyed on source content and options
+
+    Entries live in ``<upload_dir>/cache`` under a key derived from the source
+    content hash and the canonicalised options. A hit hands out a new
+    formatted file_id that is a hard link to the cached output, so serving
+    it costs no python-docx work and no copy. Entries are evicted least
+    recently used first once the disk budget is exceeded, and by the storage
+    janitor when the upload directory is over its quota.
+    """
+
+    def __init__(self, root: str, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Guards entries and total_bytes, the storage janitor evicts from its own thread
+        self._lock = threading.Lock()
+        # Formats in progress, so concurrent identical requests run once
+        self.pending: Dict[str, asyncio.Future] = {}
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU order from the files on disk, oldest first"""
+        found = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".docx"):
+                continue
+            stat = os.stat(os.path.join(self.root, name))
+            found.append((stat.st_mtime, name[:-len(".docx")], stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def key_for(self, content_hash: str, options: FormattingOptions) -> str:
+        payload = json.dumps(
+            {"version": CACHE_VERSION, "source": content_hash, "options": canonical_options(options)},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.docx")
+
+    def checkout(self, key: str, storage: Storage) -> Optional[str]:
+        """Publish a cached output in ``storage`` as a new formatted file_id, or None on a miss"""
+        with self._lock:
+            if key not in self.entries:
+                return None
+
+        formatted_file_id = str(uuid.uuid4())
+        try:
+            storage.put_file(formatted_key(formatted_file_id), self._path(key))
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            # Removed behind our back
+            with self._lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return formatted_file_id
+
+    def put(self, key: str, storage: Storage, output_key: str):
+        """Add a formatted output from ``storage`` to the cache and evict down to the budget"""
+        size = storage.size(output_key)
+        if size is None or size > self.max_bytes:
+            return
+
+        # Written beside the entry and renamed over it, so a hit never sees a partial file
+        temp_path = f"{self._path(key)}.{uuid.uuid4()}.part"
+        output_path = storage.local_path(output_key)
+        try:
+            if output_path is not None:
+                link_or_copy(output_path, temp_path)
+            else:
+                with storage.open(output_key) as source, open(temp_path, "wb") as target:
+                    shutil.copyfileobj(source, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            os.replace(temp_path, self._path(key))
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            while self.total_bytes > self.max_bytes and self.entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        key, size = self.entries.popitem(last=False)
+        self.total_bytes -= size
+        self.evictions += 1
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def trim(self, excess: int) -> int:
+        """Evict least recently used entries until ``excess`` bytes are freed on disk, returning the bytes freed
+
+        Entries hard-linked to a formatted output are kept, removing them
+        would free nothing while the output exists.
+        """
+        freed = 0
+        with self._lock:
+            for key in list(self.entries):
+                if freed >= excess:
+                    break
+                path = self._path(key)
+                try:
+                    if os.stat(path).st_nlink > 1:
+                        continue
+                    os.remove(path)
+                    freed += self.entries[key]
+                except FileNotFoundError:
+                    pass
+                self.total_bytes -= self.entries.pop(key)
+                self.evictions += 1
+        return freed
+
+    def files(self) -> List[Tuple[str, int]]:
+        """Path and size of every entry"""
+        with self._lock:
+            return [(self._path(key), size) for key, size in self.entries.items()]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+async def format_document_cached(file_id: str, options: FormattingOptions, pool,
+                                 report: Optional[dict] = None, **run_kwargs) -> str:
+    """Format on the worker pool unless the same source and options were formatted before
+
+    ``report`` is filled with the stage timings of the request, see
+    DocumentProcessor.format_document, and the request is recorded in
+    format_metrics. ``run_kwargs`` are passed on to WorkerPool.run for a miss.
+    """
+    from services.storage_janitor import storage_janitor
+
+    # The janitor must not delete the source while it is queued or formatting
+    with storage_janitor.in_use(file_id):
+        return await _format_document_cached(file_id, options, pool, report, **run_kwargs)
+
+
+async def _format_document_cached(file_id: str, options: FormattingOptions, pool,
+                                  report: Optional[dict], **run_kwargs) -> str:
+    from services.document_processor import document_processor
+    from services.worker_pool import format_document_task
+
+    report = {} if report is None else report
+    started = time.perf_counter()
+
+    async def run_format() -> str:
+        result = await pool.run(format_document_task, file_id, options, **run_kwargs)
+        report["stages"] = {**report.get("stages", {}), **result["stages"]}
+        report["document"] = result["document"]
+        return result["file_id"]
+
+    def finish(cache: str):
+        report["total"] = time.perf_counter() - started
+        format_metrics.observe(report, cache)
+
+    # Storage calls block on a remote backend, they run on threads rather than the event loop
+    content_hash = await asyncio.to_thread(document_processor.blob_store.content_hash, file_id)
+    if content_hash is None:
+        # Legacy uploads have no content hash to key on
+        formatted_file_id = await run_format()
+        finish("bypass")
+        return formatted_file_id
+
+    cache = document_processor.result_cache
+    key = cache.key_for(content_hash, options)
+
+    def checkout() -> Optional[str]:
+        formatted_file_id = cache.checkout(key, document_processor.storage)
+        if formatted_file_id:
+            document_processor.register_formatted(formatted_file_id, file_id)
+            document_processor.registry.touch(file_id)
+        return formatted_file_id
+
+    while True:
+        lookup_started = time.perf_counter()
+        formatted_file_id = await asyncio.to_thread(checkout)
+        report["stages"] = {"cache": time.perf_counter() - lookup_started}
+        if formatted_file_id:
+            cache.hits += 1
+            finish("hit")
+            return formatted_file_id
+
+        pending = cache.pending.get(key)
+        if pending is None:
+            break
+        # An identical request is formatting right now, reuse its output
+        await asyncio.shield(pending)
+
+    cache.misses += 1
+    pending = asyncio.get_running_loop().create_future()
+    cache.pending[key] = pending
+    try:
+        formatted_file_id = await run_format()
+        try:
+            await asyncio.to_thread(cache.put, key, document_processor.storage, formatted_key(formatted_file_id))
+        except OSError:
+            # The output is still good, it just is not cached
+            pass
+        finish("miss")
+        return formatted_file_id
+    finally:
+        del cache.pending[key]
+        pending.set_result(None)
@@ -0,0 +1,341 @@
+import abc
+import hashlib
+import hmac
+import io
+import os
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Optional
+
+# Where uploads and formatted outputs are kept: "local", "memory" or "s3"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+# Budget of the in-memory backend, per process
+MEMORY_STORAGE_MAX_BYTES = int(os.getenv("MEMORY_STORAGE_MAX_BYTES", str(512 * 1024 * 1024)))  # 512MB
+# Content staged for the memory and S3 backends spills to disk only past this size
+STAGING_MEMORY_BYTES = int(os.getenv("STORAGE_STAGING_MEMORY_BYTES", str(64 * 1024 * 1024)))  # 64MB
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+# Any S3-compatible service (MinIO, R2, Ceph...); AWS S3 when empty
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+
+COPY_CHUNK_SIZE = 1024 * 1024  # 1MB
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+class StorageFullError(OSError):
+    """Raised when a size-bounded backend has no room for more content"""
+
+
+def link_or_copy(source: str, target: str):
+    """Hard-link ``target`` to ``source``, copying where links are not supported"""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def formatted_key(file_id: str) -> str:
+    """Storage key of a formatted output"""
+    return f"{file_id}_formatted.docx"
+
+
+class Storage(abc.ABC):
+    """Where uploads and formatted outputs are kept, by key
+
+    Keys are relative paths such as ``blobs/<hash>.docx``. Content is
+    written in two steps: ``stage`` hands out a scratch file to write to,
+    ``commit`` publishes it under its key once the key is known (uploads
+    are named after their hash). Readers get a seekable binary file from
+    ``open``. Backends that keep plain files also expose them through
+    ``local_path``, which lets callers use a path where it is faster.
+    Content of a backend that is not ``persistent`` is gone when the
+    process exits.
+    """
+
+    persistent = True
+
+    def stage(self) -> BinaryIO:
+        return tempfile.SpooledTemporaryFile(max_size=STAGING_MEMORY_BYTES)
+
+    def commit(self, staged: BinaryIO, key: str):
+        """Store the staged content under ``key`` and close it"""
+        try:
+            staged.seek(0)
+            self._write(key, staged)
+        finally:
+            staged.close()
+
+    def abort(self, staged: BinaryIO):
+        staged.close()
+
+    def put_file(self, key: str, path: str):
+        """Store a copy of a local file under ``key``"""
+        with open(path, "rb") as f:
+            self._write(key, f)
+
+    @abc.abstractmethod
+    def _write(self, key: str, stream: BinaryIO):
+        """Store the content read from ``stream`` under ``key``"""
+
+    @abc.abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """A seekable binary file with the content, FileNotFoundError for unknown keys"""
+
+    @abc.abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """Size of the content, or None for unknown keys"""
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        """Remove the content, if there is any"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of the content as a plain file, None if the backend does not keep files"""
+        return None
+
+
+class LocalStorage(Storage):
+    """Plain files under a directory, staged next to their target for atomic renames"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def stage(self) -> BinaryIO:
+        return open(os.path.join(self.root, f"{uuid.uuid4()}.part"), "w+b")
+
+    def commit(self, staged: BinaryIO, key: str):
+        staged.close()
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(staged.name, path)
+        except BaseException:
+            self.abort(staged)
+            raise
+
+    def abort(self, staged: BinaryIO):
+        staged.close()
+        if os.path.exists(staged.name):
+            os.remove(staged.name)
+
+    def _write(self, key: str, stream: BinaryIO):
+        staged = self.stage()
+        try:
+            shutil.copyfileobj(stream, staged, COPY_CHUNK_SIZE)
+        except BaseException:
+            self.abort(staged)
+            raise
+        self.commit(staged, key)
+
+    def put_file(self, key: str, path: str):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        link_or_copy(path, target)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+
+class MemoryStorage(Storage):
+    """Content kept in this process's memory, up to ``max_bytes``
+
+    Nothing touches the disk, but nothing is shared either: worker processes
+    cannot see it, so it needs FORMAT_EXECUTOR=thread, and nothing survives
+    a restart. For several processes on one machine, LocalStorage on a
+    tmpfs mount is the in-memory option.
+    """
+
+    persistent = False
+
+    def __init__(self, max_bytes: int = MEMORY_STORAGE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.objects: Dict[str, bytes] = {}
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _write(self, key: str, stream: BinaryIO):
+        data = stream.read()
+        with self._lock:
+            replaced = len(self.objects.get(key, b""))
+            if self.total_bytes - replaced + len(data) > self.max_bytes:
+                raise StorageFullError(f"Memory storage is full ({self.max_bytes} bytes)")
+            self.objects[key] = data
+            self.total_bytes += len(data) - replaced
+
+    def open(self, key: str) -> BinaryIO:
+        with self._lock:
+            data = self.objects.get(key)
+        if data is None:
+            raise FileNotFoundError(f"No such object: {key}")
+        return io.BytesIO(data)
+
+    def size(self, key: str) -> Optional[int]:
+        with self._lock:
+            data = self.objects.get(key)
+        return None if data is None else len(data)
+
+    def delete(self, key: str):
+        with self._lock:
+            data = self.objects.pop(key, None)
+            if data is not None:
+                self.total_bytes -= len(data)
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def sign_v4(method: str, host: str, path: str, headers: Dict[str, str], region: str,
+            access_key: str, secret_key: str, now: datetime, payload_hash: str = UNSIGNED_PAYLOAD,
+            service: str = "s3") -> str:
+    """Authorization header of an AWS Signature Version 4 request without a query string
+
+    ``path`` is already URI-encoded; ``headers`` are the headers to sign,
+    other than Host, x-amz-date and x-amz-content-sha256 which are added
+    to them.
+    """
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = amz_date[:8]
+    headers.update({"x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+    signed = {"host": host, **{name.lower(): value.strip() for name, value in headers.items()}}
+    names = sorted(signed)
+    canonical_request = "\n".join([
+        method, path, "",
+        "".join(f"{name}:{signed[name]}\n" for name in names),
+        ";".join(names),
+        payload_hash,
+    ])
+    scope = f"{date}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    key = _hmac(("AWS4" + secret_key).encode("utf-8"), date)
+    for part in (region, service, "aws4_request"):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    return (f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+            f"SignedHeaders={';'.join(names)}, Signature={signature}")
+
+
+class S3Storage(Storage):
+    """Objects in an S3 bucket or any S3-compatible service
+
+    Talks the S3 REST API directly over HTTP(S) with Signature Version 4,
+    so no SDK is needed. With an ``endpoint_url`` (MinIO, a local stand-in)
+    objects are addressed path-style, ``<endpoint>/<bucket>/<key>``;
+    without one, AWS S3 virtual-hosted style. Requests are unsigned when no
+    credentials are given.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: str = S3_REGION, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, session_token: Optional[str] = None,
+                 timeout: float = 60):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.timeout = timeout
+        if endpoint_url:
+            self.base_url = f"{endpoint_url.rstrip('/')}/{bucket}/"
+        else:
+            self.base_url = f"https://{bucket}.s3.{region}.amazonaws.com/"
+
+    def _request(self, method: str, key: str, body: Optional[BinaryIO] = None,
+                 length: Optional[int] = None):
+        url = urllib.parse.urljoin(self.base_url, urllib.parse.quote(self.prefix + key))
+        parsed = urllib.parse.urlsplit(url)
+        headers = {}
+        if length is not None:
+            headers["Content-Length"] = str(length)
+        if self.session_token:
+            headers["x-amz-security-token"] = self.session_token
+        if self.access_key and self.secret_key:
+            headers["Authorization"] = sign_v4(
+                method, parsed.netloc, parsed.path, headers, self.region,
+                self.access_key, self.secret_key, datetime.now(timezone.utc),
+            )
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _write(self, key: str, stream: BinaryIO):
+        length = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        with self._request("PUT", key, stream, length):
+            pass
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            response = self._request("GET", key)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                raise FileNotFoundError(f"No such object: {key}") from e
+            raise
+        local = tempfile.SpooledTemporaryFile(max_size=STAGING_MEMORY_BYTES)
+        with response:
+            shutil.copyfileobj(response, local, COPY_CHUNK_SIZE)
+        local.seek(0)
+        return local
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            with self._request("HEAD", key) as response:
+                return int(response.headers["Content-Length"])
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def delete(self, key: str):
+        try:
+            with self._request("DELETE", key):
+                pass
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+
+
+def create_storage(root: str) -> Storage:
+    """The backend chosen by STORAGE_BACKEND; ``root`` is the directory of the local one"""
+    if STORAGE_BACKEND == "memory":
+        return MemoryStorage()
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise ValueError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(
+            S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL or None,
+            access_key=os.getenv("AWS_ACCESS_KEY_ID"), secret_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            session_token=os.getenv("AWS_SESSION_TOKEN"),
+        )
+    if STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return LocalStorage(root)
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from services.document_processor import DocumentProcessor, document_processor
+from services.file_registry import FORMATTED, UPLOAD, FileRecord
+from services.metrics import SECONDS_BUCKETS, Histogram
+
+# Uploads and formatted outputs unused for this many seconds are deleted, 0 keeps them
+STORAGE_TTL = int(os.getenv("STORAGE_TTL", str(24 * 3600)))
+# Least recently used files are deleted while the upload directory holds more, 0 for no quota
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", "0"))
+# Seconds between two sweeps
+STORAGE_SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_INTERVAL", "300"))
+
+REASONS = ("ttl", "quota")
+
+
+def directory_bytes(root: str) -> int:
+    """Bytes of the files directly in ``root``"""
+    total = 0
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+
+class StorageJanitor:
+    """Deletes uploads and formatted outputs that are expired or over the disk quota
+
+    A sweep first deletes every file not used for ``ttl`` seconds, then, while
+    the upload directory takes more than ``max_bytes`` (see ``usage``), result
+    cache entries and then the least recently used files. "Used" is
+    the registry's accessed_at, which formatting and downloads update. Files pinned with ``in_use`` are skipped, so the source of an
+    in-flight format job is never pulled from under it; pins are per process.
+    """
+
+    def __init__(self, processor: DocumentProcessor = document_processor, ttl: int = STORAGE_TTL,
+                 max_bytes: int = STORAGE_MAX_BYTES, interval: float = STORAGE_SWEEP_INTERVAL):
+        self.processor = processor
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pins: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+
+        self.evicted_files: Dict[str, int] = dict.fromkeys(REASONS, 0)
+        self.evicted_bytes: Dict[str, int] = dict.fromkeys(REASONS, 0)
+        self.skipped_in_use = 0
+        self.sweeps = 0
+        self.errors = 0
+        self.stored_files = 0
+        self.stored_bytes = 0
+        self.last_sweep: Optional[float] = None
+        self.sweep_seconds = Histogram(
+            "docformatter_storage_sweep_seconds", "Time spent in one storage sweep", SECONDS_BUCKETS,
+        )
+
+    def pin(self, *file_ids: str):
+        """Keep the janitor away from these files until they are unpinned"""
+        with self._lock:
+            self._pins.update(file_ids)
+
+    def unpin(self, *file_ids: str):
+        with self._lock:
+            self._pins.subtract(file_ids)
+            for file_id in file_ids:
+                if self._pins[file_id] <= 0:
+                    del self._pins[file_id]
+
+    @contextmanager
+    def in_use(self, *file_ids: str):
+        """Keep the janitor away from these files for the duration of the block"""
+        self.pin(*file_ids)
+        try:
+            yield
+        finally:
+            self.unpin(*file_ids)
+
+    def _evict(self, record: FileRecord, reason: str) -> int:
+        """Delete one file unless it is pinned or was used since it was picked, returning the bytes freed"""
+        with self._lock:
+            if record.file_id in self._pins:
+                self.skipped_in_use += 1
+                return 0
+        current = self.processor.registry.get(record.file_id)
+        if current is None or current.accessed_at != record.accessed_at:
+            return 0
+
+        # A formatted output hard-linked to the result cache or another output frees nothing
+        path = self.processor.storage.local_path(record.path)
+        try:
+            linked = path is not None and os.stat(path).st_nlink > 1
+        except FileNotFoundError:
+            linked = False
+        self.processor.delete_file(record.file_id)
+
+        # An upload frees its blob only with the last alias
+        shared = (
+            record.kind == UPLOAD and record.content_hash is not None
+            and self.processor.blob_store.has_blob(record.content_hash)
+        )
+        freed = 0 if shared or linked else record.size
+        self.evicted_files[reason] += 1
+        self.evicted_bytes[reason] += freed
+        return freed
+
+    def _trim_cache(self, excess: int) -> int:
+        freed = self.processor.result_cache.trim(excess)
+        self.evicted_bytes["quota"] += freed
+        return freed
+
+    def sweep(self) -> Dict[str, int]:
+        """Run one sweep now and return the number of files deleted per reason"""
+        started = time.perf_counter()
+        registry = self.processor.registry
+        before = dict(self.evicted_files)
+
+        if self.ttl > 0:
+            for record in registry.least_recently_used(accessed_before=time.time() - self.ttl):
+                self._evict(record, "ttl")
+
+        if self.max_bytes > 0:
+            _, used = self.usage()
+            # Cached outputs can be formatted again, they go before stored files
+            if used > self.max_bytes:
+                used -= self._trim_cache(used - self.max_bytes)
+            if used > self.max_bytes:
+                for record in registry.least_recently_used():
+                    used -= self._evict(record, "quota")
+                    # The cache entry of a deleted output may take space of its own now
+                    if used > self.max_bytes and record.kind == FORMATTED:
+                        used -= self._trim_cache(used - self.max_bytes)
+                    if used <= self.max_bytes:
+                        break
+
+        self.stored_files, self.stored_bytes = self.usage()
+        self.sweeps += 1
+        self.last_sweep = time.time()
+        self.sweep_seconds.observe(time.perf_counter() - started)
+        return {reason: self.evicted_files[reason] - before[reason] for reason in REASONS}
+
+    def usage(self) -> Tuple[int, int]:
+        """Registered files and the bytes counted against the quota
+
+        Besides the registered files, these are the result cache entries, the
+        document statistics and the registry database. A cached output and
+        the formatted outputs hard-linked to it are one file and count once.
+        """
+        registry = self.processor.registry
+        files, used = registry.usage()
+
+        seen = set()
+
+        def counted(path: str) -> bool:
+            """Whether the file behind ``path`` was already counted"""
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return False
+            if stat.st_nlink == 1:
+                return False
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in seen:
+                return True
+            seen.add(inode)
+            return False
+
+        for key, size in registry.select("SELECT path, size FROM files WHERE kind != ?", (UPLOAD,)):
+            path = self.processor.storage.local_path(key)
+            if path is not None and counted(path):
+                used -= size
+        for path, size in self.processor.result_cache.files():
+            if not counted(path):
+                used += size
+
+        used += directory_bytes(self.processor.stats_cache.root)
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            try:
+                used += os.path.getsize(registry.index_path + suffix)
+            except FileNotFoundError:
+                pass
+        return files, used
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                # A failed sweep is retried on the next interval
+                self.errors += 1
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Sweep in the background every ``interval`` seconds, unless neither limit is set"""
+        if self._task is None and (self.ttl > 0 or self.max_bytes > 0):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "max_bytes": self.max_bytes,
+            "files": self.stored_files,
+            "bytes": self.stored_bytes,
+            "evicted_files": dict(self.evicted_files),
+            "evicted_bytes": dict(self.evicted_bytes),
+            "skipped_in_use": self.skipped_in_use,
+            "sweeps": self.sweeps,
+            "errors": self.errors,
+            "last_sweep": self.last_sweep,
+        }
+
+    def render(self) -> List[str]:
+        """Metrics in the Prometheus text format"""
+        lines = []
+        for name, help_text, values in (
+            ("docformatter_storage_evicted_files_total", "Files deleted by the storage janitor", self.evicted_files),
+            ("docformatter_storage_evicted_bytes_total", "Bytes freed by the storage janitor", self.evicted_bytes),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{reason="{reason}"}} {values[reason]}' for reason in REASONS]
+        for name, kind, help_text, value in (
+            ("docformatter_storage_skipped_in_use_total", "counter",
+             "Eviction candidates skipped because a job was using them", self.skipped_in_use),
+            ("docformatter_storage_sweep_errors_total", "counter", "Storage sweeps that failed", self.errors),
+            ("docformatter_storage_files", "gauge", "Uploads and formatted outputs stored", self.stored_files),
+            ("docformatter_storage_bytes", "gauge", "Bytes counted against the storage quota", self.stored_bytes),
+            ("docformatter_storage_max_bytes", "gauge", "Storage quota, 0 when unlimited", self.max_bytes),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return lines + self.sweep_seconds.render()
+
+
+# Singleton instance
+storage_janitor = StorageJanitor()
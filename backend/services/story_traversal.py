@@ -0,0 +1,96 @@
+from typing import List, Tuple
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.part import XmlPart
+from docx.oxml.ns import nsmap, qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+
+NAMESPACES = {"w": nsmap["w"]}
+
+# Every paragraph of a story, at any depth: table cells, nested tables,
+# text boxes and content controls included
+ALL_PARAGRAPHS = etree.XPath(".//w:p", namespaces=NAMESPACES)
+BODY_PARAGRAPHS = etree.XPath("./w:p", namespaces=NAMESPACES)
+
+# Runs of a paragraph, including those wrapped in hyperlinks, fields,
+# smart tags, inline content controls and tracked insertions
+PARAGRAPH_RUNS = etree.XPath(
+    "./w:r | ./w:hyperlink/w:r | ./w:fldSimple/w:r | ./w:smartTag/w:r"
+    " | ./w:sdt/w:sdtContent/w:r | ./w:ins/w:r",
+    namespaces=NAMESPACES,
+)
+
+# Parts that hold a story of their own besides the main document
+STORY_RELATIONSHIPS = (RT.HEADER, RT.FOOTER, RT.FOOTNOTES, RT.ENDNOTES)
+
+BODY_TAG = qn('w:body')
+TC_TAG = qn('w:tc')
+NOTE_TAGS = frozenset((qn('w:footnote'), qn('w:endnote')))
+NOTE_TYPE = qn('w:type')
+
+
+def story_roots(doc) -> list:
+    """Root elements of the header, footer, footnote and endnote parts, each once
+
+    Footnotes and endnotes are only XML parts in documents opened with
+    lazy_package.open_document; elsewhere python-docx keeps them as blobs
+    and they are skipped.
+    """
+    roots = []
+    seen = set()
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.reltype not in STORY_RELATIONSHIPS:
+            continue
+        part = rel.target_part
+        if id(part) in seen or not isinstance(part, XmlPart):
+            continue
+        seen.add(id(part))
+        roots.append(part.element)
+    return roots
+
+
+def body_paragraphs(doc) -> List[Paragraph]:
+    """Top-level paragraphs of the document body, as ``doc.paragraphs``"""
+    body = doc._body
+    return [Paragraph(p, body) for p in BODY_PARAGRAPHS(doc.element.body)]
+
+
+def story_paragraphs(doc) -> Tuple[List[Paragraph], List[Paragraph]]:
+    """Paragraphs outside the top level of the body, split into table cells and the rest
+
+    The first list holds the paragraphs of every table cell in every story,
+    nested tables included. The second holds everything else that is not a
+    top-level body paragraph: text boxes, block content controls and the
+    paragraphs of headers, footers, footnotes and endnotes. Separator notes
+    are left out. Each element is visited once, so the cost is linear in
+    the size of the document whatever its table layout.
+    """
+    body = doc._body
+    cells = []
+    others = []
+    for root in [doc.element.body, *story_roots(doc)]:
+        for p in ALL_PARAGRAPHS(root):
+            parent = p.getparent()
+            tag = parent.tag
+            if tag == BODY_TAG:
+                continue
+            if tag == TC_TAG:
+                cells.append(Paragraph(p, body))
+            elif tag in NOTE_TAGS and parent.get(NOTE_TYPE, "normal") != "normal":
+                continue
+            else:
+                others.append(Paragraph(p, body))
+    return cells, others
+
+
+def all_paragraphs(doc) -> List[Paragraph]:
+    """Every paragraph of every story"""
+    cells, others = story_paragraphs(doc)
+    return body_paragraphs(doc) + cells + others
+
+
+def paragraph_runs(paragraph) -> List[Run]:
+    """Runs of a paragraph, including those nested in hyperlinks and other inline wrappers"""
+    return [Run(r, paragraph) for r in PARAGRAPH_RUNS(paragraph._p)]
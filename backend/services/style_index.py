@@ -0,0 +1,134 @@
+from typing import Dict, Iterable, List, Optional
+
+from docx.oxml.ns import qn
+from docx.styles import BabelFish
+
+STYLE_TAG = qn('w:style')
+TYPE = qn('w:type')
+STYLE_ID = qn('w:styleId')
+DEFAULT = qn('w:default')
+VAL = qn('w:val')
+NAME_TAG = qn('w:name')
+ALIASES_TAG = qn('w:aliases')
+BASED_ON_TAG = qn('w:basedOn')
+OUTLINE_LEVEL_PATH = f"{qn('w:pPr')}/{qn('w:outlineLvl')}"
+PPR_TAG = qn('w:pPr')
+PSTYLE_TAG = qn('w:pStyle')
+
+# Outline levels 0-8 are headings, 9 is body text
+BODY_TEXT_OUTLINE_LEVEL = 9
+
+
+class StyleEntry:
+    """What heading detection needs to know about one paragraph style"""
+
+    __slots__ = ("style_id", "name", "level", "toc_heading")
+
+    def __init__(self, style_id: str, name: Optional[str], level: Optional[int], toc_heading: bool):
+        self.style_id = style_id
+        self.name = name
+        self.level = level
+        self.toc_heading = toc_heading
+
+
+class StyleIndex:
+    """Paragraph styles of a document by styleId, with their heading level
+
+    Built once per document from styles.xml, so finding a paragraph's
+    heading level is a dictionary lookup instead of a python-docx style
+    lookup, which searches every style. A style's level comes from its
+    name, then its aliases (``w:aliases``), matched against
+    ``style_mappings``, then from its outline level (``w:outlineLvl``),
+    inherited through ``w:basedOn``.
+    """
+
+    def __init__(self, styles, style_mappings: Dict[str, Iterable[str]], max_level: int = 3):
+        levels_by_name = {}
+        for heading_name, style_names in style_mappings.items():
+            level = int(heading_name.rsplit(" ", 1)[-1])
+            for style_name in style_names:
+                levels_by_name.setdefault(style_name, level)
+
+        elements: Dict[str, object] = {}
+        default = None
+        for style in styles.iterchildren(STYLE_TAG):
+            if style.get(TYPE) != "paragraph":
+                continue
+            style_id = style.get(STYLE_ID)
+            if style_id is not None:
+                elements.setdefault(style_id, style)
+            if style.get(DEFAULT) in ("1", "true", "on"):
+                # As python-docx, the last default style wins
+                default = style
+
+        self.entries: Dict[str, StyleEntry] = {}
+        # styleId of the 'Heading N' style for each level
+        self.heading_style_ids: Dict[int, str] = {}
+        for style_id, style in elements.items():
+            name = self._name(style)
+            level = levels_by_name.get(name)
+            if level is None:
+                for alias in self._aliases(style):
+                    level = levels_by_name.get(alias)
+                    if level is not None:
+                        break
+            outline_level = self._outline_level(style, elements)
+            if level is None and outline_level is not None and outline_level < max_level:
+                level = outline_level + 1
+            toc_heading = bool(name and 'heading' in name.lower()) or (
+                outline_level is not None and outline_level < BODY_TEXT_OUTLINE_LEVEL
+            )
+            self.entries[style_id] = StyleEntry(style_id, name, level, toc_heading)
+            if name and name.startswith("Heading "):
+                self.heading_style_ids.setdefault(self._heading_number(name), style_id)
+        self.default = self.entries.get(default.get(STYLE_ID)) if default is not None else None
+        self.default_id = self.default.style_id if self.default is not None else None
+
+    @classmethod
+    def for_document(cls, doc, style_mappings: Dict[str, Iterable[str]]) -> "StyleIndex":
+        return cls(doc.styles.element, style_mappings)
+
+    @staticmethod
+    def _name(style) -> Optional[str]:
+        name = style.find(NAME_TAG)
+        if name is None or name.get(VAL) is None:
+            return None
+        return BabelFish.internal2ui(name.get(VAL))
+
+    @staticmethod
+    def _aliases(style) -> List[str]:
+        aliases = style.find(ALIASES_TAG)
+        if aliases is None or not aliases.get(VAL):
+            return []
+        return [alias.strip() for alias in aliases.get(VAL).split(",")]
+
+    @staticmethod
+    def _heading_number(name: str) -> int:
+        try:
+            return int(name[len("Heading "):])
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def _outline_level(style, elements: Dict[str, object]) -> Optional[int]:
+        """Outline level of a style, following basedOn until one is set"""
+        seen = set()
+        while style is not None and id(style) not in seen:
+            seen.add(id(style))
+            outline = style.find(OUTLINE_LEVEL_PATH)
+            if outline is not None:
+                try:
+                    return int(outline.get(VAL))
+                except (TypeError, ValueError):
+                    return None
+            based_on = style.find(BASED_ON_TAG)
+            style = elements.get(based_on.get(VAL)) if based_on is not None else None
+        return None
+
+    def style(self, p) -> Optional[StyleEntry]:
+        """Style of a w:p, the default paragraph style when it has none or an unknown one"""
+        pPr = p.find(PPR_TAG)
+        pStyle = pPr.find(PSTYLE_TAG) if pPr is not None else None
+        if pStyle is None:
+            return self.default
+        return self.entries.get(pStyle.get(VAL), self.default)
@@ -0,0 +1,189 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from models.formatting_options import FormattingOptions
+from services.storage import STORAGE_BACKEND
+
+# Pool configuration, overridable through the environment
+FORMAT_WORKERS = int(os.getenv("FORMAT_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+FORMAT_QUEUE_SIZE = int(os.getenv("FORMAT_QUEUE_SIZE", "16"))
+# "process" or "thread"; in-memory storage is per process, so it defaults to threads
+FORMAT_EXECUTOR = os.getenv("FORMAT_EXECUTOR", "thread" if STORAGE_BACKEND == "memory" else "process")
+
+
+class PoolSaturatedError(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Worker pool is saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def format_document_task(file_id: str, options: FormattingOptions) -> dict:
+    """Worker entry point for DocumentProcessor.format_document
+
+    Returns the new file_id together with the stage timings and document
+    metrics, which only exist in the worker.
+    """
+    from services.document_processor import document_processor
+
+    report = {}
+    report["file_id"] = document_processor.format_document(file_id, options, report)
+    return report
+
+
+def document_preview_task(file_id: str) -> dict:
+    """Worker entry point for DocumentProcessor.get_document_preview"""
+    from services.document_processor import document_processor
+
+    return document_processor.get_document_preview(file_id)
+
+
+def document_stats_task(file_id: str) -> dict:
+    """Worker entry point for DocumentProcessor.get_document_stats"""
+    from services.document_processor import document_processor
+
+    return document_processor.get_document_stats(file_id)
+
+
+class WorkerPool:
+    """Runs CPU-bound document work off the event loop with a bounded wait queue
+
+    At most ``workers`` jobs run at once and at most ``max_queue`` more wait
+    for a free worker; anything beyond that is rejected with
+    PoolSaturatedError so one slow document cannot stall every client.
+    """
+
+    def __init__(self, workers: int = FORMAT_WORKERS, max_queue: int = FORMAT_QUEUE_SIZE,
+                 executor: str = FORMAT_EXECUTOR):
+        if executor == "process" and STORAGE_BACKEND == "memory":
+            raise ValueError("STORAGE_BACKEND=memory needs FORMAT_EXECUTOR=thread, worker processes cannot see it")
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._local_executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._busy_seconds = 0.0
+        self._avg_duration = 1.0
+        self._started_at = time.monotonic()
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                # spawn avoids forking a process that already runs the event loop's threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return self._executor
+
+    def _get_local_executor(self) -> Executor:
+        """Threads of this process, for work that needs objects held in its memory"""
+        if self.executor_kind == "thread":
+            return self._get_executor()
+        if self._local_executor is None:
+            self._local_executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._local_executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait, estimated from recent job durations"""
+        backlog = (self.queued + self.running) / self.workers
+        return max(1, math.ceil(self._avg_duration * backlog))
+
+    def ensure_capacity(self):
+        """Raise PoolSaturatedError if a new job would neither run nor fit in the queue"""
+        if self._get_slots().locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise PoolSaturatedError(self.retry_after())
+
+    async def run(self, fn, *args, wait: bool = False, on_start=None, in_process: bool = False):
+        """Run ``fn(*args)`` on a worker, raising PoolSaturatedError when the queue is full
+
+        With ``wait=True`` the call waits for a free worker instead of being rejected.
+        ``on_start`` is called once the job leaves the queue and starts on a worker.
+        With ``in_process=True`` the job runs on a thread of this process, still
+        taking one of the ``workers`` slots.
+        """
+        slots = self._get_slots()
+        if not wait:
+            self.ensure_capacity()
+
+        self.queued += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        started = time.monotonic()
+        try:
+            if on_start is not None:
+                on_start()
+            executor = self._get_local_executor() if in_process else self._get_executor()
+            future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except BaseException:
+            self.running -= 1
+            slots.release()
+            raise
+
+        # The slot is only released once the work really finishes, even if the
+        # caller stops waiting, so the pool never runs more than `workers` jobs.
+        future.add_done_callback(lambda f: self._on_done(f, started))
+        return await asyncio.shield(future)
+
+    def _on_done(self, future: asyncio.Future, started: float):
+        duration = time.monotonic() - started
+        self.running -= 1
+        self._busy_seconds += duration
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self._get_slots().release()
+
+    def stats(self) -> dict:
+        """Queue depth and worker utilisation"""
+        uptime = max(time.monotonic() - self._started_at, 1e-9)
+        return {
+            "executor": self.executor_kind,
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "utilisation": round(self.running / self.workers, 3),
+            "busy_ratio": round(min(1.0, self._busy_seconds / (uptime * self.workers)), 3),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        for executor in (self._executor, self._local_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._local_executor = None
+        self._slots = None
+
+
+# Singleton instance
+worker_pool = WorkerPool()
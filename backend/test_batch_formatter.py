@@ -0,0 +1,50 @@
+import asyncio
+import io
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from docx import Document
+
+from models.formatting_options import FormattingOptions, TextFormattingOptions
+from services.batch_formatter import BatchFormatter
+from services.document_processor import document_processor
+from services.worker_pool import WorkerPool
+from test_formatting_engine import build_sample_document
+
+
+def test_batch_streams_outputs_and_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    file_ids = [
+        document_processor.save_uploaded_file(source.read_bytes(), "source.docx")
+        for _ in range(3)
+    ]
+    options = FormattingOptions(text=TextFormattingOptions(font_size=11))
+
+    async def collect():
+        pool = WorkerPool(workers=2, max_queue=0, executor="thread")
+        chunks = [
+            chunk async for chunk in BatchFormatter(pool).stream_zip(file_ids + ["missing"], options)
+        ]
+        pool.shutdown()
+        return chunks
+
+    chunks = asyncio.run(collect())
+    assert len(chunks) > 1
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    manifest = json.loads(archive.read("manifest.json"))
+    assert manifest["succeeded"] == 3
+    assert manifest["failed"] == 1
+    assert [entry["file_id"] for entry in manifest["files"]] == file_ids + ["missing"]
+    assert manifest["files"][-1]["error"] == "Document not found"
+
+    for entry in manifest["files"][:3]:
+        doc = Document(io.BytesIO(archive.read(entry["filename"])))
+        assert doc.paragraphs[0].runs[0].font.size.pt == 11
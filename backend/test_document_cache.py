@@ -0,0 +1,61 @@
+import os
+import sys
+from pathlib import Path
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_cache import DocumentCache, estimate_document_size
+from services.package_writer import save_document
+from test_formatting_engine import build_sample_document
+
+
+def test_writable_copies_never_touch_the_cached_parse(tmp_path):
+    path = str(tmp_path / "sample.docx")
+    build_sample_document(path)
+    cache = DocumentCache()
+
+    first = cache.open(path)
+    first.paragraphs[0].text = "Changed by a format job"
+    second = cache.open(path)
+    shared = cache.open(path, writable=False)
+
+    assert second.paragraphs[0].text != "Changed by a format job"
+    assert shared is cache.open(path, writable=False)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 3
+
+
+def test_rewritten_file_is_parsed_again(tmp_path):
+    path = str(tmp_path / "sample.docx")
+    build_sample_document(path)
+    cache = DocumentCache()
+    doc = cache.open(path)
+
+    doc.paragraphs[0].text = "Second version"
+    save_document(doc, path)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert cache.open(path).paragraphs[0].text == "Second version"
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_memory_limit_evicts_least_recently_used(tmp_path):
+    paths = []
+    for name in ["a", "b", "c"]:
+        path = str(tmp_path / f"{name}.docx")
+        build_sample_document(path)
+        paths.append(path)
+    size = estimate_document_size(paths[0])
+    cache = DocumentCache(max_bytes=size * 2 + size // 2)
+
+    cache.open(paths[0], writable=False)
+    cache.open(paths[1], writable=False)
+    cache.open(paths[0], writable=False)
+    cache.open(paths[2], writable=False)
+
+    assert list(cache.entries) == [paths[0], paths[2]]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+from docx import Document
+from docx.enum.section import WD_SECTION
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_preview import read_preview
+from test_formatting_engine import build_sample_document
+
+
+def docx_preview(path, limit=50):
+    """The preview as it was computed with a full python-docx parse"""
+    doc = Document(path)
+    content = [p.text for p in doc.paragraphs if p.text.strip()]
+    return {
+        "content": "\n\n".join(content[:limit]),
+        "page_count": len(doc.sections),
+        "paragraph_count": len(doc.paragraphs),
+    }
+
+
+def test_preview_matches_python_docx(tmp_path):
+    path = tmp_path / "sample.docx"
+    build_sample_document(path)
+    doc = Document(path)
+    run = doc.add_paragraph("Line one").add_run()
+    run.add_break()
+    run.add_tab()
+    run.add_text("line two")
+    doc.add_section(WD_SECTION.NEW_PAGE)
+    doc.add_paragraph("In the second section")
+    doc.save(path)
+
+    assert read_preview(str(path)) == docx_preview(path)
+
+
+def test_preview_keeps_exact_counts_past_requested_paragraphs(tmp_path):
+    path = tmp_path / "long.docx"
+    doc = Document()
+    for i in range(500):
+        doc.add_paragraph(f"Paragraph {i}")
+        doc.add_paragraph("")
+        if i % 100 == 99:
+            doc.add_section(WD_SECTION.NEW_PAGE)
+    doc.add_table(rows=2, cols=2).cell(0, 0).text = "In a table"
+    doc.add_paragraph("Last")
+    doc.save(path)
+
+    preview = read_preview(str(path), max_paragraphs=10)
+
+    assert preview == docx_preview(path, limit=10)
+    assert preview["page_count"] == 6
@@ -0,0 +1,90 @@
+import io
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+from docx import Document
+from docx.enum.section import WD_SECTION
+from docx.enum.text import WD_BREAK
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor
+from services.document_stats import StatsCache, read_stats
+from test_formatting_engine import build_sample_document
+
+
+def png_bytes():
+    """A 1x1 PNG, enough for python-docx to embed a picture"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00\x00")) + chunk(b"IEND", b""))
+
+
+def build_document(path):
+    build_sample_document(path)
+    doc = Document(path)
+    doc.add_picture(io.BytesIO(png_bytes()))
+    doc.add_paragraph("Before the break").add_run().add_break(WD_BREAK.PAGE)
+    doc.add_section(WD_SECTION.CONTINUOUS)
+    doc.add_paragraph("Same page")
+    doc.add_section(WD_SECTION.NEW_PAGE)
+    doc.add_paragraph("Last section")
+    doc.save(path)
+    return doc
+
+
+def test_stats_count_the_whole_body(tmp_path):
+    path = tmp_path / "sample.docx"
+    doc = build_document(path)
+    body = doc.element.body
+
+    stats = read_stats(str(path))
+
+    assert stats["paragraphs"] == len(body.xpath(".//w:p"))
+    assert stats["tables"] == 3
+    assert stats["images"] == 1
+    assert stats["sections"] == len(doc.sections) == 3
+    # The template's app.xml says one page, the page break and the new page section add two
+    assert stats["pages"] == 3 and not stats["pages_estimated"]
+    # Table cells and the text box count too
+    assert stats["words"] > sum(len(p.text.split()) for p in doc.paragraphs)
+    assert stats["characters_with_spaces"] - stats["characters"] >= stats["words"] - stats["paragraphs"]
+
+
+def test_stats_are_cached_per_content_hash(tmp_path, monkeypatch):
+    path = tmp_path / "sample.docx"
+    build_document(path)
+    processor = DocumentProcessor(upload_dir=str(tmp_path / "uploads"))
+    first = processor.save_uploaded_file(path.read_bytes(), "a.docx")
+    second = processor.save_uploaded_file(path.read_bytes(), "b.docx")
+    assert processor.cached_document_stats(first) is None
+
+    stats = processor.get_document_stats(first)
+
+    # Another alias of the same content, and another process, only read the cache file
+    monkeypatch.setattr(sys.modules["services.document_processor"], "read_stats", None)
+    other_process = DocumentProcessor(upload_dir=str(tmp_path / "uploads"))
+    assert other_process.cached_document_stats(second) == stats
+    assert other_process.get_document_stats(second) == stats
+
+    processor.delete_file(first)
+    assert processor.cached_document_stats(second) == stats
+    processor.delete_file(second)
+    assert DocumentProcessor(upload_dir=str(tmp_path / "uploads")).cached_document_stats(second) is None
+
+
+def test_stats_cache_keeps_the_most_recently_used_in_memory(tmp_path):
+    cache = StatsCache(str(tmp_path / "stats"), max_entries=2)
+    for content_hash in ("a", "b"):
+        cache.put(content_hash, {"words": len(content_hash)})
+    cache.get("a")
+    cache.put("c", {"words": 1})
+
+    assert list(cache.entries) == ["a", "c"]
+    # Evicted entries are still on disk
+    assert cache.get("b") == {"words": 1}
+    assert list(cache.entries) == ["c", "b"]
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import io
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor, FileTooLargeError
+from services.storage import LocalStorage
+
+
+class FakeUpload:
+    """Minimal stand-in for UploadFile that records the largest read"""
+
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+        self.largest_read = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self.largest_read = max(self.largest_read, len(chunk))
+        return chunk
+
+
+def test_upload_is_streamed_and_hashed(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    data = b"x" * (3 * 1024 * 1024 + 17)
+    upload = FakeUpload(data)
+
+    saved = asyncio.run(processor.save_upload_stream(upload, "report.docx", 10 * 1024 * 1024))
+
+    assert saved["size"] == len(data)
+    assert saved["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert upload.largest_read <= 1024 * 1024
+    assert Path(processor.get_file_path(saved["file_id"])).read_bytes() == data
+
+
+def test_upload_over_limit_leaves_nothing_behind(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    upload = FakeUpload(b"x" * (2 * 1024 * 1024 + 1))
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(processor.save_upload_stream(upload, "report.docx", 2 * 1024 * 1024))
+
+    assert not list(tmp_path.glob("**/*.part"))
+    assert processor.blob_store.stats()["blobs"] == 0
+
+
+def test_repeated_uploads_share_one_blob(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    data = b"same template"
+
+    first = processor.save_uploaded_file(data, "template.docx")
+    second = asyncio.run(processor.save_upload_stream(FakeUpload(data), "template.docx", 1024))["file_id"]
+    other = processor.save_uploaded_file(b"another document", "other.docx")
+
+    assert first != second
+    assert processor.get_file_path(first) == processor.get_file_path(second)
+    assert processor.get_file_path(other) != processor.get_file_path(first)
+    assert processor.blob_store.stats()["blobs"] == 2
+    assert not list(tmp_path.glob("blobs/*.part"))
+
+    shared_path = processor.get_file_path(first)
+    processor.delete_file(first)
+    assert processor.get_file_path(first) is None
+    assert Path(processor.get_file_path(second)).read_bytes() == data
+
+    processor.delete_file(second)
+    assert processor.get_file_path(second) is None
+    assert not Path(shared_path).exists()
+
+
+def test_release_and_add_of_the_same_content_do_not_race(tmp_path):
+    deleting, resume = threading.Event(), threading.Event()
+
+    class SlowDelete(LocalStorage):
+        def delete(self, key):
+            deleting.set()
+            resume.wait(5)
+            super().delete(key)
+
+    processor = DocumentProcessor(upload_dir=str(tmp_path), storage=SlowDelete(str(tmp_path)))
+    data = b"same template"
+    first = processor.save_uploaded_file(data, "template.docx")
+    added = {}
+
+    release = threading.Thread(target=processor.delete_file, args=(first,))
+    release.start()
+    assert deleting.wait(5)
+    add = threading.Thread(target=lambda: added.update(file_id=processor.save_uploaded_file(data, "template.docx")))
+    add.start()
+    add.join(0.3)
+    # The new upload waits for the old blob to be deleted instead of being deleted with it
+    assert add.is_alive()
+
+    resume.set()
+    release.join(5)
+    add.join(5)
+    assert Path(processor.get_file_path(added["file_id"])).read_bytes() == data
+
+
+def test_storing_a_blob_does_not_lock_the_registry(tmp_path):
+    writable = []
+
+    class SlowCommit(LocalStorage):
+        def commit(self, staged, key):
+            db = sqlite3.connect(processor.registry.index_path, timeout=0.1, isolation_level=None)
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute("ROLLBACK")
+                writable.append(True)
+            except sqlite3.OperationalError:
+                writable.append(False)
+            finally:
+                db.close()
+            super().commit(staged, key)
+
+    processor = DocumentProcessor(upload_dir=str(tmp_path), storage=SlowCommit(str(tmp_path)))
+    file_id = processor.save_uploaded_file(b"new template", "template.docx")
+
+    assert writable == [True]
+    assert Path(processor.get_file_path(file_id)).read_bytes() == b"new template"
+
+
+def test_blob_stored_meanwhile_replaces_the_duplicate(tmp_path):
+    other = {}
+
+    class RacingCommit(LocalStorage):
+        def commit(self, staged, key):
+            if "file_id" not in other:
+                # Another upload of the same content is stored while this one is
+                other["file_id"] = None
+                other["file_id"] = processor.save_uploaded_file(b"same template", "template.doc")
+            super().commit(staged, key)
+
+    processor = DocumentProcessor(upload_dir=str(tmp_path), storage=RacingCommit(str(tmp_path)))
+    file_id = processor.save_uploaded_file(b"same template", "template.docx")
+
+    assert processor.get_file_path(file_id) == processor.get_file_path(other["file_id"])
+    assert processor.get_file_path(file_id).endswith(".doc")
+    assert [p.suffix for p in tmp_path.glob("blobs/*") if p.suffix != ".sqlite3"] == [".doc"]
+    assert processor.blob_store.stats()["blobs"] == 1
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from routers import document_router
+from services import document_processor
+from test_formatting_engine import build_sample_document
+
+app = FastAPI()
+app.include_router(document_router)
+
+
+def request(path, headers=None, method="GET"):
+    """Send one request straight to the ASGI app and return status, headers and body"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "server": ("test", 80), "client": ("test", 1234),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], {name.decode(): value.decode() for name, value in start["headers"]}, body
+
+
+def uploaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    path = tmp_path / "source.docx"
+    build_sample_document(path)
+    content = path.read_bytes()
+    return document_processor.save_uploaded_file(content, "source.docx"), content
+
+
+def test_etag_is_the_content_hash_and_revalidates(tmp_path, monkeypatch):
+    file_id, content = uploaded(tmp_path, monkeypatch)
+    etag = f'"{hashlib.sha256(content).hexdigest()}"'
+
+    status, headers, body = request(f"/api/download/{file_id}")
+    assert status == 200 and body == content
+    assert headers["etag"] == etag
+    assert headers["cache-control"] and headers["accept-ranges"] == "bytes"
+
+    status, headers, body = request(f"/api/download/{file_id}", {"If-None-Match": f'"other", W/{etag}'})
+    assert (status, body) == (304, b"") and headers["etag"] == etag
+    status, _, _ = request(f"/api/download/{file_id}", {"If-Modified-Since": headers["last-modified"]})
+    assert status == 304
+    # If-None-Match wins over If-Modified-Since
+    status, _, _ = request(f"/api/download/{file_id}", {
+        "If-None-Match": '"other"', "If-Modified-Since": headers["last-modified"],
+    })
+    assert status == 200
+
+
+def test_ranges_resume_downloads(tmp_path, monkeypatch):
+    file_id, content = uploaded(tmp_path, monkeypatch)
+    _, headers, _ = request(f"/api/download/{file_id}")
+
+    status, range_headers, body = request(f"/api/download/{file_id}", {"Range": "bytes=100-"})
+    assert status == 206 and body == content[100:]
+    assert range_headers["content-range"] == f"bytes 100-{len(content) - 1}/{len(content)}"
+
+    # A stale validator in If-Range gets the whole file
+    status, _, body = request(f"/api/download/{file_id}", {"Range": "bytes=100-", "If-Range": '"stale"'})
+    assert status == 200 and body == content
+    status, _, body = request(f"/api/download/{file_id}", {"Range": "bytes=0-9", "If-Range": headers["etag"]})
+    assert status == 206 and body == content[:10]
+
+
+def test_formatted_output_is_hashed_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    formatted = tmp_path / "formatted-id_formatted.docx"
+    formatted.write_bytes(b"formatted bytes")
+
+    status, headers, _ = request("/api/download/formatted-id", method="HEAD")
+    assert status == 200 and headers["etag"] == f'"{hashlib.sha256(b"formatted bytes").hexdigest()}"'
+    assert 'filename="formatted_document.docx"' in headers["content-disposition"]
+
+    # Kept in the registry, the next download does not read the file again
+    assert document_processor.registry.get("formatted-id").content_hash == headers["etag"].strip('"')
+
+    assert request("/api/download/missing")[0] == 404
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services import document_processor
+from services.document_processor import DocumentProcessor
+from services.file_registry import FORMATTED, UPLOAD, FileRegistry
+from models.formatting_options import FormattingOptions
+from test_download_caching import request
+from test_formatting_engine import build_sample_document
+
+
+def sample_bytes(tmp_path):
+    path = tmp_path / "sample.docx"
+    build_sample_document(path)
+    return path.read_bytes()
+
+
+def test_uploads_and_outputs_are_registered(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path / "uploads"))
+    content = sample_bytes(tmp_path)
+    report_id = processor.save_uploaded_file(content, "Quarterly Report.docx")
+    letter_id = processor.save_uploaded_file(content, "letter_100%.docx")
+    formatted_id = processor.format_document(report_id, FormattingOptions())
+
+    registry = processor.registry
+    formatted = registry.get(formatted_id)
+    assert (formatted.kind, formatted.parent_id, formatted.filename) == (FORMATTED, report_id, "Quarterly Report.docx")
+    assert formatted.size == Path(processor.storage.local_path(formatted.path)).stat().st_size
+    assert registry.get(report_id).content_hash == registry.get(letter_id).content_hash
+
+    assert registry.search(kind=UPLOAD)[0] == 2
+    assert [r.file_id for r in registry.search(parent_id=report_id)[1]] == [formatted_id]
+    assert [r.file_id for r in registry.search(kind=UPLOAD, filename="report")[1]] == [report_id]
+    # LIKE wildcards in the filter match literally
+    assert [r.file_id for r in registry.search(filename="_100%")[1]] == [letter_id]
+    assert registry.search(filename="1_0")[0] == 0
+    total, page = registry.search(limit=1, offset=1)
+    assert total == 3 and len(page) == 1
+
+    # Only uploads can be formatted
+    assert processor.get_file_path(formatted_id) is None
+    processor.delete_file(formatted_id)
+    assert registry.get(formatted_id) is None
+    assert not list((tmp_path / "uploads").glob("*_formatted.docx"))
+
+
+def write_legacy_blob(upload_dir, content, file_id):
+    """Store an upload the way earlier versions did, with its alias in blobs/index.sqlite3"""
+    content_hash = hashlib.sha256(content).hexdigest()
+    (upload_dir / "blobs").mkdir(parents=True)
+    (upload_dir / "blobs" / f"{content_hash}.docx").write_bytes(content)
+    db = sqlite3.connect(str(upload_dir / "blobs" / "index.sqlite3"))
+    db.execute("CREATE TABLE blobs (content_hash TEXT PRIMARY KEY, extension TEXT, size INTEGER, refcount INTEGER)")
+    db.execute("CREATE TABLE aliases (file_id TEXT PRIMARY KEY, content_hash TEXT, created_at REAL)")
+    db.execute("INSERT INTO blobs VALUES (?, '.docx', ?, 1)", (content_hash, len(content)))
+    db.execute("INSERT INTO aliases VALUES (?, ?, 1000.0)", (file_id, content_hash))
+    db.commit()
+    db.close()
+    return content_hash
+
+
+def test_existing_files_are_imported_once(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    content = sample_bytes(tmp_path)
+    # Stored before the registry existed: a content-addressed upload, a legacy upload and an output
+    content_hash = write_legacy_blob(upload_dir, content, "blob-id")
+    (upload_dir / "legacy.docx").write_bytes(content)
+    (upload_dir / "output_formatted.docx").write_bytes(content)
+
+    processor = DocumentProcessor(upload_dir=str(upload_dir))
+    registry = processor.registry
+    assert registry.get("blob-id").content_hash == content_hash
+    assert Path(processor.get_file_path("blob-id")).read_bytes() == content
+    assert Path(processor.get_file_path("legacy")).read_bytes() == content
+    assert registry.get("output").kind == FORMATTED
+    assert processor.get_download("output")["filename"] == "formatted_document.docx"
+    assert registry.search()[0] == 3
+
+    # The imported alias shares its blob with new uploads of the same content
+    again = processor.save_uploaded_file(content, "again.docx")
+    assert processor.get_file_path(again) == processor.get_file_path("blob-id")
+    processor.delete_file("blob-id")
+    assert Path(processor.get_file_path(again)).read_bytes() == content
+
+    # Files appearing later are not looked for on disk
+    (upload_dir / "late.docx").write_bytes(content)
+    assert DocumentProcessor(upload_dir=str(upload_dir)).get_file_path("late") is None
+
+
+def test_registry_location_and_journal_mode(tmp_path):
+    index_path = tmp_path / "shared" / "files.sqlite3"
+    registry = FileRegistry(str(tmp_path / "uploads"), str(index_path), journal_mode="DELETE")
+    registry.register("a", UPLOAD, "a.docx", 10)
+    assert index_path.exists() and not (tmp_path / "uploads" / "registry.sqlite3").exists()
+    assert registry.select("PRAGMA journal_mode")[0][0] == "delete"
+    # One connection per thread, reused across calls
+    assert registry._connection() is registry._connection()
+    with pytest.raises(ValueError):
+        FileRegistry(str(tmp_path), journal_mode="MEMORY")
+
+
+def test_documents_endpoint_lists_and_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path / "uploads"))
+    content = sample_bytes(tmp_path)
+    first = document_processor.save_uploaded_file(content, "first.docx")
+    second = document_processor.save_uploaded_file(content, "second.docx")
+
+    status, _, body = request("/api/documents?kind=upload&limit=1")
+    listing = json.loads(body)
+    assert status == 200 and listing["total"] == 2
+    assert [document["file_id"] for document in listing["documents"]] == [second]
+    assert "path" not in listing["documents"][0]
+
+    status, _, body = request("/api/documents?q=FIRST")
+    assert [document["file_id"] for document in json.loads(body)["documents"]] == [first]
+    assert json.loads(request("/api/documents?created_after=2999-01-01T00:00:00Z")[2])["total"] == 0
+    assert request("/api/documents?kind=other")[0] == 422
@@ -0,0 +1,156 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from docx import Document
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from models.formatting_options import CleanupOptions, PageFormattingOptions
+from services.document_processor import DocumentProcessor
+from services.format_session import FormatSessionManager, SessionNotFoundError
+from services.metrics import format_metrics
+from services.storage_janitor import StorageJanitor
+from services.worker_pool import PoolSaturatedError, WorkerPool
+from test_download_caching import request
+from test_formatting_engine import OPTION_SETS, build_sample_document, part_blobs
+
+
+def open_session(tmp_path, options, **manager_options):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    file_id = processor.save_uploaded_file(source.read_bytes(), "source.docx")
+    janitor = StorageJanitor(processor)
+    pool = WorkerPool(workers=1, max_queue=0, executor="thread")
+    sessions = FormatSessionManager(processor, janitor, pool, **manager_options)
+    report = {}
+    session = asyncio.run(sessions.open(file_id, options, report))
+    return processor, janitor, sessions, session, report
+
+
+def output(tmp_path, file_id):
+    return part_blobs(Document(str(tmp_path / f"{file_id}_formatted.docx")))
+
+
+def test_changed_options_rerun_from_the_first_changed_stage(tmp_path):
+    options = OPTION_SETS["everything"]
+    processor, janitor, sessions, session, report = open_session(tmp_path, options)
+    assert report["reused"] == []
+    assert report["rerun"] == ["clean_markdown", "text", "coalesce", "paragraph", "page", "structure", "cleanup"]
+    first_output = report["result_file_id"]
+
+    changed = options.model_copy(update={"page": options.page.model_copy(update={"margin_top": 2})})
+    report = {}
+    asyncio.run(sessions.format(session.session_id, changed, report))
+
+    assert report["reused"] == ["clean_markdown", "text", "coalesce", "paragraph"]
+    assert report["rerun"] == ["page", "structure", "cleanup"]
+    assert "load" not in report["stages"] and "text" not in report["stages"]
+    # Same document as formatting from scratch; the earlier output is left to the janitor,
+    # as it may still be downloading
+    fresh = processor.format_document(session.file_id, changed)
+    assert output(tmp_path, report["result_file_id"]) == output(tmp_path, fresh)
+    assert processor.registry.get(first_output) is not None
+    assert processor.registry.get(report["result_file_id"]).parent_id == session.file_id
+
+    # Turning normalize_formatting off changes the coalesce stage, right after text
+    report = {}
+    without_coalesce = changed.model_copy(update={"cleanup": CleanupOptions(clean_copied_text=True)})
+    asyncio.run(sessions.format(session.session_id, without_coalesce, report))
+    assert report["reused"] == ["clean_markdown", "text"]
+    fresh = processor.format_document(session.file_id, without_coalesce)
+    assert output(tmp_path, report["result_file_id"]) == output(tmp_path, fresh)
+
+
+def test_unchanged_options_reuse_the_output(tmp_path):
+    options = OPTION_SETS["text_only"].model_copy(update={"page": PageFormattingOptions(margin_left=1.5)})
+    processor, janitor, sessions, session, report = open_session(tmp_path, options)
+
+    again = {}
+    asyncio.run(sessions.format(session.session_id, options, again))
+    assert again["rerun"] == [] and again["result_file_id"] == report["result_file_id"]
+    assert sessions.stats()["stages_reused"] == 7
+
+    # The source is pinned while the session is open
+    assert session.file_id in janitor._pins
+    sessions.close(session.session_id)
+    assert session.file_id not in janitor._pins
+    try:
+        sessions.get(session.session_id)
+    except SessionNotFoundError:
+        pass
+    else:
+        raise AssertionError("closed session still open")
+
+
+def test_unknown_session_is_404():
+    assert request("/api/sessions/missing", method="DELETE")[0] == 404
+
+
+def test_failed_save_leaves_the_session_as_it_was(tmp_path, monkeypatch):
+    options = OPTION_SETS["everything"]
+    processor, janitor, sessions, session, report = open_session(tmp_path, options)
+    first_output = report["result_file_id"]
+    changed = options.model_copy(update={"page": options.page.model_copy(update={"margin_top": 2})})
+
+    def full_disk(doc, source):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(processor, "save_formatted", full_disk)
+    with pytest.raises(OSError):
+        asyncio.run(sessions.format(session.session_id, changed, {}))
+    assert session.result_file_id == first_output and processor.registry.get(first_output) is not None
+    monkeypatch.undo()
+
+    # The retry runs the changed stages again instead of answering with the old output
+    report = {}
+    asyncio.run(sessions.format(session.session_id, changed, report))
+    assert report["rerun"] == ["page", "structure", "cleanup"]
+    assert report["result_file_id"] != first_output
+    fresh = processor.format_document(session.file_id, changed)
+    assert output(tmp_path, report["result_file_id"]) == output(tmp_path, fresh)
+
+
+def test_sessions_share_the_worker_pool_and_a_memory_budget(tmp_path):
+    options = OPTION_SETS["text_only"]
+    processor, janitor, sessions, session, report = open_session(tmp_path, options, max_bytes=1)
+    assert 'docformatter_format_seconds_count{cache="session"}' in format_metrics.render()
+
+    async def busy():
+        # Every worker is taken and the queue is empty
+        await sessions.pool._get_slots().acquire()
+        try:
+            await sessions.format(session.session_id, OPTION_SETS["everything"], {})
+        finally:
+            sessions.pool._get_slots().release()
+
+    with pytest.raises(PoolSaturatedError):
+        asyncio.run(busy())
+
+    # Over the budget, opening another session closes the least recently used one
+    other = asyncio.run(sessions.open(session.file_id, options, {}))
+    assert list(sessions.sessions) == [other.session_id]
+    assert session.base is None and session.checkpoints == []
+
+
+def test_closing_during_a_format_lets_it_finish(tmp_path, monkeypatch):
+    options = OPTION_SETS["text_only"]
+    processor, janitor, sessions, session, report = open_session(tmp_path, options)
+    save_formatted = processor.save_formatted
+
+    def closed_while_saving(doc, source):
+        sessions.close(session.session_id)
+        # The running format still holds the session's documents
+        assert session.base is not None
+        return save_formatted(doc, source)
+
+    monkeypatch.setattr(processor, "save_formatted", closed_while_saving)
+    report = {}
+    asyncio.run(sessions.format(session.session_id, OPTION_SETS["everything"], report))
+    assert processor.registry.get(report["result_file_id"]) is not None
+    assert session.base is None and session.checkpoints == []
+    with pytest.raises(SessionNotFoundError):
+        session.format(options, {})
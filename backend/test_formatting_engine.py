@@ -0,0 +1,301 @@
+import sys
+from pathlib import Path
+
+import pytest
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import PartFactory, XmlPart
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.shared import Pt, RGBColor
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor
+from services.lazy_package import open_document
+from services.story_traversal import NAMESPACES, story_paragraphs
+from models.formatting_options import (
+    FormattingOptions,
+    TextFormattingOptions,
+    ParagraphFormattingOptions,
+    PageFormattingOptions,
+    DocumentStructureOptions,
+    CleanupOptions,
+    FontFamily,
+    TextAlignment,
+    LineSpacing,
+    HighlightColor,
+    BorderStyle,
+    PageSize,
+)
+
+
+def build_sample_document(path):
+    """Create a document exercising markdown, headings, blank lines and tables"""
+    doc = Document()
+    doc.add_paragraph("# Report Title")
+    doc.add_paragraph("## **Overview**:")
+    doc.add_paragraph("Some **bold**  text with   extra spaces and `code`.")
+    doc.add_paragraph("")
+    doc.add_paragraph("")
+    doc.add_paragraph("---")
+    doc.add_paragraph("### Details")
+    p = doc.add_paragraph()
+    run = p.add_run("Bold lead-in")
+    run.bold = True
+    run.font.size = Pt(14)
+    p = doc.add_paragraph()
+    p.add_run("Split ").italic = True
+    p.add_run(" runs  with ~~strike~~ ")
+    p.add_run("and _underscores_")
+    doc.add_paragraph("")
+    doc.add_heading("Real heading", level=2)
+
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "Cell **one**"
+    table.cell(0, 1).text = "Cell two"
+    merged = table.cell(1, 0).merge(table.cell(1, 1))
+    merged.text = "Merged cell"
+
+    doc.add_paragraph("Table  of Contents ")
+    doc.add_paragraph("Closing paragraph")
+    add_other_stories(doc)
+    doc.save(path)
+
+
+def add_other_stories(doc):
+    """Add a nested table, a text box, a header and footnotes, each with markdown"""
+    outer = doc.add_table(rows=1, cols=1)
+    outer.cell(0, 0).paragraphs[0].text = "Outer **cell**"
+    outer.cell(0, 0).add_table(rows=1, cols=1).cell(0, 0).text = "Nested **cell**"
+    outer.cell(0, 0).add_paragraph("---")
+
+    anchor = doc.add_paragraph("Anchor ")
+    anchor._p.append(parse_xml(
+        f'<w:r {nsdecls("w")} xmlns:v="urn:schemas-microsoft-com:vml"><w:pict><v:shape><v:textbox><w:txbxContent>'
+        '<w:p><w:r><w:t>Text box **bold**</w:t></w:r></w:p>'
+        '</w:txbxContent></v:textbox></v:shape></w:pict></w:r>'
+    ))
+
+    doc.sections[0].header.paragraphs[0].text = "Header  with *emphasis*"
+
+    footnotes = parse_xml(
+        f'<w:footnotes {nsdecls("w")}>'
+        '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>'
+        '<w:footnote w:id="1"><w:p><w:r><w:t>Footnote ~~text~~</w:t></w:r></w:p></w:footnote>'
+        '</w:footnotes>'
+    )
+    part = XmlPart(PackURI("/word/footnotes.xml"), CT.WML_FOOTNOTES, footnotes, doc.part.package)
+    doc.part.relate_to(part, RT.FOOTNOTES)
+
+
+OPTION_SETS = {
+    "text_only": FormattingOptions(
+        text=TextFormattingOptions(
+            font_family=FontFamily.GEORGIA,
+            font_size=11,
+            font_color="#333333",
+            bold=False,
+            highlight_color=HighlightColor.YELLOW,
+            strikethrough=False,
+            line_spacing=LineSpacing.ONE_POINT_FIVE,
+            text_alignment=TextAlignment.JUSTIFY,
+        )
+    ),
+    "paragraph_cleanup": FormattingOptions(
+        paragraph=ParagraphFormattingOptions(
+            remove_extra_spaces=True,
+            remove_blank_lines=True,
+            background_color="#EEEEEE",
+            border_style=BorderStyle.SINGLE,
+            keep_with_next=True,
+        ),
+        cleanup=CleanupOptions(
+            remove_inconsistent_fonts=True,
+            normalize_formatting=True,
+            clean_copied_text=True,
+            fix_alignment_issues=True,
+        ),
+    ),
+    "text_styles": FormattingOptions(
+        text=TextFormattingOptions(
+            font_family=FontFamily.GEORGIA,
+            font_size=11,
+            font_color="#333333",
+            strikethrough=False,
+            line_spacing=LineSpacing.ONE_POINT_FIVE,
+            apply_to_styles=True,
+        ),
+        cleanup=CleanupOptions(clean_copied_text=True),
+    ),
+    "everything": FormattingOptions(
+        text=TextFormattingOptions(font_family=FontFamily.CALIBRI, font_size=12),
+        paragraph=ParagraphFormattingOptions(remove_extra_spaces=True, remove_blank_lines=True),
+        page=PageFormattingOptions(
+            page_size=PageSize.A4,
+            margin_top=1,
+            header_text="Header",
+            page_numbers=True,
+        ),
+        structure=DocumentStructureOptions(
+            normalize_headings=True,
+            create_toc=True,
+            heading_font_family=FontFamily.ARIAL,
+            h1_size=18,
+            h3_color="#112233",
+        ),
+        cleanup=CleanupOptions(
+            remove_inconsistent_fonts=True,
+            normalize_formatting=True,
+            clean_copied_text=True,
+            fix_alignment_issues=True,
+        ),
+    ),
+}
+
+
+def part_blobs(doc):
+    """Serialized XML of every part, keyed by part name"""
+    doc.part.package.parts  # noqa: B018 - force parts to load
+    return {
+        str(part.partname): part.blob
+        for part in doc.part.package.iter_parts()
+        if hasattr(part, "_element")
+    }
+
+
+@pytest.mark.parametrize("name", sorted(OPTION_SETS))
+def test_engine_matches_multipass(tmp_path, name):
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    options = OPTION_SETS[name]
+    processor = DocumentProcessor(upload_dir=str(tmp_path / "uploads"))
+
+    reference = open_document(str(source))
+    processor._apply_formatting_multipass(reference, options)
+
+    fused = open_document(str(source))
+    processor.engine.apply(fused, processor.engine.compile(options))
+
+    assert part_blobs(fused) == part_blobs(reference)
+
+
+def test_format_document_writes_output(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    file_id = processor.save_uploaded_file(source.read_bytes(), "source.docx")
+
+    formatted_id = processor.format_document(file_id, OPTION_SETS["everything"])
+
+    output = Document(str(tmp_path / f"{formatted_id}_formatted.docx"))
+    assert output.paragraphs[0].text == "Table of Contents"
+    assert not any("**" in p.text for p in output.paragraphs)
+
+
+def test_style_mode_moves_text_formatting_into_styles(tmp_path):
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    processor = DocumentProcessor(upload_dir=str(tmp_path / "uploads"))
+    options = OPTION_SETS["text_styles"]
+
+    per_run = Document(str(source))
+    text_only = options.text.model_copy(update={"apply_to_styles": None})
+    processor._apply_text_formatting(per_run, text_only)
+    styled = Document(str(source))
+    processor._apply_text_formatting(styled, options.text)
+
+    defaults = styled.styles.element.find(qn("w:docDefaults")).find(qn("w:rPrDefault")).find(qn("w:rPr"))
+    fonts = defaults.find(qn("w:rFonts"))
+    assert fonts.get(qn("w:ascii")) == "Georgia"
+    assert fonts.get(qn("w:asciiTheme")) is None
+    assert defaults.find(qn("w:sz")).get(qn("w:val")) == "22"
+    # Table cells inherit the defaults, so they only take what per-run mode gives cells
+    assert defaults.find(qn("w:color")) is None
+
+    # Direct formatting the styles now provide is gone, the rest stays
+    lead_in = styled.paragraphs[7].runs[0]
+    assert lead_in.font.size is None
+    assert lead_in.bold
+    assert lead_in.font.color.rgb == RGBColor(0x33, 0x33, 0x33)
+    assert styled.styles["Normal Table"].font.name == "Georgia"
+
+    # Cell runs get no colour of their own either, as in per-run mode
+    styled_cells, _ = story_paragraphs(styled)
+    per_run_cells, _ = story_paragraphs(per_run)
+    assert [run.font.color.rgb for p in styled_cells for run in p.runs] == \
+        [run.font.color.rgb for p in per_run_cells for run in p.runs]
+    assert all(run.font.color.rgb is None for p in styled_cells for run in p.runs)
+    assert len(part_blobs(styled)["/word/document.xml"]) < len(part_blobs(per_run)["/word/document.xml"])
+
+
+def test_every_story_is_formatted(tmp_path):
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    processor = DocumentProcessor(upload_dir=str(tmp_path / "uploads"))
+    doc = open_document(str(source))
+    processor._apply_formatting_multipass(doc, OPTION_SETS["text_only"])
+
+    outer = doc.tables[1].cell(0, 0)
+    nested = outer.tables[0].cell(0, 0).paragraphs[0]
+    text_box = doc.element.body.xpath(".//w:txbxContent/w:p")[0]
+    footnotes = next(
+        rel.target_part.element for rel in doc.part.rels.values() if rel.reltype == RT.FOOTNOTES
+    )
+    header = doc.sections[0].header.paragraphs[0]
+
+    assert outer.paragraphs[0].text == "Outer cell"
+    assert nested.text == "Nested cell"
+    assert nested.runs[0].font.name == "Georgia"
+    # The cell's last paragraph is emptied rather than removed
+    assert outer._tc[-1].tag == qn("w:p") and outer.paragraphs[-1].text == ""
+    assert "".join(text_box.xpath(".//w:t/text()")) == "Text box bold"
+    assert text_box.xpath("./w:r/w:rPr/w:sz/@w:val") == ["22"]
+    assert header.text == "Header  with emphasis"
+    assert header.runs[0].font.name == "Georgia"
+    assert "".join(footnotes.xpath("./w:footnote[@w:id='1']//w:t/text()", namespaces=NAMESPACES)) == "Footnote text"
+    assert footnotes.xpath("./w:footnote[@w:type='separator']//w:rPr", namespaces=NAMESPACES) == []
+
+
+def test_notes_are_xml_parts_only_for_the_formatter(tmp_path):
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+
+    def footnotes_part(doc):
+        return next(rel.target_part for rel in doc.part.rels.values() if rel.reltype == RT.FOOTNOTES)
+
+    for lazy_media in (True, False):
+        assert isinstance(footnotes_part(open_document(str(source), lazy_media)), XmlPart)
+    with open(source, "rb") as stream:
+        assert isinstance(footnotes_part(open_document(stream)), XmlPart)
+    # python-docx itself is left as it is
+    assert CT.WML_FOOTNOTES not in PartFactory.part_type_for
+    assert not isinstance(footnotes_part(Document(str(source))), XmlPart)
+
+
+def test_normalize_formatting_merges_identical_runs(tmp_path):
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    for word in ["one ", "two ", "three "]:
+        paragraph.add_run(word)
+    paragraph.add_run("bold ").bold = True
+    paragraph.add_run("still bold").bold = True
+    paragraph.add_run().add_tab()
+    paragraph.add_run("after tab")
+    cell_paragraph = doc.add_table(rows=1, cols=1).cell(0, 0).paragraphs[0]
+    cell_paragraph.add_run("cell ")
+    cell_paragraph.add_run("text")
+
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    options = FormattingOptions(
+        text=TextFormattingOptions(font_size=11),
+        cleanup=CleanupOptions(normalize_formatting=True),
+    )
+    processor.engine.apply(doc, processor.engine.compile(options))
+
+    runs = doc.paragraphs[0].runs
+    assert [run.text for run in runs] == ["one two three ", "bold still bold", "\t", "after tab"]
+    assert [run.bold for run in runs] == [None, True, None, None]
+    assert [run.text for run in doc.tables[0].cell(0, 0).paragraphs[0].runs] == ["cell text"]
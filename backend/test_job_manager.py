@@ -0,0 +1,86 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from models.formatting_options import FormattingOptions, TextFormattingOptions, JobStatus
+from services.document_processor import document_processor
+from services.job_manager import JobManager, JobFinishedError
+from services.worker_pool import WorkerPool
+from test_formatting_engine import build_sample_document
+
+
+@pytest.fixture
+def uploaded_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    return document_processor.save_uploaded_file(source.read_bytes(), "source.docx")
+
+
+def test_job_runs_to_completion(tmp_path, uploaded_file):
+    options = FormattingOptions(text=TextFormattingOptions(font_size=11))
+
+    async def scenario():
+        manager = JobManager(pool=WorkerPool(workers=1, max_queue=4, executor="thread"))
+        job = manager.submit(uploaded_file, options)
+        assert job.status == JobStatus.QUEUED
+        await job.task
+        manager.pool.shutdown()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == JobStatus.DONE
+    assert (tmp_path / f"{job.result_file_id}_formatted.docx").exists()
+
+    response = job.to_response()
+    assert response.formatted_filename == f"{job.result_file_id}_formatted.docx"
+    assert response.finished_at is not None
+
+
+def test_cancel_queued_and_running_jobs(tmp_path, uploaded_file):
+    release = threading.Event()
+    options = FormattingOptions(text=TextFormattingOptions(font_size=11))
+
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=4, executor="thread")
+        manager = JobManager(pool=pool)
+        # Occupy the only worker until the test releases it
+        blocker = asyncio.create_task(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+
+        queued = manager.submit(uploaded_file, options)
+        await asyncio.sleep(0.05)
+        assert queued.status == JobStatus.QUEUED
+        manager.cancel(queued.job_id)
+        assert queued.status == JobStatus.CANCELLED
+        await asyncio.sleep(0)
+        assert pool.stats()["queued"] == 0
+
+        release.set()
+        await blocker
+        running = manager.submit(uploaded_file, options)
+        await asyncio.sleep(0)
+        while running.status == JobStatus.QUEUED:
+            await asyncio.sleep(0.001)
+        manager.cancel(running.job_id)
+        await running.task
+
+        with pytest.raises(JobFinishedError):
+            manager.cancel(running.job_id)
+        pool.shutdown()
+        return queued, running
+
+    try:
+        queued, running = asyncio.run(scenario())
+    finally:
+        release.set()
+    assert queued.result_file_id is None
+    assert running.status == JobStatus.CANCELLED
+    assert running.result_file_id is None
+    assert not list(tmp_path.glob("*_formatted.docx"))
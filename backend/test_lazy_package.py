@@ -0,0 +1,113 @@
+import functools
+import sys
+import tracemalloc
+import zipfile
+from pathlib import Path
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor
+from services.lazy_package import LazyBlob, SourceChangedError, load_blobs, open_document
+from services.package_writer import save_document
+from models.formatting_options import FormattingOptions, TextFormattingOptions, FontFamily
+from test_package_writer import build_document, members
+
+
+# The python-docx internals lazy_package and package_writer are built on
+PYTHON_DOCX_INTERNALS = [
+    ("docx.opc.phys_pkg", "_ZipPkgReader", ("blob_for", "content_types_xml", "close")),
+    ("docx.opc.phys_pkg", "PhysPkgReader", ("__new__",)),
+    ("docx.opc.pkgreader", "_ContentTypeMap", ("from_xml", "__getitem__")),
+    ("docx.opc.pkgreader", "PackageReader", ("_srels_for", "_load_serialized_parts")),
+    ("docx.opc.package", "Unmarshaller", ("unmarshal",)),
+    ("docx.opc.part", "PartFactory", ("part_type_for",)),
+    ("docx.opc.part", "XmlPart", ("load",)),
+    ("docx.opc.pkgwriter", "PackageWriter",
+     ("_write_content_types_stream", "_write_pkg_rels", "_write_parts")),
+]
+
+
+def image_parts(doc):
+    return [part for part in doc.part.package.iter_parts() if part.partname.startswith("/word/media/")]
+
+
+def test_binary_parts_stay_in_the_zip_until_saved(tmp_path):
+    source = tmp_path / "source.docx"
+    build_document(source)
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    options = FormattingOptions(text=TextFormattingOptions(font_family=FontFamily.ARIAL))
+
+    held = {}
+    eager_load = functools.partial(open_document, lazy_media=False)
+    for name, load in (("eager", eager_load), ("lazy", open_document)):
+        load(str(source))
+        tracemalloc.start()
+        loaded = load(str(source))
+        held[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if name == "lazy":
+            lazy = loaded
+        else:
+            eager = loaded
+
+    media = image_parts(lazy)
+    assert len(media) == 3 and all(isinstance(part._blob, LazyBlob) for part in media)
+    # None of the three 256KB images was read
+    assert held["eager"] - held["lazy"] > 3 * 256 * 1024
+    for doc in (lazy, eager):
+        processor.engine.apply(doc, processor.engine.compile(options))
+    eager.save(tmp_path / "expected.docx")
+    assert save_document(lazy, str(tmp_path / "actual.docx"), str(source)) >= len(media)
+    assert members(tmp_path / "actual.docx") == members(tmp_path / "expected.docx")
+
+
+def test_blobs_can_be_loaded_for_doc_save(tmp_path):
+    source = tmp_path / "source.docx"
+    build_document(source)
+    doc = open_document(str(source))
+
+    save_document(doc, str(tmp_path / "saved.docx"))
+
+    assert not any(isinstance(part._blob, LazyBlob) for part in image_parts(doc))
+    assert members(tmp_path / "saved.docx") == members(source)
+
+
+def test_changed_source_is_detected(tmp_path):
+    source = tmp_path / "source.docx"
+    build_document(source)
+    doc = open_document(str(source))
+    build_document(source)
+
+    with pytest.raises(SourceChangedError):
+        load_blobs(doc)
+    with pytest.raises(SourceChangedError):
+        save_document(doc, str(tmp_path / "saved.docx"), str(source))
+    assert zipfile.is_zipfile(source)
+
+
+@pytest.mark.parametrize("module, name, attributes", PYTHON_DOCX_INTERNALS)
+def test_python_docx_internals_are_still_there(module, name, attributes):
+    """Fails loudly, rather than deep in a request, on a python-docx release that moved them"""
+    cls = getattr(__import__(module, fromlist=[name]), name, None)
+    assert cls is not None, f"{module}.{name} is gone"
+    missing = [attribute for attribute in attributes if not hasattr(cls, attribute)]
+    assert not missing, f"{module}.{name} lost {missing}"
+
+
+def test_python_docx_instance_internals_are_still_there(tmp_path):
+    from docx.opc.phys_pkg import _ZipPkgReader
+
+    source = tmp_path / "source.docx"
+    build_document(source)
+    reader = _ZipPkgReader(str(source))
+    try:
+        assert isinstance(reader._zipf, zipfile.ZipFile)
+    finally:
+        reader.close()
+    # Binary parts keep their bytes in _blob, which LazyBlob stands in for
+    doc = open_document(str(source))
+    assert all(isinstance(part._blob, LazyBlob) for part in image_parts(doc))
+    assert image_parts(doc)
@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from lxml import etree
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from benchmarks.legacy_markdown import clean_markdown_paragraph as legacy_clean
+from services.markdown_cleaner import clean_paragraph
+
+
+@pytest.mark.parametrize("text", [
+    "Plain text without markup",
+    "Some **bold** and *italic* words",
+    "**AXONITY NETWORKS**",
+    "snake_case_name and ~~struck~~ and `code`",
+    "### **Heading Three**:",
+    "## Heading Two",
+    "# Heading One",
+    "#NotAHeading",
+    "---",
+    "  ---  ",
+])
+def test_single_run_paragraphs_match_legacy(text):
+    legacy_doc = Document()
+    legacy_doc.add_paragraph(text)
+    compiled_doc = Document()
+    compiled_doc.add_paragraph(text)
+
+    legacy_kept = legacy_clean(legacy_doc.paragraphs[0])
+    compiled_kept = clean_paragraph(compiled_doc.paragraphs[0])
+
+    assert compiled_kept == legacy_kept
+    assert [(p.text, p.style.name) for p in compiled_doc.paragraphs] == \
+        [(p.text, p.style.name) for p in legacy_doc.paragraphs]
+
+
+def test_markers_split_across_runs_are_removed():
+    doc = Document()
+    paragraph = doc.add_paragraph("The ")
+    paragraph.add_run("**")
+    paragraph.add_run("key point").bold = True
+    paragraph.add_run("**")
+    paragraph.add_run(" stays.")
+    untouched = [etree.tostring(r._r) for r in paragraph.runs]
+
+    assert clean_paragraph(paragraph)
+
+    assert paragraph.text == "The key point stays."
+    after = [etree.tostring(r._r) for r in paragraph.runs]
+    # Only the runs holding markers changed
+    assert [a == b for a, b in zip(untouched, after)] == [True, False, True, False, True]
+    assert paragraph.runs[2].bold
+
+
+def test_heading_keeps_run_formatting():
+    doc = Document()
+    paragraph = doc.add_paragraph("## ")
+    paragraph.add_run("**Results**").italic = True
+
+    assert clean_paragraph(paragraph)
+
+    assert paragraph.text == "Results"
+    assert paragraph.style.name == "Heading 2"
+    assert paragraph.runs[1].italic
+
+
+@pytest.mark.parametrize("rule", ["***", "___", "-----"])
+def test_every_horizontal_rule_is_removed(rule):
+    # Run by run, the italic passes turned "***" and "___" into a stray marker
+    doc = Document()
+    doc.add_paragraph("Before")
+    doc.add_paragraph(rule)
+
+    assert not clean_paragraph(doc.paragraphs[1])
+    assert [p.text for p in doc.paragraphs] == ["Before"]
+
+
+def test_markers_in_tracked_insertions_and_content_controls_are_removed():
+    doc = Document()
+    paragraph = doc.add_paragraph("Kept ")
+    paragraph._p.append(parse_xml(
+        f'<w:ins {nsdecls("w")} w:id="1" w:author="a"><w:r><w:t>**inserted**</w:t></w:r></w:ins>'
+    ))
+    paragraph._p.append(parse_xml(
+        f'<w:sdt {nsdecls("w")}><w:sdtContent><w:r><w:t xml:space="preserve"> and ~~control~~</w:t></w:r>'
+        '</w:sdtContent></w:sdt>'
+    ))
+
+    assert clean_paragraph(paragraph)
+
+    assert "".join(paragraph._p.xpath(".//w:t/text()")) == "Kept inserted and control"
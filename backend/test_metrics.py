@@ -0,0 +1,70 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from models.formatting_options import (
+    FormattingOptions,
+    TextFormattingOptions,
+    ParagraphFormattingOptions,
+    DocumentStructureOptions,
+)
+from services.document_processor import document_processor
+from services.metrics import FormatMetrics, server_timing
+from services.result_cache import format_document_cached
+from services.worker_pool import WorkerPool
+from test_formatting_engine import build_sample_document
+
+
+def test_format_report_has_stages_and_document_metrics(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    file_id = document_processor.save_uploaded_file(source.read_bytes(), "source.docx")
+    options = FormattingOptions(
+        text=TextFormattingOptions(font_size=11),
+        paragraph=ParagraphFormattingOptions(remove_blank_lines=True),
+        structure=DocumentStructureOptions(normalize_headings=True),
+    )
+    pool = WorkerPool(workers=1, max_queue=1, executor="thread")
+
+    async def scenario():
+        miss, hit = {}, {}
+        await format_document_cached(file_id, options, pool, miss)
+        await format_document_cached(file_id, options, pool, hit)
+        return miss, hit
+
+    try:
+        miss, hit = asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    assert {"cache", "load", "clean_markdown", "text", "paragraph", "structure", "save"} <= set(miss["stages"])
+    assert miss["document"]["bytes"] == source.stat().st_size
+    assert miss["document"]["paragraphs"] > 10
+    assert miss["document"]["runs"] >= miss["document"]["paragraphs"] - 5
+    assert set(hit["stages"]) == {"cache"}
+    assert hit["total"] <= miss["total"]
+
+
+def test_server_timing_and_prometheus_rendering():
+    assert server_timing({"load": 0.0123, "save": 0.5}) == "load;dur=12.3, save;dur=500.0"
+
+    metrics = FormatMetrics()
+    metrics.observe(
+        {"stages": {"load": 0.02}, "total": 0.3,
+         "document": {"bytes": 20000, "paragraphs": 50, "runs": 120}},
+        "miss",
+    )
+    text = metrics.render()
+
+    assert 'docformatter_format_stage_seconds_bucket{stage="load",le="0.025"} 1' in text
+    assert 'docformatter_format_stage_seconds_bucket{stage="load",le="0.01"} 0' in text
+    assert 'docformatter_format_seconds_count{cache="miss"} 1' in text
+    assert 'docformatter_document_paragraphs_bucket{le="100"} 1' in text
+    assert "docformatter_document_runs_sum 120" in text
+    # Byte bounds are written in full, not rounded to six significant digits
+    assert 'docformatter_document_bytes_bucket{le="4194304"} 1' in text
+    assert 'docformatter_document_bytes_bucket{le="1048576"} 1' in text
@@ -0,0 +1,106 @@
+import io
+import os
+import struct
+import sys
+import zipfile
+import zlib
+from pathlib import Path
+
+from docx import Document
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor
+from services.package_writer import save_document
+from models.formatting_options import FormattingOptions, TextFormattingOptions, FontFamily
+from test_formatting_engine import build_sample_document
+
+
+def png_bytes(padding: int = 0):
+    """A 1x1 PNG, with ``padding`` random bytes in an ancillary chunk"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+            + chunk(b"prVt", os.urandom(padding)) + chunk(b"IDAT", zlib.compress(b"\x00\x00"))
+            + chunk(b"IEND", b""))
+
+
+def build_document(path):
+    build_sample_document(path)
+    doc = Document(path)
+    for _ in range(3):
+        doc.add_picture(io.BytesIO(png_bytes(256 * 1024)))
+    doc.save(path)
+
+
+def members(path):
+    with zipfile.ZipFile(path) as package:
+        assert package.testzip() is None
+        return [(info.filename, package.read(info)) for info in package.infolist()]
+
+
+def raw_member(path, name):
+    with zipfile.ZipFile(path) as package:
+        info = package.getinfo(name)
+        with open(path, "rb") as f:
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            return info.compress_type, f.read(info.compress_size)
+
+
+def test_output_matches_doc_save_and_copies_unchanged_members(tmp_path):
+    source = tmp_path / "source.docx"
+    build_document(source)
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    options = FormattingOptions(text=TextFormattingOptions(font_family=FontFamily.GEORGIA))
+
+    doc = Document(source)
+    processor.engine.apply(doc, processor.engine.compile(options))
+    doc.save(tmp_path / "expected.docx")
+    copied = save_document(doc, str(tmp_path / "actual.docx"), str(source))
+
+    assert members(tmp_path / "actual.docx") == members(tmp_path / "expected.docx")
+    media = [name for name, _ in members(source) if name.startswith("word/media/")]
+    assert len(media) == 3 and copied >= len(media)
+    for name in media:
+        assert raw_member(tmp_path / "actual.docx", name) == raw_member(source, name)
+    # The formatted body changed, so it was compressed again
+    assert raw_member(tmp_path / "actual.docx", "word/document.xml") != raw_member(source, "word/document.xml")
+
+
+def test_stored_members_and_data_descriptors_are_copied(tmp_path):
+    built = tmp_path / "built.docx"
+    build_document(built)
+    # Stream the package out again, so every member has a data descriptor, with the images stored
+    source = tmp_path / "source.docx"
+    with zipfile.ZipFile(built) as package, open(source, "wb") as f:
+        with zipfile.ZipFile(NonSeekable(f), "w") as streamed:
+            for info in package.infolist():
+                member = zipfile.ZipInfo(info.filename, info.date_time)
+                if not info.filename.startswith("word/media/"):
+                    member.compress_type = zipfile.ZIP_DEFLATED
+                streamed.writestr(member, package.read(info))
+
+    doc = Document(source)
+    doc.save(tmp_path / "expected.docx")
+    copied = save_document(doc, str(tmp_path / "actual.docx"), str(source))
+
+    assert copied > 0
+    assert members(tmp_path / "actual.docx") == members(tmp_path / "expected.docx")
+    assert raw_member(tmp_path / "actual.docx", "word/media/image1.png") == raw_member(source, "word/media/image1.png")
+    assert raw_member(source, "word/media/image1.png")[0] == zipfile.ZIP_STORED
+
+
+class NonSeekable(io.RawIOBase):
+    """A write-only stream that cannot seek, as a socket"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.f.write(data)
@@ -0,0 +1,117 @@
+import sys
+from pathlib import Path
+
+import pytest
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor
+from services.property_templates import PARAGRAPH_PROPERTY_SEQUENCE
+from models.formatting_options import (
+    TextFormattingOptions,
+    ParagraphFormattingOptions,
+    FontFamily,
+    TextAlignment,
+    LineSpacing,
+    HighlightColor,
+    BorderStyle,
+)
+
+RUNS = [
+    '<w:r><w:t>bare</w:t></w:r>',
+    '<w:r><w:rPr/><w:t>empty properties</w:t></w:r>',
+    '<w:r><w:rPr><w:rStyle w:val="Emphasis"/><w:rFonts w:asciiTheme="minorHAnsi" w:cs="Arial"/>'
+    '<w:b w:val="0"/><w:color w:val="FF0000" w:themeColor="accent1"/><w:sz w:val="40"/>'
+    '<w:szCs w:val="40"/><w:vertAlign w:val="superscript"/><w:lang w:val="en-US"/></w:rPr>'
+    '<w:t>styled</w:t></w:r>',
+    '<w:r><w:rPr><w:i/><w:highlight w:val="green"/><w:u w:val="double" w:color="00FF00"/>'
+    '<w:vertAlign w:val="subscript"/></w:rPr><w:t>subscript</w:t></w:r>',
+]
+
+TEXT_OPTIONS = [
+    TextFormattingOptions(font_family=FontFamily.GEORGIA, font_size=11, font_color="#333333"),
+    TextFormattingOptions(
+        bold=True, italic=False, underline=True, strikethrough=False, double_strikethrough=True,
+        all_caps=False, small_caps=True, highlight_color=HighlightColor.YELLOW, character_spacing=2,
+    ),
+    TextFormattingOptions(superscript=False, subscript=True),
+    TextFormattingOptions(superscript=False, subscript=False, font_family=FontFamily.ARIAL),
+    TextFormattingOptions(superscript=True, subscript=False),
+    TextFormattingOptions(line_spacing=LineSpacing.DOUBLE),
+]
+
+PARAGRAPHS = [
+    '<w:p><w:r><w:t>bare</w:t></w:r></w:p>',
+    '<w:p><w:pPr><w:pStyle w:val="Heading1"/><w:keepNext w:val="0"/><w:spacing w:after="0" w:line="240"/>'
+    '<w:ind w:firstLine="720" w:right="100"/><w:jc w:val="center"/><w:rPr><w:b/></w:rPr></w:pPr>'
+    '<w:r><w:t>styled</w:t></w:r></w:p>',
+    '<w:p><w:pPr><w:ind w:hanging="360" w:left="720"/><w:sectPr/></w:pPr></w:p>',
+]
+
+PARAGRAPH_OPTIONS = [
+    ParagraphFormattingOptions(spacing_before=6, spacing_after=12, indent_left=0.5, first_line_indent=0.25),
+    ParagraphFormattingOptions(indent_right=1, hanging_indent=0.5, keep_lines_together=True,
+                               keep_with_next=False, page_break_before=True, widow_control=False),
+]
+
+
+def _element(xml):
+    """Parse a w:r or w:p snippet, declaring the namespace on its root"""
+    return parse_xml(xml.replace('>', f' {nsdecls("w")}>', 1))
+
+
+@pytest.mark.parametrize("options", TEXT_OPTIONS)
+@pytest.mark.parametrize("xml", RUNS)
+def test_run_template_matches_proxy_setters(tmp_path, options, xml):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    for table in (False, True):
+        expected = _element(xml)
+        format_run = processor._format_table_run if table else processor._format_text_run
+        format_run(Run(expected, None), options)
+
+        actual = _element(xml)
+        processor._text_run_template(options, table=table).apply(actual)
+
+        assert etree.tostring(actual) == etree.tostring(expected)
+
+
+@pytest.mark.parametrize("options", PARAGRAPH_OPTIONS)
+@pytest.mark.parametrize("xml", PARAGRAPHS)
+def test_paragraph_template_matches_proxy_setters(tmp_path, options, xml):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    text = TextFormattingOptions(line_spacing=LineSpacing.ONE_POINT_FIVE, text_alignment=TextAlignment.JUSTIFY)
+
+    expected = _element(xml)
+    processor._format_paragraph(Paragraph(expected, None), options)
+    processor._format_text_paragraph(Paragraph(expected, None), text)
+
+    actual = _element(xml)
+    processor._paragraph_template(lambda paragraph: processor._format_paragraph(paragraph, options)).apply(actual)
+    processor._text_paragraph_template(text).apply(actual)
+
+    assert etree.tostring(actual) == etree.tostring(expected)
+
+
+def test_shading_and_borders_are_replaced_in_schema_order(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    options = ParagraphFormattingOptions(
+        spacing_after=6, background_color="#EEEEEE", border_style=BorderStyle.DOTTED, border_color="#123456",
+    )
+    template = processor._paragraph_template(lambda paragraph: processor._format_paragraph(paragraph, options))
+    p = _element(PARAGRAPHS[1])
+
+    template.apply(p)
+    once = etree.tostring(p)
+    template.apply(p)
+
+    assert etree.tostring(p) == once
+    tags = [etree.QName(child).localname for child in p.pPr]
+    assert tags == sorted(tags, key=lambda tag: PARAGRAPH_PROPERTY_SEQUENCE.index(f"w:{tag}"))
+    assert p.pPr.find(qn("w:shd")).get(qn("w:fill")) == "EEEEEE"
+    assert len(p.pPr.findall(qn("w:pBdr"))) == 1
@@ -0,0 +1,91 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from models.formatting_options import (
+    FormattingOptions,
+    TextFormattingOptions,
+    ParagraphFormattingOptions,
+    CleanupOptions,
+)
+from services.document_processor import document_processor
+from services.result_cache import ResultCache, format_document_cached
+from services.storage import LocalStorage
+from test_formatting_engine import build_sample_document
+
+
+class CountingPool:
+    """Runs tasks inline and counts how often formatting really happened"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def run(self, fn, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return fn(*args)
+
+
+def test_equivalent_options_share_a_key(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    spelled_out = FormattingOptions(
+        paragraph=ParagraphFormattingOptions(spacing_after=8),
+        cleanup=CleanupOptions(),
+    )
+    implicit = FormattingOptions(paragraph=ParagraphFormattingOptions())
+
+    assert cache.key_for("abc", spelled_out) == cache.key_for("abc", implicit)
+    assert cache.key_for("abc", implicit) != cache.key_for("def", implicit)
+    assert cache.key_for("abc", implicit) != cache.key_for(
+        "abc", FormattingOptions(paragraph=ParagraphFormattingOptions(spacing_after=6))
+    )
+
+
+def test_repeat_and_concurrent_requests_format_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    file_id = document_processor.save_uploaded_file(source.read_bytes(), "source.docx")
+    options = FormattingOptions(text=TextFormattingOptions(font_size=11))
+    pool = CountingPool()
+
+    async def scenario():
+        # A double click: two identical requests at the same time
+        first, second = await asyncio.gather(
+            format_document_cached(file_id, options, pool),
+            format_document_cached(file_id, options, pool),
+        )
+        third = await format_document_cached(file_id, options, pool)
+        return first, second, third
+
+    outputs = asyncio.run(scenario())
+
+    assert pool.calls == 1
+    assert len(set(outputs)) == 3
+    contents = {(tmp_path / f"{output}_formatted.docx").read_bytes() for output in outputs}
+    assert len(contents) == 1
+    stats = document_processor.result_cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_lru_eviction_keeps_within_budget(tmp_path):
+    outputs = tmp_path / "outputs"
+    outputs.mkdir()
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    storage = LocalStorage(str(outputs))
+    for name in "abc":
+        path = outputs / f"{name}.docx"
+        path.write_bytes(b"x" * 100)
+        cache.put(name, storage, f"{name}.docx")
+        if name == "b":
+            # Touch "a" so "b" becomes the least recently used entry
+            assert cache.checkout("a", storage)
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.total_bytes == 200
+    assert cache.evictions == 1
+    assert not (tmp_path / "cache" / "b.docx").exists()
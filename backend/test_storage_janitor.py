@@ -0,0 +1,120 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from models.formatting_options import FormattingOptions, TextFormattingOptions
+from services.document_processor import DocumentProcessor, document_processor
+from services.result_cache import format_document_cached
+from services.storage_janitor import StorageJanitor, storage_janitor
+from test_formatting_engine import build_sample_document
+
+
+class InlinePool:
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args)
+
+
+def metadata_bytes(processor):
+    """Bytes of the registry database"""
+    index_path = Path(processor.registry.index_path)
+    return sum(path.stat().st_size for path in index_path.parent.glob(f"{index_path.name}*"))
+
+
+def age(processor, file_id, seconds):
+    """Pretend a file was last used ``seconds`` ago"""
+    with processor.registry.transaction() as db:
+        db.execute("UPDATE files SET accessed_at = ? WHERE file_id = ?", (time.time() - seconds, file_id))
+
+
+def test_expired_files_are_deleted_unless_in_use(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    janitor = StorageJanitor(processor, ttl=3600, max_bytes=0)
+    old, busy, fresh = (processor.save_uploaded_file(name.encode() * 100, f"{name}.docx")
+                        for name in ("old", "busy", "fresh"))
+    age(processor, old, 7200)
+    age(processor, busy, 7200)
+
+    with janitor.in_use(busy):
+        assert janitor.sweep() == {"ttl": 1, "quota": 0}
+
+    assert processor.get_file_path(old) is None
+    assert processor.get_file_path(busy) and processor.get_file_path(fresh)
+    assert janitor.skipped_in_use == 1 and janitor.evicted_bytes["ttl"] == 300
+    assert janitor.stats()["files"] == 2
+    assert 'docformatter_storage_evicted_files_total{reason="ttl"} 1' in janitor.render()
+
+    # Released, it goes on the next sweep
+    assert janitor.sweep()["ttl"] == 1
+
+
+def test_quota_evicts_least_recently_used_first(tmp_path):
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    first = processor.save_uploaded_file(b"a" * 1000, "first.docx")
+    alias = processor.save_uploaded_file(b"a" * 1000, "alias.docx")
+    second = processor.save_uploaded_file(b"b" * 1000, "second.docx")
+    third = processor.save_uploaded_file(b"c" * 1000, "third.docx")
+    for seconds, file_id in ((40, first), (30, second), (20, alias), (10, third)):
+        age(processor, file_id, seconds)
+    # Aliases share a blob, four uploads take 3000 bytes
+    assert processor.registry.usage() == (4, 3000)
+
+    # The registry database counts against the quota as well
+    janitor = StorageJanitor(processor, ttl=0, max_bytes=metadata_bytes(processor) + 1500)
+    assert janitor.sweep() == {"ttl": 0, "quota": 3}
+
+    # Deleting the first alias freed nothing, so the next two had to go as well
+    assert [processor.get_file_path(file_id) is not None for file_id in (first, second, alias, third)] == [
+        False, False, False, True,
+    ]
+    assert janitor.evicted_bytes["quota"] == 2000 and processor.registry.usage() == (1, 1000)
+
+
+def test_outputs_linked_to_the_cache_count_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path / "uploads"))
+    source = tmp_path / "source.docx"
+    build_sample_document(source)
+    file_id = document_processor.save_uploaded_file(source.read_bytes(), "source.docx")
+    options = FormattingOptions(text=TextFormattingOptions(font_size=11))
+    first = asyncio.run(format_document_cached(file_id, options, InlinePool()))
+    second = asyncio.run(format_document_cached(file_id, options, InlinePool()))
+    for seconds, evicted in ((30, first), (20, second), (10, file_id)):
+        age(document_processor, evicted, seconds)
+
+    # Both outputs and the cache entry are one file on disk
+    registry = document_processor.registry
+    upload_size, output_size = registry.get(file_id).size, registry.get(first).size
+    janitor = StorageJanitor(document_processor, ttl=0, max_bytes=0)
+    assert janitor.usage() == (3, metadata_bytes(document_processor) + upload_size + output_size)
+
+    # Deleting the first output frees nothing, deleting the second lets the cache entry go
+    janitor.max_bytes = metadata_bytes(document_processor) + upload_size
+    assert janitor.sweep() == {"ttl": 0, "quota": 2}
+    assert document_processor.get_file_path(file_id) is not None
+    assert document_processor.result_cache.files() == []
+    assert janitor.evicted_bytes["quota"] == output_size
+
+
+def test_source_of_running_format_is_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_processor, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(storage_janitor, "ttl", 1)
+    file_id = document_processor.save_uploaded_file(b"not a document", "source.docx")
+    age(document_processor, file_id, 60)
+
+    class SweepingPool:
+        """Sweeps while the job is on the worker, then fails it like a bad document would"""
+
+        async def run(self, fn, *args, **kwargs):
+            storage_janitor.sweep()
+            assert document_processor.get_file_path(file_id)
+            raise FileNotFoundError(file_id)
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(format_document_cached(file_id, FormattingOptions(), SweepingPool()))
+    assert storage_janitor.sweep()["ttl"] == 1
+    assert document_processor.get_file_path(file_id) is None
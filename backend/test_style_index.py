@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.document_processor import DocumentProcessor
+from services.style_index import StyleIndex
+from models.formatting_options import DocumentStructureOptions
+
+
+def add_style(doc, xml):
+    doc.styles.element.append(parse_xml(xml.replace('<w:style ', f'<w:style {nsdecls("w")} ', 1)))
+
+
+def build_document():
+    doc = Document()
+    add_style(doc, '<w:style w:type="paragraph" w:styleId="Chapter"><w:name w:val="Chapter"/>'
+                   '<w:aliases w:val="Kapitel,Heading 1"/></w:style>')
+    add_style(doc, '<w:style w:type="paragraph" w:styleId="Section"><w:name w:val="Section"/>'
+                   '<w:pPr><w:outlineLvl w:val="1"/></w:pPr></w:style>')
+    add_style(doc, '<w:style w:type="paragraph" w:styleId="SubSection"><w:name w:val="Sub section"/>'
+                   '<w:basedOn w:val="Section"/></w:style>')
+    add_style(doc, '<w:style w:type="paragraph" w:styleId="Quote2"><w:name w:val="Quote two"/>'
+                   '<w:pPr><w:outlineLvl w:val="9"/></w:pPr></w:style>')
+    return doc
+
+
+def test_levels_come_from_names_aliases_and_outline_levels():
+    processor = DocumentProcessor.__new__(DocumentProcessor)
+    _, style_mappings = processor._heading_settings(DocumentStructureOptions())
+    index = StyleIndex.for_document(build_document(), style_mappings)
+
+    assert index.entries["Heading2"].level == 2
+    assert index.entries["Title"].level == 1
+    assert index.entries["Chapter"].level == 1
+    assert index.entries["Section"].level == 2
+    assert index.entries["SubSection"].level == 2
+    assert index.entries["Quote2"].level is None
+    assert index.entries["Section"].toc_heading and not index.entries["Quote2"].toc_heading
+    assert index.heading_style_ids[3] == "Heading3"
+
+
+def test_unknown_and_missing_styles_resolve_to_the_default():
+    doc = build_document()
+    index = StyleIndex.for_document(doc, {})
+    plain = doc.add_paragraph("plain")
+    unknown = doc.add_paragraph("unknown")
+    unknown._p.style = "NoSuchStyle"
+    character = doc.add_paragraph("character style id")
+    character._p.style = doc.styles.add_style("Loud", WD_STYLE_TYPE.CHARACTER).style_id
+
+    for paragraph in (plain, unknown, character):
+        assert index.style(paragraph._p).style_id == "Normal"
+
+
+def test_toc_uses_headings_found_by_the_structure_stage(tmp_path):
+    doc = build_document()
+    doc.add_paragraph("Intro")
+    doc.add_paragraph("First chapter", style="Chapter")
+    doc.add_paragraph("A section", style="Section")
+    bold = doc.add_paragraph().add_run("Detected heading")
+    bold.bold = True
+    bold.font.size = 32 * 12700
+
+    processor = DocumentProcessor(upload_dir=str(tmp_path))
+    calls = []
+    insert = processor._insert_table_of_contents
+    processor._insert_table_of_contents = lambda *args: calls.append(args) or insert(*args)
+    processor._normalize_headings(doc, DocumentStructureOptions(normalize_headings=True, create_toc=True))
+
+    (_, first_text, headings), = calls
+    assert first_text == "Intro"
+    assert [paragraph.text for paragraph in headings] == ["A section", "Detected heading"]
+    assert doc.paragraphs[0].text == "Table of Contents"
+    paragraphs = {paragraph.text: paragraph for paragraph in doc.paragraphs}
+    assert paragraphs["Detected heading"]._p.pPr.find(qn("w:pStyle")).get(qn("w:val")) == "Heading1"
+    # Matched through its alias, so it gets the level 1 configuration
+    assert paragraphs["First chapter"].runs[0].font.size.pt == 24
@@ -0,0 +1,68 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+# Add current directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.worker_pool import WorkerPool, PoolSaturatedError
+
+
+def test_pool_rejects_when_queue_is_full():
+    release = threading.Event()
+
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=1, executor="thread")
+        running = asyncio.create_task(pool.run(release.wait))
+        queued = asyncio.create_task(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+
+        assert pool.stats()["running"] == 1
+        assert pool.stats()["queued"] == 1
+        with pytest.raises(PoolSaturatedError) as excinfo:
+            await pool.run(release.wait)
+        assert excinfo.value.retry_after >= 1
+
+        release.set()
+        assert await running is True
+        assert await queued is True
+        stats = pool.stats()
+        pool.shutdown()
+        return stats
+
+    try:
+        stats = asyncio.run(scenario())
+    finally:
+        release.set()
+    assert stats["completed"] == 2
+    assert stats["rejected"] == 1
+    assert stats["running"] == 0
+
+
+def test_cancelled_caller_keeps_slot_until_work_finishes():
+    release = threading.Event()
+
+    async def scenario():
+        pool = WorkerPool(workers=1, max_queue=0, executor="thread")
+        task = asyncio.create_task(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0.05)
+
+        # The thread is still busy, so the only worker is still taken
+        assert pool.stats()["running"] == 1
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(release.wait)
+
+        release.set()
+        await asyncio.sleep(0.05)
+        assert pool.stats()["running"] == 0
+        pool.shutdown()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
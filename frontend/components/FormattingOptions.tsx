@@ -409,6 +409,16 @@ export default function FormattingOptions({
             </label>
           </div>
         </div>
+
+        <label className="flex items-center space-x-2 cursor-pointer">
+          <input
+            type="checkbox"
+            className="checkbox"
+            checked={options.text?.apply_to_styles || false}
+            onChange={(e) => updateTextOption('apply_to_styles', e.target.checked || undefined)}
+          />
+          <span>Apply through document styles (smaller file)</span>
+        </label>
       </Section>
 
       {/* Paragraph Formatting */}
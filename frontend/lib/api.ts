@@ -14,6 +14,7 @@ export interface UploadResponse {
   filename: string;
   size: number;
   message: string;
+  content_hash?: string;
 }
 
 export interface FormatResponse {
@@ -23,12 +24,61 @@ export interface FormatResponse {
   message: string;
 }
 
+export interface SessionResponse {
+  session_id: string;
+  file_id: string;
+  result_file_id: string;
+  formatted_filename: string;
+  rerun_stages: string[];
+  reused_stages: string[];
+}
+
 export interface PreviewResponse {
   file_id: string;
   content: string;
   page_count: number;
 }
 
+export interface StatsResponse {
+  file_id: string;
+  pages: number;
+  pages_estimated: boolean;
+  words: number;
+  characters: number;
+  characters_with_spaces: number;
+  paragraphs: number;
+  tables: number;
+  images: number;
+  sections: number;
+}
+
+export interface DocumentInfo {
+  file_id: string;
+  kind: 'upload' | 'formatted';
+  filename: string | null;
+  size: number;
+  content_hash: string | null;
+  parent_id: string | null;
+  created_at: string;
+  accessed_at: string;
+}
+
+export interface DocumentListResponse {
+  total: number;
+  documents: DocumentInfo[];
+}
+
+export interface DocumentListFilters {
+  kind?: 'upload' | 'formatted';
+  parent_id?: string;
+  content_hash?: string;
+  q?: string;
+  created_after?: string;
+  created_before?: string;
+  limit?: number;
+  offset?: number;
+}
+
 export interface FormattingOptions {
   text?: {
     font_family?: string;
@@ -48,6 +98,7 @@ export interface FormattingOptions {
     character_spacing?: number;
     line_spacing?: string;
     text_alignment?: string;
+    apply_to_styles?: boolean;
   };
   paragraph?: {
     spacing_before?: number;
@@ -138,11 +189,63 @@ export const formatDocument = async (
   return response.data;
 };
 
+export const createSession = async (
+  fileId: string,
+  options: FormattingOptions
+): Promise<SessionResponse> => {
+  const response = await api.post<SessionResponse>('/api/sessions', {
+    file_id: fileId,
+    options,
+  });
+
+  return response.data;
+};
+
+export const updateSession = async (
+  sessionId: string,
+  options: FormattingOptions
+): Promise<SessionResponse> => {
+  const response = await api.put<SessionResponse>(`/api/sessions/${sessionId}`, { options });
+  return response.data;
+};
+
+export const closeSession = async (sessionId: string): Promise<void> => {
+  await api.delete(`/api/sessions/${sessionId}`);
+};
+
+export const formatDocumentsBatch = async (
+  fileIds: string[],
+  options: FormattingOptions
+): Promise<Blob> => {
+  const response = await api.post<Blob>(
+    '/api/format/batch',
+    {
+      file_ids: fileIds,
+      options,
+    },
+    { responseType: 'blob' }
+  );
+
+  return response.data;
+};
+
 export const getPreview = async (fileId: string): Promise<PreviewResponse> => {
   const response = await api.get<PreviewResponse>(`/api/preview/${fileId}`);
   return response.data;
 };
 
+export const getStats = async (fileId: string): Promise<StatsResponse> => {
+  const response = await api.get<StatsResponse>(`/api/document/${fileId}/stats`);
+  return response.data;
+};
+
+export const listDocuments = async (
+  filters: DocumentListFilters = {}
+): Promise<DocumentListResponse> => {
+  const response = await api.get<DocumentListResponse>('/api/documents', { params: filters });
+  return response.data;
+};
+
 export const downloadDocument = (fileId: string): string => {
   return `${API_BASE_URL}/api/download/${fileId}`;
 };